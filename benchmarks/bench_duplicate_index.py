@@ -0,0 +1,80 @@
+"""
+Time DuplicateIndex on synthetic leads, without the API in the way, to check
+that indexing and grouping stay linear in the number of leads.
+
+    python -m benchmarks.bench_duplicate_index --sizes 10000 100000 1000000
+
+Leads are generated on the fly, so only the index is held in memory. Time per
+lead should stay roughly flat as the org grows.
+"""
+import argparse
+import time
+
+from benchmarks.fake_close_api import SyntheticOrg
+from scripts.duplicate_index import DuplicateIndex
+
+ALL_FIELDS = ['lead_name', 'email', 'contact_name', 'phone', 'url']
+
+
+def bench(num_leads, duplicate_ratio, fields):
+    org = SyntheticOrg(num_leads=num_leads, duplicate_ratio=duplicate_ratio)
+    index = DuplicateIndex(fields)
+
+    index_time = 0.0
+    for i in range(num_leads):
+        lead = org.lead(i)
+        started = time.perf_counter()
+        index.add(lead)
+        index_time += time.perf_counter() - started
+
+    started = time.perf_counter()
+    groups = rows = 0
+    for field in fields:
+        for _key, dupes in index.duplicate_groups(field):
+            groups += 1
+            rows += len(dupes)
+    group_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    clusters = sum(1 for _ in index.clusters())
+    cluster_time = time.perf_counter() - started
+
+    return {
+        'leads': num_leads,
+        'index_s': index_time,
+        'group_s': group_time,
+        'cluster_s': cluster_time,
+        'groups': groups,
+        'rows': rows,
+        'clusters': clusters,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10000, 100000, 1000000]
+    )
+    parser.add_argument('--duplicate-ratio', type=float, default=0.3)
+    parser.add_argument(
+        '--fields', nargs='+', choices=ALL_FIELDS, default=ALL_FIELDS
+    )
+    args = parser.parse_args()
+
+    print(
+        f'{"leads":>9} {"index s":>9} {"group s":>9} {"cluster s":>9} '
+        f'{"us/lead":>8} {"groups":>8} {"rows":>9} {"clusters":>8}'
+    )
+    for size in args.sizes:
+        result = bench(size, args.duplicate_ratio, args.fields)
+        total = result['index_s'] + result['group_s'] + result['cluster_s']
+        print(
+            f'{size:>9} {result["index_s"]:>9.2f} {result["group_s"]:>9.2f} '
+            f'{result["cluster_s"]:>9.2f} {total / size * 1e6:>8.2f} '
+            f'{result["groups"]:>8} {result["rows"]:>9} '
+            f'{result["clusters"]:>8}'
+        )
+
+
+if __name__ == '__main__':
+    main()
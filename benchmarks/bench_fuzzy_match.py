@@ -0,0 +1,97 @@
+"""
+Time fuzzy lead name matching on synthetic company names, to check that the
+MinHash LSH blocking keeps the number of scored pairs (and the run time)
+roughly linear rather than quadratic in the number of names.
+
+    python -m benchmarks.bench_fuzzy_match --sizes 10000 100000 1000000
+
+Which leads belong to the same company comes from SyntheticOrg. Its company
+names are built from a few dozen words, which would make unrelated companies
+look alike, so each company gets a made-up name of random syllables instead.
+Duplicates differ in case and legal suffix, and a `--typo-ratio` share of
+them additionally get a character dropped, doubled or swapped so that some
+matches are only near-identical.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.fake_close_api import COMPANY_SUFFIXES, SyntheticOrg
+from scripts.fuzzy_match import DEFAULT_THRESHOLD, fuzzy_groups
+
+
+SYLLABLES = [
+    consonant + vowel
+    for consonant in 'bcdfghjklmnprstvwz'
+    for vowel in ['a', 'e', 'i', 'o', 'u', 'ai', 'ou']
+]
+
+
+def company_name(company):
+    rng = random.Random(f'company-{company}')
+    return ' '.join(
+        ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        for _ in range(rng.randint(1, 3))
+    )
+
+
+def add_typo(name, rng):
+    i = rng.randrange(len(name) - 1)
+    kind = rng.choice(['drop', 'double', 'swap'])
+    if kind == 'drop':
+        return name[:i] + name[i + 1 :]
+    if kind == 'double':
+        return name[:i] + name[i] + name[i:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2 :]
+
+
+def synthetic_names(num_leads, duplicate_ratio, typo_ratio, seed=0):
+    org = SyntheticOrg(num_leads=num_leads, duplicate_ratio=duplicate_ratio)
+    rng = random.Random(seed)
+    names = []
+    for i in range(num_leads):
+        company = org.lead_company(i)
+        name = company_name(company)
+        if i != company:
+            if rng.random() < 0.5:
+                name = name.upper()
+            if rng.random() < typo_ratio:
+                name = add_typo(name, rng)
+        suffix = rng.choice(COMPANY_SUFFIXES)
+        name = f'{name}{suffix}' if suffix.startswith(',') else f'{name} {suffix}'
+        names.append(name.strip().title() if i == company else name.strip())
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10000, 100000, 1000000]
+    )
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1)
+    parser.add_argument('--typo-ratio', type=float, default=0.5)
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD
+    )
+    args = parser.parse_args()
+
+    print(
+        f'{"names":>9} {"seconds":>8} {"us/name":>8} {"distinct":>9} '
+        f'{"pairs":>9} {"pairs/n":>8} {"all pairs":>14} {"groups":>7}'
+    )
+    for size in args.sizes:
+        names = synthetic_names(size, args.duplicate_ratio, args.typo_ratio)
+        stats = {}
+        started = time.perf_counter()
+        groups = fuzzy_groups(names, threshold=args.threshold, stats=stats)
+        elapsed = time.perf_counter() - started
+        print(
+            f'{size:>9} {elapsed:>8.2f} {elapsed / size * 1e6:>8.1f} '
+            f'{stats["distinct_names"]:>9} {stats["candidate_pairs"]:>9} '
+            f'{stats["candidate_pairs"] / size:>8.3f} '
+            f'{size * (size - 1) // 2:>14} {len(groups):>7}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,876 @@
+"""
+Local stand-in for the parts of the Close API used by the scripts in this
+repo, backed by a deterministic synthetic organization.
+
+Leads, activities and subscriptions are generated on demand from their index,
+so orgs with millions of leads don't need to be held in memory. Lead search
+understands `slice:k/n`, `created >=`/`updated >=` bounds, `sort:created` and
+`not "custom.<field>":*` for custom fields set through the API, plus `_skip`,
+`_limit` (up to `MAX_LIMIT`) and `_fields`; any other query terms match every
+lead.
+Latency, the cost of deep `_skip` offsets, rate limiting (with `RateLimit`
+headers) and random 429s are all configurable.
+
+Run it standalone and point CloseApiWrapper based scripts at it:
+
+    python -m benchmarks.fake_close_api --leads 100000 --port 8000
+    CLOSE_API_BASE_URL=http://127.0.0.1:8000/api/v1/ \\
+        python -m scripts.find_duplicate_leads -k fake
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = '/api/v1/'
+ORGANIZATION_ID = 'orga_fake'
+LEADS_EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+ACTIVITIES_EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+# Largest `_limit` honored by paginated endpoints, like the real API.
+MAX_LIMIT = 200
+
+COMPANY_WORDS = [
+    'acme', 'globex', 'initech', 'umbrella', 'hooli', 'stark', 'wayne',
+    'wonka', 'cyberdyne', 'tyrell', 'soylent', 'vandelay', 'pied', 'piper',
+    'dunder', 'mifflin', 'gringotts', 'oscorp', 'aperture', 'massive',
+    'dynamic', 'blue', 'north', 'summit', 'vertex', 'pioneer', 'quantum',
+]
+COMPANY_SUFFIXES = ['Inc.', 'Inc', ', Inc', 'LLC', 'Ltd', 'Co', 'Corp', '']
+FIRST_NAMES = [
+    'Ada', 'Alan', 'Grace', 'Linus', 'Margaret', 'Ken', 'Barbara', 'Dennis',
+    'Frances', 'Edsger', 'Radia', 'Donald', 'Katherine', 'John', 'Hedy',
+]
+LAST_NAMES = [
+    'Lovelace', 'Turing', 'Hopper', 'Torvalds', 'Hamilton', 'Thompson',
+    'Liskov', 'Ritchie', 'Allen', 'Dijkstra', 'Perlman', 'Knuth', 'Johnson',
+]
+LEAD_STATUSES = ['Potential', 'Bad Fit', 'Qualified', 'Customer']
+ACTIVITY_TYPES = [
+    'call', 'sms', 'email', 'note', 'created', 'task_completed',
+    'status_change/lead', 'status_change/opportunity',
+]
+
+
+def format_date(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def parse_date(value):
+    if len(value) == 10:
+        value += 'T00:00:00'
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def select_fields(obj, fields):
+    if not fields:
+        return obj
+    return {field: obj[field] for field in fields if field in obj}
+
+
+class SyntheticOrg:
+    """
+    Deterministic organization whose objects are derived from their index.
+
+    A `duplicate_ratio` share of leads reuse the company (and therefore the
+    contacts, emails, phones and URL) of an earlier lead, written with
+    slightly different casing and punctuation, so the dedupe scripts have
+    something to find. `leads_per_timestamp` leads share every `date_created`
+    timestamp to exercise cursor tie handling.
+    """
+
+    def __init__(
+        self,
+        num_leads=10000,
+        seed=0,
+        duplicate_ratio=0.1,
+        calls_per_lead=2,
+        sms_per_lead=1,
+        num_users=5,
+        recording_size=64 * 1024,
+        leads_per_timestamp=2,
+    ):
+        self.num_leads = num_leads
+        self.leads_per_timestamp = leads_per_timestamp
+        self.seed = seed
+        self.duplicate_ratio = duplicate_ratio
+        self.calls_per_lead = calls_per_lead
+        self.sms_per_lead = sms_per_lead
+        self.num_users = num_users
+        self.recording_size = recording_size
+
+        self.lock = threading.Lock()
+        self.updates = {}  # lead index -> (date_updated, changed fields)
+        self.deleted = set()
+        self.events = []
+
+    # Leads
+
+    def _rng(self, *parts):
+        # String seeds are hashed with SHA-512, so this is stable across
+        # processes regardless of PYTHONHASHSEED
+        return random.Random(':'.join(map(str, (self.seed,) + parts)))
+
+    def lead_company(self, i):
+        rng = self._rng('company', i)
+        if i and rng.random() < self.duplicate_ratio:
+            return rng.randrange(i)
+        return i
+
+    def company_name(self, company, variant):
+        rng = self._rng('company-name', company)
+        words = [rng.choice(COMPANY_WORDS) for _ in range(2)]
+        suffix = rng.choice(COMPANY_SUFFIXES)
+        if variant:
+            # Same company, typed differently
+            vrng = self._rng('variant', variant)
+            words = [w.upper() if vrng.random() < 0.5 else w for w in words]
+            suffix = vrng.choice(COMPANY_SUFFIXES)
+        name = ' '.join(w.capitalize() if w.islower() else w for w in words)
+        name = f'{name} {company}'
+        return f'{name}{suffix}' if suffix.startswith(',') else f'{name} {suffix}'.strip()
+
+    def lead_date_created(self, i):
+        return LEADS_EPOCH + timedelta(seconds=i // self.leads_per_timestamp)
+
+    def first_index_created_at(self, dt):
+        seconds = math.ceil((dt - LEADS_EPOCH).total_seconds())
+        return max(0, self.leads_per_timestamp * seconds)
+
+    def lead_date_updated(self, i):
+        if i in self.updates:
+            return self.updates[i][0]
+        return format_date(self.lead_date_created(i))
+
+    def lead_id(self, i):
+        return f'lead_{i:010d}'
+
+    def lead_index(self, lead_id):
+        match = re.fullmatch(r'lead_(\d+)', lead_id)
+        if not match or int(match[1]) >= self.num_leads:
+            return None
+        return int(match[1])
+
+    def contact(self, i, company, j):
+        rng = self._rng('contact', company, j)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        domain = f'{self.company_name(company, 0).split()[0].lower()}{company}.com'
+        digits = f'650{company % 10000000:07d}'
+        email = f'{first}.{last}@{domain}'
+        phone = f'+1{digits}'
+        if i != company:
+            # Duplicates spell the same email and phone differently
+            email = email.upper() if rng.random() < 0.5 else email
+            phone = f'+1 {digits[:3]}-{digits[3:6]}-{digits[6:]}'
+        return {
+            'id': f'cont_{i:010d}_{j}',
+            'lead_id': self.lead_id(i),
+            'name': f'{first} {last}',
+            'display_name': f'{first} {last}',
+            'title': '',
+            'emails': [{'type': 'office', 'email': email}],
+            'phones': [{'type': 'office', 'phone': phone}],
+        }
+
+    def lead(self, i):
+        company = self.lead_company(i)
+        name = self.company_name(company, i if i != company else 0)
+        rng = self._rng('lead', i)
+        date_created = format_date(self.lead_date_created(i))
+        lead = {
+            'id': self.lead_id(i),
+            'name': name,
+            'display_name': name,
+            'status_label': rng.choice(LEAD_STATUSES),
+            'date_created': date_created,
+            'date_updated': date_created,
+            'url': f'https://www.{name.split()[0].lower()}{company}.com/',
+            'contacts': [
+                self.contact(i, company, j)
+                for j in range(1 + self._rng('contacts', company).randrange(3))
+            ],
+            'addresses': [{'country': rng.choice(['US', 'GB', 'DE', 'FR'])}],
+            'opportunities': [],
+            'custom': {'Source CRM': 'fake', 'Company ID': str(company)},
+        }
+        if i in self.updates:
+            lead['date_updated'], changes = self.updates[i]
+            lead.update(changes)
+        return lead
+
+    def search_leads(self, query):
+        """Return the indices of leads matching `query`, ordered by creation."""
+        start = 0
+        step = 1
+        first = 0
+
+        match = re.search(r'slice:(\d+)/(\d+)', query)
+        if match:
+            step = int(match[2])
+            first = int(match[1]) - 1
+
+        match = re.search(r'created\s*(>=|>)\s*"([^"]+)"', query)
+        if match:
+            dt = parse_date(match[2])
+            start = self.first_index_created_at(dt)
+            if match[1] == '>':
+                while start < self.num_leads and self.lead_date_created(start) <= dt:
+                    start += 1
+
+        start = first + step * math.ceil(max(0, start - first) / step)
+        indices = range(start, self.num_leads, step)
+
+        match = re.search(r'updated\s*(>=|>)\s*"([^"]+)"', query)
+        if match:
+            since = format_date(parse_date(match[2]))
+            if match[1] == '>':
+                indices = [
+                    i for i in indices if self.lead_date_updated(i) > since
+                ]
+            else:
+                indices = [
+                    i for i in indices if self.lead_date_updated(i) >= since
+                ]
+
+        for field in re.findall(r'not\s+"custom\.([^"]+)":\*', query):
+            key = f'custom.{field}'
+            indices = [
+                i
+                for i in indices
+                if key not in self.updates.get(i, (None, {}))[1]
+            ]
+
+        if self.deleted:
+            indices = [i for i in indices if i not in self.deleted]
+        return indices
+
+    def update_lead(self, i, changes):
+        with self.lock:
+            now = format_date(datetime.now(timezone.utc))
+            previous = self.updates.get(i, (None, {}))[1]
+            self.updates[i] = (now, dict(previous, **changes))
+            self.record_event('lead', 'updated', self.lead_id(i))
+
+    def delete_lead(self, i, **extra):
+        with self.lock:
+            self.deleted.add(i)
+            self.record_event('lead', 'deleted', self.lead_id(i), **extra)
+
+    def merge_leads(self, source, destination):
+        """Like Close: the source is deleted and the destination updated."""
+        meta = {
+            'merge_source_lead_id': self.lead_id(source),
+            'merge_destination_lead_id': self.lead_id(destination),
+        }
+        self.delete_lead(source, meta=meta)
+        self.update_lead(destination, {})
+        with self.lock:
+            self.record_event(
+                'lead',
+                'merged',
+                self.lead_id(destination),
+                meta=meta,
+                data=self.lead(destination),
+            )
+
+    def record_event(self, object_type, action, object_id, **extra):
+        self.events.append(
+            dict(
+                {
+                    'id': f'ev_{len(self.events):010d}',
+                    'object_type': object_type,
+                    'object_id': object_id,
+                    'lead_id': object_id if object_type == 'lead' else None,
+                    'action': action,
+                    'date_created': format_date(datetime.now(timezone.utc)),
+                    'request_id': f'req_{len(self.events):010d}',
+                },
+                **extra,
+            )
+        )
+
+    # Activities
+
+    def activities_per_lead(self, activity_type):
+        if activity_type == 'call':
+            return self.calls_per_lead
+        if activity_type == 'sms':
+            return self.sms_per_lead
+        return 1
+
+    def activity_step(self, activity_type):
+        """Seconds between consecutive activities, spread over 30 days."""
+        total = self.num_leads * self.activities_per_lead(activity_type)
+        return timedelta(days=30).total_seconds() / max(total, 1)
+
+    def activity_date(self, activity_type, j):
+        return ACTIVITIES_EPOCH + timedelta(
+            seconds=j * self.activity_step(activity_type)
+        )
+
+    def activity(self, activity_type, j, base_url):
+        per_lead = self.activities_per_lead(activity_type)
+        i = j // per_lead
+        rng = self._rng(activity_type, j)
+        activity = {
+            'id': f'acti_{activity_type.replace("/", "_")}_{j:010d}',
+            '_type': activity_type,
+            'lead_id': self.lead_id(i),
+            'contact_id': f'cont_{i:010d}_0',
+            'user_id': f'user_{j % self.num_users}',
+            'user_name': f'User {j % self.num_users}',
+            'date_created': format_date(self.activity_date(activity_type, j)),
+        }
+        if activity_type == 'call':
+            answered = rng.random() < 0.7
+            voicemail = not answered and rng.random() < 0.5
+            activity.update(
+                {
+                    'duration': rng.randrange(1, 1800) if answered else 0,
+                    'voicemail_duration': rng.randrange(1, 60) if voicemail else 0,
+                    'disposition': 'answered' if answered else 'no-answer',
+                    'status': 'completed',
+                    'direction': rng.choice(['inbound', 'outbound']),
+                    'remote_phone': f'+1650{j % 10000000:07d}',
+                    'local_phone': '+18552567346',
+                    'source': 'Close.io',
+                    'updated_by_name': activity['user_name'],
+                    'cost': rng.randrange(0, 100),
+                    'recording_transcript': None,
+                    'recording_url': f'{base_url}recording/{activity["id"]}.mp3' if answered else None,
+                    'voicemail_url': f'{base_url}recording/{activity["id"]}.mp3' if voicemail else None,
+                }
+            )
+        elif activity_type == 'sms':
+            activity.update(
+                {
+                    'direction': rng.choice(['inbound', 'outbound']),
+                    'status': rng.choice(['inbox', 'sent']),
+                    'local_phone': '+18552567346',
+                    'remote_phone': f'+1650{j % 10000000:07d}',
+                    'text': 'Hello from the fake API',
+                    'cost': rng.randrange(0, 10),
+                    'source': 'Close.io',
+                }
+            )
+        return activity
+
+    def search_activities(self, activity_type, params):
+        per_lead = self.activities_per_lead(activity_type)
+        total = self.num_leads * per_lead
+        step = self.activity_step(activity_type)
+        start, stop = 0, total
+
+        lead_id = params.get('lead_id')
+        if lead_id:
+            i = self.lead_index(lead_id)
+            if i is None:
+                return range(0)
+            start, stop = i * per_lead, (i + 1) * per_lead
+
+        for suffix in ('gte', 'gt'):
+            value = params.get(f'date_created__{suffix}')
+            if value:
+                offset = (parse_date(value) - ACTIVITIES_EPOCH).total_seconds()
+                j = max(0, math.ceil(offset / step))
+                if suffix == 'gt' and j * step <= offset:
+                    j += 1
+                start = max(start, j)
+        for suffix in ('lte', 'lt'):
+            value = params.get(f'date_created__{suffix}')
+            if value:
+                offset = (parse_date(value) - ACTIVITIES_EPOCH).total_seconds()
+                j = math.floor(offset / step) + 1
+                if suffix == 'lt' and (j - 1) * step >= offset:
+                    j -= 1
+                stop = min(stop, max(j, 0))
+
+        indices = range(start, max(start, stop))
+        user_id = params.get('user_id')
+        if user_id:
+            user = int(user_id.split('_')[-1])
+            indices = [j for j in indices if j % self.num_users == user]
+        return indices
+
+    def recording(self, activity_id):
+        rng = self._rng('recording', activity_id)
+        pattern = bytes(rng.randrange(256) for _ in range(256))
+        repeats = self.recording_size // len(pattern) + 1
+        return (pattern * repeats)[: self.recording_size]
+
+    # Organization
+
+    def organization(self):
+        memberships = [
+            {
+                'user_id': f'user_{u}',
+                'user_email': f'user{u}@example.com',
+                'user_full_name': f'User {u}',
+            }
+            for u in range(self.num_users)
+        ]
+        statuses = [
+            {'id': f'stat_{n}', 'label': label}
+            for n, label in enumerate(LEAD_STATUSES)
+        ]
+        opportunity_statuses = [
+            {'id': 'stat_opp_active', 'label': 'Active', 'type': 'active'},
+            {'id': 'stat_opp_won', 'label': 'Won', 'type': 'won'},
+            {'id': 'stat_opp_lost', 'label': 'Lost', 'type': 'lost'},
+        ]
+        return {
+            'id': ORGANIZATION_ID,
+            'name': f'Fake Org {self.num_leads}',
+            'memberships': memberships,
+            'inactive_memberships': [],
+            'lead_statuses': statuses,
+            'opportunity_statuses': opportunity_statuses,
+            'pipelines': [
+                {
+                    'id': 'pipe_fake',
+                    'name': 'Sales',
+                    'statuses': opportunity_statuses,
+                }
+            ],
+        }
+
+
+class FakeCloseApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body, status=200, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def _handle(self, method):
+        # The body is read before any early response, since on a keep-alive
+        # connection an unread body would be parsed as the next request
+        request_body = self._read_body()
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path == '/_fake/stats/':
+            return self._send_json(self.fake.stats())
+        if url.path.startswith(API_PREFIX + 'recording/'):
+            return self._send_recording(url.path)
+        if not url.path.startswith(API_PREFIX):
+            return self._send_json({'error': 'Not found'}, 404)
+
+        endpoint = url.path[len(API_PREFIX):].strip('/')
+        limited = self.fake.check_rate_limit(endpoint)
+        if limited:
+            return self._send_json(
+                {'error': 'Rate limit exceeded'}, 429, headers=limited
+            )
+
+        self.fake.sleep(int(params.get('_skip') or 0))
+        data = (
+            json.loads(request_body or b'{}')
+            if method in ('post', 'put')
+            else None
+        )
+        try:
+            status, body = self.fake.route(method, endpoint, params, data)
+        except Exception as e:
+            # Surface bugs in the fake as 500s rather than dropped connections
+            status, body = 500, {'error': repr(e)}
+        self._send_json(
+            body, status, headers=self.fake.rate_limit_headers(endpoint)
+        )
+
+    def _send_recording(self, path):
+        self.fake.count_request('recording')
+        activity_id = path.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        content = self.fake.org.recording(activity_id)
+        start, end, status = 0, len(content) - 1, 200
+
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match[1])
+            end = min(int(match[2]) if match[2] else end, end)
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header(
+                'Content-Range', f'bytes {start}-{end}/{len(content)}'
+            )
+        self.end_headers()
+        self.wfile.write(content[start : end + 1])
+
+    def do_GET(self):
+        self._handle('get')
+
+    def do_POST(self):
+        self._handle('post')
+
+    def do_PUT(self):
+        self._handle('put')
+
+    def do_DELETE(self):
+        self._handle('delete')
+
+
+class FakeCloseApi:
+    """
+    Routes requests to a `SyntheticOrg` and applies the configured latency,
+    rate limiting and 429 injection.
+    """
+
+    def __init__(
+        self,
+        org,
+        latency=0.0,
+        skip_latency=0.0,
+        rate_limit=None,
+        rate_window=1.0,
+        error_rate_429=0.0,
+        seed=0,
+        max_limit=MAX_LIMIT,
+    ):
+        self.org = org
+        self.max_limit = max_limit
+        self.latency = latency
+        self.skip_latency = skip_latency  # seconds per 1000 skipped items
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.error_rate_429 = error_rate_429
+        self.base_url = None
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._windows = {}
+        self.requests = Counter()
+        self.rate_limited = Counter()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': dict(self.requests),
+                'total_requests': sum(self.requests.values()),
+                'rate_limited': sum(self.rate_limited.values()),
+            }
+
+    def count_request(self, group):
+        with self._lock:
+            self.requests[group] += 1
+
+    def sleep(self, skip):
+        delay = self.latency + self.skip_latency * skip / 1000
+        if delay:
+            time.sleep(delay)
+
+    def _window(self, group):
+        now = time.monotonic()
+        started, count = self._windows.get(group, (now, 0))
+        if now - started >= self.rate_window:
+            started, count = now, 0
+        return now, started, count
+
+    def check_rate_limit(self, endpoint):
+        """Count the request and return 429 headers if it should be rejected."""
+        group = endpoint.split('/')[0]
+        with self._lock:
+            self.requests[group] += 1
+            now, started, count = self._window(group)
+            reset = max(self.rate_window - (now - started), 0.001)
+            injected = self._random.random() < self.error_rate_429
+            if injected or (self.rate_limit and count >= self.rate_limit):
+                self.rate_limited[group] += 1
+                return {
+                    'Retry-After': f'{reset:.3f}',
+                    'RateLimit': f'limit={self.rate_limit or 0}, remaining=0, reset={reset:.3f}',
+                }
+            self._windows[group] = (started, count + 1)
+
+    def rate_limit_headers(self, endpoint):
+        if not self.rate_limit:
+            return {}
+        group = endpoint.split('/')[0]
+        with self._lock:
+            now, started, count = self._window(group)
+        reset = max(self.rate_window - (now - started), 0.001)
+        remaining = max(self.rate_limit - count, 0)
+        return {
+            'RateLimit': f'limit={self.rate_limit}, remaining={remaining}, reset={reset:.3f}'
+        }
+
+    def _page(self, items, params, render):
+        skip = int(params.get('_skip') or 0)
+        limit = min(int(params.get('_limit', 100)), self.max_limit)
+        fields = [f for f in params.get('_fields', '').split(',') if f]
+        page = items[skip : skip + limit] if limit else []
+        return {
+            'data': [select_fields(render(i), fields) for i in page],
+            'has_more': skip + len(page) < len(items),
+            'total_results': len(items),
+        }
+
+    def route(self, method, endpoint, params, data):
+        org = self.org
+        parts = endpoint.split('/')
+
+        if endpoint == 'me':
+            organization = org.organization()
+            return 200, {
+                'id': 'user_0',
+                'organizations': [
+                    {'id': ORGANIZATION_ID, 'name': organization['name']}
+                ],
+            }
+        if endpoint == 'api_key':
+            return 200, {'data': [{'organization_id': ORGANIZATION_ID}]}
+        if parts[0] == 'organization':
+            fields = [f for f in params.get('_fields', '').split(',') if f]
+            return 200, select_fields(org.organization(), fields)
+
+        if endpoint == 'lead' and method == 'get':
+            indices = org.search_leads(params.get('query', ''))
+            return 200, self._page(indices, params, org.lead)
+        if endpoint == 'lead/merge' and method == 'post':
+            source = org.lead_index(data.get('source', ''))
+            destination = org.lead_index(data.get('destination', ''))
+            if source is None or destination is None or source in org.deleted:
+                return 400, {'errors': ['Invalid source or destination lead']}
+            org.merge_leads(source, destination)
+            return 200, {}
+        if parts[0] == 'lead' and len(parts) == 2:
+            i = org.lead_index(parts[1])
+            if i is None or i in org.deleted:
+                return 404, {'error': 'Lead not found'}
+            if method == 'put':
+                org.update_lead(i, data)
+            elif method == 'delete':
+                org.delete_lead(i)
+                return 200, {}
+            return 200, select_fields(
+                org.lead(i),
+                [f for f in params.get('_fields', '').split(',') if f],
+            )
+
+        if parts[0] == 'activity' and len(parts) > 1:
+            activity_type = '/'.join(parts[1:])
+            if activity_type not in ACTIVITY_TYPES:
+                return 404, {'error': 'Unknown activity type'}
+            indices = org.search_activities(activity_type, params)
+            return 200, self._page(
+                indices,
+                params,
+                lambda j: org.activity(activity_type, j, self.base_url),
+            )
+
+        if endpoint == 'event':
+            return 200, self._events(params)
+
+        if endpoint == 'sequence':
+            sequences = [
+                {'id': f'seq_{n}', 'name': f'Sequence {n}'} for n in range(3)
+            ]
+            return 200, {'data': sequences, 'has_more': False}
+        if endpoint == 'sequence_subscription':
+            i = org.lead_index(params.get('lead_id', '')) or 0
+            subscriptions = [
+                {
+                    'id': f'sub_{i:010d}',
+                    'sequence_id': f'seq_{i % 3}',
+                    'contact_id': f'cont_{i:010d}_0',
+                    'contact_email': 'contact@example.com',
+                    'sender_account_id': 'emailacct_fake',
+                    'sender_email': 'user0@example.com',
+                    'sender_name': 'User 0',
+                    'status': 'active',
+                    'pause_reason': None,
+                }
+            ] if i % 4 == 0 else []
+            return 200, {'data': subscriptions, 'has_more': False}
+
+        if parts[0] == 'custom_field_schema':
+            return 200, {'fields': []}
+        if parts[0] == 'custom_field':
+            fields = [
+                {'id': 'cf_source_crm', 'name': 'Source CRM', 'type': 'text'},
+                {'id': 'cf_company_id', 'name': 'Company ID', 'type': 'text'},
+            ]
+            return 200, {
+                'data': fields if parts[-1] == 'lead' else [],
+                'has_more': False,
+            }
+
+        if method == 'get':
+            # Settings endpoints (templates, roles, webhooks, ...) are empty
+            return 200, {'data': [], 'has_more': False}
+        if method in ('post', 'put'):
+            return 200, dict(data or {}, id=data.get('id') or f'{parts[0]}_fake')
+        return 200, {}
+
+    def _events(self, params):
+        events = self.org.events
+        filters = {
+            key: params[key]
+            for key in ('object_type', 'action', 'lead_id', 'request_id')
+            if params.get(key)
+        }
+        since = params.get('date_updated__gte') or params.get('date_created__gte')
+        matching = [
+            event
+            for event in events
+            if all(event.get(k) == v for k, v in filters.items())
+            and (not since or event['date_created'] >= format_date(parse_date(since)))
+        ]
+        cursor = int(params.get('_cursor') or 0)
+        limit = int(params.get('_limit', 50))
+        page = matching[cursor : cursor + limit]
+        next_cursor = cursor + limit if cursor + limit < len(matching) else None
+        return {
+            'data': page,
+            'cursor_next': str(next_cursor) if next_cursor else None,
+        }
+
+
+class FakeCloseApiServer:
+    """
+    Threaded HTTP server for a `FakeCloseApi`, usable as a context manager:
+
+        with FakeCloseApiServer(FakeCloseApi(SyntheticOrg(1000))) as server:
+            os.environ['CLOSE_API_BASE_URL'] = server.base_url
+            ...
+    """
+
+    def __init__(self, fake, host='127.0.0.1', port=0):
+        self.fake = fake
+        self.httpd = ThreadingHTTPServer((host, port), FakeCloseApiHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = fake
+        host, port = self.httpd.server_address[:2]
+        self.base_url = f'http://{host}:{port}{API_PREFIX}'
+        fake.base_url = self.base_url
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve a synthetic Close organization for offline benchmarks and tests'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--leads', type=int, default=10000, help='Number of synthetic leads')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--duplicate-ratio',
+        type=float,
+        default=0.1,
+        help='Share of leads that duplicate an earlier lead',
+    )
+    parser.add_argument('--calls-per-lead', type=int, default=2)
+    parser.add_argument('--sms-per-lead', type=int, default=1)
+    parser.add_argument(
+        '--recording-size',
+        type=int,
+        default=64 * 1024,
+        help='Size in bytes of every call recording',
+    )
+    parser.add_argument(
+        '--leads-per-timestamp',
+        type=int,
+        default=2,
+        help='Number of leads sharing each date_created timestamp',
+    )
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument(
+        '--skip-latency',
+        type=float,
+        default=0.0,
+        help='Seconds added per 1000 items skipped with _skip',
+    )
+    parser.add_argument(
+        '--rate-limit',
+        type=int,
+        default=None,
+        help='Requests allowed per endpoint group per window',
+    )
+    parser.add_argument('--rate-window', type=float, default=1.0, help='Rate limit window in seconds')
+    parser.add_argument(
+        '--error-rate-429',
+        type=float,
+        default=0.0,
+        help='Probability of answering any request with a 429',
+    )
+    args = parser.parse_args()
+
+    org = SyntheticOrg(
+        num_leads=args.leads,
+        seed=args.seed,
+        duplicate_ratio=args.duplicate_ratio,
+        calls_per_lead=args.calls_per_lead,
+        sms_per_lead=args.sms_per_lead,
+        recording_size=args.recording_size,
+        leads_per_timestamp=args.leads_per_timestamp,
+    )
+    fake = FakeCloseApi(
+        org,
+        latency=args.latency,
+        skip_latency=args.skip_latency,
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+        error_rate_429=args.error_rate_429,
+        seed=args.seed,
+    )
+    server = FakeCloseApiServer(fake, args.host, args.port)
+    print(f'Serving {args.leads} synthetic leads at {server.base_url}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Run the scripts against synthetic orgs served by fake_close_api.py and record
+wall time, API calls issued, requests/sec and peak memory for each of them.
+
+    python -m benchmarks.run_benchmarks --sizes 10000 100000
+    python -m benchmarks.run_benchmarks --compare results/abc123.json results/def456.json
+
+Results are written to `benchmarks/results/<commit>.json`, so runs from
+different commits can be compared side by side.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+# Script module -> arguments. `{output_dir}` is replaced with a scratch
+# directory for scripts that write files somewhere other than the cwd.
+SCENARIOS = {
+    'find_duplicate_leads': ['-k', 'fake', '--field', 'all'],
+    'find_contact_duplicates_on_single_lead': ['-k', 'fake'],
+    'bulk_update_address_countries': ['US', 'CA', '-k', 'fake'],
+    'export_calls': ['-k', 'fake', '-s', '2023-01-01', '-e', '2023-01-08'],
+    'export_sms': ['-k', 'fake', '-s', '2023-01-01', '-e', '2023-01-08'],
+    'export_sequence_subscriptions_public': ['-k', 'fake'],
+    'export_activities_to_json': [
+        '-k', 'fake', '-s', '2023-01-01', '-e', '2023-01-08', '-t', 'note',
+    ],
+    'bulk_download_call_recordings': [
+        '-k', 'fake', '-s', '2023-01-01', '-e', '2023-01-03',
+        '-f', '{output_dir}',
+    ],
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def fetch_stats(stats_url):
+    with urllib.request.urlopen(stats_url) as resp:
+        return json.load(resp)
+
+
+@contextmanager
+def fake_api(num_leads, port, server_args):
+    """Run fake_close_api.py in its own process so it isn't measured."""
+    proc = subprocess.Popen(
+        [
+            sys.executable, '-m', 'benchmarks.fake_close_api',
+            '--leads', str(num_leads), '--port', str(port),
+        ]
+        + server_args,
+        cwd=REPO_ROOT,
+        stdout=subprocess.DEVNULL,
+    )
+    stats_url = f'http://127.0.0.1:{port}/_fake/stats/'
+    try:
+        for _ in range(100):
+            try:
+                fetch_stats(stats_url)
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError('Fake Close API did not start')
+        yield f'http://127.0.0.1:{port}/api/v1/', stats_url
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def run_script(script, script_args, base_url, timeout):
+    """Run one script and return its exit code, wall time and peak RSS."""
+    with tempfile.TemporaryDirectory() as workdir:
+        output_dir = os.path.join(workdir, 'output')
+        os.mkdir(output_dir)
+        env = dict(
+            os.environ, CLOSE_API_BASE_URL=base_url, PYTHONPATH=REPO_ROOT
+        )
+        args = [arg.format(output_dir=output_dir) for arg in script_args]
+
+        # stderr goes to a file rather than a pipe so a chatty script can't
+        # block on a full pipe while we're polling for it to exit
+        stderr_path = os.path.join(workdir, 'stderr.log')
+        started = time.perf_counter()
+        with open(stderr_path, 'wb') as stderr_file:
+            proc = subprocess.Popen(
+                [sys.executable, '-m', f'scripts.{script}'] + args,
+                cwd=workdir,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=stderr_file,
+            )
+        deadline = started + timeout
+        while True:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.perf_counter() > deadline:
+                proc.kill()
+                pid, status, rusage = os.wait4(proc.pid, 0)
+                break
+            time.sleep(0.01)
+        wall_time = time.perf_counter() - started
+        if os.WIFEXITED(status):
+            proc.returncode = os.WEXITSTATUS(status)
+        else:
+            proc.returncode = -os.WTERMSIG(status)
+        with open(stderr_path, encoding='utf-8', errors='replace') as f:
+            stderr = f.read()
+
+    return {
+        'exit_code': proc.returncode,
+        'wall_time': wall_time,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': rusage.ru_maxrss
+        / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        'stderr_tail': stderr[-2000:] if proc.returncode else '',
+    }
+
+
+def run(args):
+    results = {'commit': git_commit(), 'runs': []}
+    scripts = args.scripts or list(SCENARIOS)
+
+    for size in args.sizes:
+        with fake_api(size, args.port, args.server_args) as (base_url, stats_url):
+            for script in scripts:
+                before = fetch_stats(stats_url)['total_requests']
+                result = run_script(
+                    script, SCENARIOS[script], base_url, args.timeout
+                )
+                api_calls = fetch_stats(stats_url)['total_requests'] - before
+                result.update(
+                    {
+                        'script': script,
+                        'leads': size,
+                        'api_calls': api_calls,
+                        'requests_per_sec': api_calls / result['wall_time'],
+                    }
+                )
+                results['runs'].append(result)
+                status = 'ok' if result['exit_code'] == 0 else 'FAILED'
+                print(
+                    f"{script} @ {size} leads: {result['wall_time']:.1f}s, "
+                    f"{api_calls} calls, {result['requests_per_sec']:.0f} req/s, "
+                    f"{result['peak_rss_mb']:.0f} MB [{status}]"
+                )
+                if result['exit_code']:
+                    print(result['stderr_tail'], file=sys.stderr)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{results['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved to `{output}`')
+    print_table([results])
+
+
+def print_table(result_sets):
+    """Print one row per script and org size, one column group per result set."""
+    runs = {}
+    for n, results in enumerate(result_sets):
+        for run in results['runs']:
+            runs.setdefault((run['script'], run['leads']), {})[n] = run
+
+    header = ['script', 'leads']
+    for results in result_sets:
+        commit = results['commit']
+        header += [
+            f'{commit} wall s', f'{commit} us/lead', f'{commit} calls',
+            f'{commit} req/s', f'{commit} RSS MB',
+        ]
+    if len(result_sets) == 2:
+        header += ['wall delta', 'RSS delta']
+
+    rows = [header]
+    for (script, leads), by_set in sorted(runs.items()):
+        row = [script, str(leads)]
+        for n in range(len(result_sets)):
+            run = by_set.get(n)
+            if not run:
+                row += ['-'] * 5
+                continue
+            failed = '!' if run['exit_code'] else ''
+            row += [
+                f"{run['wall_time']:.2f}{failed}",
+                f"{run['wall_time'] / leads * 1e6:.1f}",
+                str(run['api_calls']),
+                f"{run['requests_per_sec']:.0f}",
+                f"{run['peak_rss_mb']:.0f}",
+            ]
+        if len(result_sets) == 2 and len(by_set) == 2:
+            old, new = by_set[0], by_set[1]
+            row += [
+                f"{(new['wall_time'] / old['wall_time'] - 1) * 100:+.0f}%",
+                f"{(new['peak_rss_mb'] / old['peak_rss_mb'] - 1) * 100:+.0f}%",
+            ]
+        rows.append(row)
+
+    widths = [max(len(row[i]) for row in rows if i < len(row)) for i in range(len(header))]
+    for row in rows:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the scripts against synthetic orgs served by fake_close_api.py'
+    )
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=DEFAULT_SIZES,
+        help='Synthetic org sizes (number of leads) to benchmark',
+    )
+    parser.add_argument(
+        '--scripts',
+        nargs='+',
+        choices=sorted(SCENARIOS),
+        help='Only benchmark these scripts',
+    )
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=3600,
+        help='Seconds after which a script run is killed',
+    )
+    parser.add_argument(
+        '--server-args',
+        nargs=argparse.REMAINDER,
+        default=[],
+        help='Extra arguments for fake_close_api.py, e.g. --latency 0.02 --rate-limit 40',
+    )
+    parser.add_argument('--output', '-o', help='Where to save the results JSON')
+    parser.add_argument(
+        '--compare',
+        nargs='+',
+        metavar='RESULTS_JSON',
+        help='Print a comparison table of saved results instead of running',
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        result_sets = []
+        for path in args.compare:
+            with open(path) as f:
+                result_sets.append(json.load(f))
+        print_table(result_sets)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from random import uniform
+
+import aiohttp
+from closeio_api import APIError, ValidationError, __version__
+from closeio_api.utils import local_tz_offset
+
+from scripts.CloseApiWrapper import BASE_URL_ENV_VAR, RateLimitScheduler
+
+DEFAULT_RATE_LIMIT_DELAY = 2  # Seconds
+
+
+class _BufferedResponse:
+    """
+    Minimal stand-in for a `requests.Response` built from an already read
+    aiohttp response, so that `APIError` and `ValidationError` from
+    closeio_api can be raised the same way the synchronous client does.
+    """
+
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncCloseApiWrapper:
+    """
+    asyncio counterpart of CloseApiWrapper. All requests go through a single
+    aiohttp session with a bounded keep-alive connection pool, so thousands of
+    coroutines can share a handful of TCP connections without gevent monkey
+    patching the whole process.
+
+    Usage:
+
+        async with AsyncCloseApiWrapper(api_key, max_connections=20) as api:
+            async for lead in api.iter_items('lead', params={'query': '*'}):
+                ...
+    """
+
+    def __init__(
+        self,
+        api_key=None,
+        tz_offset=None,
+        max_retries=5,
+        development=False,
+        max_connections=20,
+        timeout=None,
+    ):
+        if development:
+            self.base_url = 'https://local-api.close.com:5001/api/v1/'
+            self.verify = False
+        else:
+            self.base_url = 'https://api.close.com/api/v1/'
+            self.verify = True
+        if os.environ.get(BASE_URL_ENV_VAR):
+            self.base_url = os.environ[BASE_URL_ENV_VAR]
+
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.tz_offset = str(tz_offset or local_tz_offset())
+        self.timeout = timeout
+        self._session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self._session is not None:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            keepalive_timeout=30,
+            ssl=None if self.verify else False,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            auth=aiohttp.BasicAuth(self.api_key, '') if self.api_key else None,
+            headers={
+                'User-Agent': f'Close/{__version__} python (aiohttp/{aiohttp.__version__})',
+                'X-TZ-Offset': self.tz_offset,
+            },
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _dispatch(self, method_name, endpoint, params=None, data=None):
+        """
+        Send a request and return the decoded JSON body. Retries follow the
+        same rules as `closeio_api.API._dispatch`: 429s sleep for the
+        rate-limit window, 503s (and 502/504 on GETs) back off with jitter.
+        """
+        await self.open()
+        url = self.base_url + endpoint + '/'
+
+        response = None
+        for retry_count in range(self.max_retries):
+            try:
+                async with self._session.request(
+                    method_name, url, params=params, json=data
+                ) as resp:
+                    response = _BufferedResponse(
+                        resp.status, resp.headers, await resp.text()
+                    )
+            except aiohttp.ClientConnectionError:
+                if retry_count + 1 == self.max_retries:
+                    raise
+                await asyncio.sleep(2)
+                continue
+
+            if response.status_code == 429:
+                sleep_time = self._get_rate_limit_sleep_time(response)
+                logging.debug(
+                    'Request was rate limited, sleeping %d seconds', sleep_time
+                )
+                await asyncio.sleep(sleep_time)
+                continue
+            elif response.status_code == 503 or (
+                method_name == 'get' and response.status_code in (502, 504)
+            ):
+                sleep_time = self._get_randomized_sleep_time_for_error(
+                    response.status_code, retry_count
+                )
+                logging.debug(
+                    'Request hit a %s, sleeping for %s seconds',
+                    response.status_code,
+                    sleep_time,
+                )
+                await asyncio.sleep(sleep_time)
+                continue
+
+            break
+
+        if response is None:
+            # No attempt was made at all
+            raise ValueError(
+                f'max_retries must be at least 1, not {self.max_retries}'
+            )
+        if response.ok:
+            if response.status_code == 204:
+                return ''
+            return response.json()
+        elif response.status_code == 400:
+            raise ValidationError(response)
+        else:
+            raise APIError(response)
+
+    def _get_rate_limit_sleep_time(self, response):
+        # The combined `RateLimit: limit=.., remaining=.., reset=..` header
+        # comes first, like in closeio_api
+        rate_limit = RateLimitScheduler.parse_headers(response.headers)
+        if rate_limit:
+            return rate_limit[2]
+        with contextlib.suppress(KeyError, ValueError):
+            return float(response.headers["Retry-After"])
+        with contextlib.suppress(KeyError, ValueError):
+            return float(response.headers["RateLimit-Reset"])
+
+        logging.error('Error parsing rate limiting response')
+        return DEFAULT_RATE_LIMIT_DELAY
+
+    def _get_randomized_sleep_time_for_error(self, status_code, retries):
+        if status_code == 503:
+            return uniform(2, 4) * (retries + 1)
+        elif status_code in (502, 504):
+            return uniform(60, 90) * (retries + 1)
+
+        return DEFAULT_RATE_LIMIT_DELAY
+
+    async def get(self, endpoint, params=None):
+        return await self._dispatch('get', endpoint, params=params)
+
+    async def post(self, endpoint, data):
+        return await self._dispatch('post', endpoint, data=data)
+
+    async def put(self, endpoint, data):
+        return await self._dispatch('put', endpoint, data=data)
+
+    async def delete(self, endpoint):
+        return await self._dispatch('delete', endpoint)
+
+    async def iter_items(self, url, params=None):
+        """Yield every item of a paginated resource, one page at a time."""
+        params = dict(params or {})
+
+        has_more = True
+        offset = 0
+        while has_more:
+            params["_skip"] = offset
+            resp = await self.get(url, params=params)
+            for item in resp['data']:
+                yield item
+            offset += len(resp["data"])
+            has_more = resp["has_more"]
+
+    async def get_all_items(self, url, params=None):
+        return [item async for item in self.iter_items(url, params=params)]
@@ -1,4 +1,289 @@
-from closeio_api import Client
+import contextlib
+import copy
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+from closeio_api import APIError, Client, ValidationError
+from gevent.pool import Pool
+
+from scripts.request_metrics import RequestInfo
+
+# Environment variable overriding the API base URL.
+BASE_URL_ENV_VAR = 'CLOSE_API_BASE_URL'
+
+# Fraction of the advertised rate limit we aim for, leaving headroom for
+# requests that are already in flight when the headers are read.
+RATE_LIMIT_SAFETY_FACTOR = 0.9
+
+# Number of slices fetched in parallel by the lead slice helpers.
+DEFAULT_CONCURRENCY = 8
+
+# Target number of leads per slice, and how far above it a slice may come
+# back before the planner splits it in two.
+DEFAULT_SLICE_SIZE = 1000
+SLICE_RESPLIT_FACTOR = 1.5
+# How many times a single slice may be halved before it's accepted as is.
+MAX_SLICE_SPLITS = 4
+
+# Target number of items per date window. Windows holding more are halved
+# until they fit, but never below MIN_DATE_WINDOW.
+DEFAULT_WINDOW_SIZE = 1000
+MIN_DATE_WINDOW = timedelta(minutes=1)
+
+# Format of the date filters sent for date windows.
+DATE_WINDOW_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# How far back the event log can be read. Close keeps about 30 days of
+# events; a day is left as margin for runs that take a while.
+EVENT_LOG_RETENTION = timedelta(days=29)
+
+# Page size used by the cursor based lead iterator.
+DEFAULT_PAGE_SIZE = 100
+# Largest `_limit` the lead search returns; larger limits are cut down to it.
+MAX_PAGE_SIZE = 200
+
+# Seconds org level metadata (memberships, statuses, pipelines, custom field
+# schemas, custom activity types) is reused before it's fetched again.
+METADATA_CACHE_TTL = 300
+
+# Organization fields kept in the metadata cache.
+ORGANIZATION_FIELDS = (
+    'id,name,memberships,inactive_memberships,lead_statuses,pipelines'
+)
+
+# First path segment of a write -> metadata cache namespaces it makes stale.
+METADATA_WRITE_INVALIDATES = {
+    'organization': ('organization',),
+    'status': ('organization',),
+    'pipeline': ('organization',),
+    'membership': ('organization',),
+    'custom_field': ('custom_field_schema',),
+    'custom_field_schema': ('custom_field_schema',),
+    'custom_activity': ('custom_activity', 'custom_field_schema'),
+}
+
+
+class TokenBucket:
+    """
+    Token bucket pacing every caller that shares it. The refill rate is
+    derived from the `RateLimit` response headers (`remaining` requests over
+    `reset` seconds), so concurrent greenlets collectively stay just under
+    the API's limit instead of bursting into 429s and backing off blindly.
+    Until the first headers are seen the bucket does not throttle at all.
+    """
+
+    def __init__(self, safety_factor=RATE_LIMIT_SAFETY_FACTOR):
+        self.safety_factor = safety_factor
+        self.rate = None  # tokens per second
+        self.capacity = 1.0
+        self.tokens = 1.0
+        self.blocked_until = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.rate is not None:
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self._updated_at) * self.rate,
+            )
+        self._updated_at = now
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.rate is None or self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update(self, limit, remaining, reset):
+        """Re-pace the bucket from the latest rate limit window."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            reset = max(reset, 0.001)
+            if remaining <= 0:
+                self.blocked_until = max(self.blocked_until, now + reset)
+                self.tokens = min(self.tokens, 0)
+                return
+
+            self.rate = self.safety_factor * remaining / reset
+            # Allow bursts of roughly one second worth of requests
+            self.capacity = max(1.0, min(float(limit), self.rate))
+            self.tokens = min(self.tokens, self.capacity, remaining)
+
+    def block_for(self, seconds):
+        with self._lock:
+            self.blocked_until = max(
+                self.blocked_until, time.monotonic() + seconds
+            )
+
+
+class RateLimitScheduler:
+    """
+    Shared pacing for every request issued through a CloseApiWrapper.
+    Close applies limits per group of endpoints, so a bucket is kept for each
+    top level resource (`lead`, `activity`, `organization`, ...).
+    """
+
+    def __init__(self, safety_factor=RATE_LIMIT_SAFETY_FACTOR):
+        self.safety_factor = safety_factor
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket_for(self, endpoint):
+        key = endpoint.strip('/').split('/')[0]
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.safety_factor)
+            return self._buckets[key]
+
+    @staticmethod
+    def parse_headers(headers):
+        """
+        Return `(limit, remaining, reset)` from either the combined
+        `RateLimit: limit=.., remaining=.., reset=..` header or the separate
+        `RateLimit-Limit`/`RateLimit-Remaining`/`RateLimit-Reset` headers, or
+        None if the response carries no rate limit information.
+        """
+        values = {}
+        if headers.get('RateLimit'):
+            values = dict(
+                re.findall(r'(limit|remaining|reset)=([\d.]+)', headers['RateLimit'])
+            )
+        for name in ('limit', 'remaining', 'reset'):
+            header = f'RateLimit-{name.capitalize()}'
+            if name not in values and headers.get(header):
+                values[name] = headers[header]
+
+        with contextlib.suppress(KeyError, ValueError):
+            return (
+                float(values['limit']),
+                float(values['remaining']),
+                float(values['reset']),
+            )
+        return None
+
+
+class ScanCheckpoint:
+    """
+    Journal of how far a lead scan got, so a long run that dies part way can
+    resume from the last committed page instead of starting over.
+
+    Progress is kept in a small JSON file that is replaced atomically on
+    every commit. Scans that accumulate leads (rather than acting on them as
+    they go) also append each committed batch to a JSON lines spool next to
+    it, which is replayed on resume. Anything written to the spool after the
+    last commit is discarded.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.spool_path = f'{path}.items.jsonl'
+        self.state = {}
+
+        if resume and os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.state = json.load(f)
+            logging.info('Resuming scan from checkpoint %s', self.path)
+        else:
+            self.clear()
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def commit(self, **values):
+        """Update the journal and atomically replace the file on disk."""
+        self.state.update(values)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def spool(self, items, **values):
+        """Append `items` to the spool and commit them together with `values`."""
+        with open(self.spool_path, 'a', encoding='utf-8') as f:
+            f.truncate(self.get('spool_size', 0))
+            f.seek(self.get('spool_size', 0))
+            for item in items:
+                f.write(json.dumps(item) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            spool_size = f.tell()
+        self.commit(spool_size=spool_size, **values)
+
+    def iter_spooled(self):
+        """Yield every item committed to the spool so far."""
+        if not self.get('spool_size'):
+            return
+
+        with open(self.spool_path, encoding='utf-8') as f:
+            while f.tell() < self.state['spool_size']:
+                yield json.loads(f.readline())
+
+    def clear(self):
+        """Forget all progress, e.g. once a scan has completed."""
+        self.state = {}
+        for path in (self.path, self.spool_path):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+class MetadataCache:
+    """
+    Memoizes org level lookups for `ttl` seconds. Keys are tuples whose first
+    element is a namespace (e.g. `('custom_field_schema', 'lead')`) so
+    related entries can be dropped together with `invalidate`. Values are
+    deep copied on the way out, so callers are free to mutate what they get.
+    """
+
+    def __init__(self, ttl=METADATA_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            entry = (time.monotonic(), loader())
+            with self._lock:
+                self._entries[key] = entry
+        return copy.deepcopy(entry[1])
+
+    def invalidate(self, *namespaces):
+        """Drop the given namespaces, or everything if none are given."""
+        with self._lock:
+            if not namespaces:
+                self._entries.clear()
+                return
+            for key in list(self._entries):
+                if key[0] in namespaces:
+                    del self._entries[key]
+
+    def invalidate_for_write(self, endpoint):
+        namespaces = METADATA_WRITE_INVALIDATES.get(
+            endpoint.strip('/').split('/')[0]
+        )
+        if namespaces:
+            self.invalidate(*namespaces)
 
 
 class CloseApiWrapper(Client):
@@ -16,49 +301,551 @@ class CloseApiWrapper(Client):
             max_retries=max_retries,
             development=development,
         )
+        # Lets scripts run against a local stand-in such as
+        # benchmarks/fake_close_api.py without any code changes
+        if os.environ.get(BASE_URL_ENV_VAR):
+            self.base_url = os.environ[BASE_URL_ENV_VAR]
+        self.scheduler = RateLimitScheduler()
+        self.request_hooks = []
+        self.metadata_cache = MetadataCache()
+
+    def add_request_hook(self, hook):
+        """
+        Register a callable that receives a `RequestInfo` (endpoint, params,
+        status, latency, bytes and retry count) after every API call. See
+        scripts/request_metrics.py for ready made sinks.
+        """
+        self.request_hooks.append(hook)
+
+    def _report_request(self, info):
+        for hook in self.request_hooks:
+            try:
+                hook(info)
+            except Exception:
+                logging.exception('Request hook %r failed', hook)
+
+    def _dispatch(
+        self,
+        method_name,
+        endpoint,
+        api_key=None,
+        data=None,
+        debug=False,
+        timeout=None,
+        **kwargs,
+    ):
+        """
+        Same retry behaviour as `closeio_api.API._dispatch`, except every
+        attempt first takes a token from the shared rate limit scheduler and
+        the response's rate limit headers re-pace it, so all concurrent
+        callers slow down together before hitting a 429. Registered request
+        hooks are told about every call once it's done, and writes drop the
+        cached org metadata they may have changed.
+        """
+        prepped_req = self._prepare_request(
+            method_name, endpoint, api_key, data, debug, **kwargs
+        )
+        bucket = self.scheduler.bucket_for(endpoint)
+        started = time.monotonic()
+        response = None
+        retries = 0
+
+        try:
+            for retry_count in range(self.max_retries):
+                bucket.acquire()
+                retries = retry_count
+                response = None
+                try:
+                    response = self.session.send(
+                        prepped_req, verify=self.verify, timeout=timeout
+                    )
+                except requests.exceptions.ConnectionError:
+                    if retry_count + 1 == self.max_retries:
+                        raise
+                    time.sleep(2)
+                    continue
+
+                rate_limit = self.scheduler.parse_headers(response.headers)
+                if rate_limit:
+                    bucket.update(*rate_limit)
+
+                if response.status_code == 429:
+                    sleep_time = self._get_rate_limit_sleep_time(response)
+                    logging.debug(
+                        'Request was rate limited, pausing requests for %d seconds',
+                        sleep_time,
+                    )
+                    bucket.block_for(sleep_time)
+                    continue
+                elif response.status_code == 503 or (
+                    method_name == 'get' and response.status_code in (502, 504)
+                ):
+                    sleep_time = self._get_randomized_sleep_time_for_error(
+                        response.status_code, retry_count
+                    )
+                    logging.debug(
+                        'Request hit a %s, sleeping for %s seconds',
+                        response.status_code,
+                        sleep_time,
+                    )
+                    time.sleep(sleep_time)
+                    continue
+
+                break
+        finally:
+            if method_name != 'get':
+                self.metadata_cache.invalidate_for_write(endpoint)
+            if self.request_hooks:
+                got_response = response is not None
+                self._report_request(
+                    RequestInfo(
+                        method=method_name,
+                        endpoint=endpoint.strip('/'),
+                        params=kwargs.get('params'),
+                        status=response.status_code if got_response else None,
+                        latency=time.monotonic() - started,
+                        bytes=len(response.content) if got_response else 0,
+                        retries=retries,
+                    )
+                )
+
+        if response.ok:
+            if response.status_code == 204:
+                return ''
+            return response.json()
+        elif response.status_code == 400:
+            raise ValidationError(response)
+        else:
+            raise APIError(response)
+
+    def get_me(self):
+        return self.metadata_cache.get_or_load(('me',), lambda: self.get('me'))
+
+    def get_organization_id(self):
+        return self.get_me()['organizations'][0]['id']
+
+    def get_organization(self):
+        """
+        Name, memberships (active and inactive), lead statuses and pipelines
+        of the API key's organization.
+        """
+        organization_id = self.get_organization_id()
+        return self.metadata_cache.get_or_load(
+            ('organization',),
+            lambda: self.get(
+                f"organization/{organization_id}",
+                params={"_fields": ORGANIZATION_FIELDS},
+            ),
+        )
+
+    def get_memberships(self, include_inactive=False):
+        organization = self.get_organization()
+        memberships = organization['memberships']
+        if include_inactive:
+            memberships += organization.get('inactive_memberships', [])
+        return memberships
 
     def get_lead_statuses(self):
-        organization_id = self.get('me')['organizations'][0]['id']
-        return self.get(
-            f"organization/{organization_id}",
-            params={"_fields": "lead_statuses"},
-        )["lead_statuses"]
+        return self.get_organization()["lead_statuses"]
 
     def get_opportunity_pipelines(self):
-        organization_id = self.get('me')['organizations'][0]['id']
-        return self.get(
-            f"organization/{organization_id}",
-            params={"_fields": "pipelines"},
-        )["pipelines"]
+        return self.get_organization()["pipelines"]
 
     def get_custom_fields(self, type):
-        return self.get(f"custom_field_schema/{type}")["fields"]
+        return self.metadata_cache.get_or_load(
+            ('custom_field_schema', type),
+            lambda: self.get(f"custom_field_schema/{type}")["fields"],
+        )
 
-    def get_opportunity_statuses(self):
-        organization_id = self.get('me')['organizations'][0]['id']
-        pipelines = self.get(
-            f"organization/{organization_id}",
-            params={"_fields": "pipelines"},
-        )["pipelines"]
+    def get_custom_activity_types(self):
+        return self.metadata_cache.get_or_load(
+            ('custom_activity',),
+            lambda: self.get("custom_activity")["data"],
+        )
 
+    def get_opportunity_statuses(self):
         opportunity_statuses = []
-        for pipeline in pipelines:
+        for pipeline in self.get_opportunity_pipelines():
             opportunity_statuses.extend(pipeline['statuses'])
 
         return opportunity_statuses
 
-    def get_all_items(self, url, params=None):
-        if params is None:
-            params = {}
+    def iter_items(self, url, params=None):
+        """
+        Yield every item of a paginated resource page by page, so callers can
+        process (or write out) results without holding the whole result set
+        in memory.
+        """
+        params = dict(params or {})
 
-        items = []
         has_more = True
         offset = 0
         while has_more:
             params["_skip"] = offset
             resp = self.get(url, params=params)
-            items.extend(resp['data'])
+            yield from resp['data']
             offset += len(resp["data"])
             has_more = resp["has_more"]
 
-        return items
+    def get_all_items(self, url, params=None):
+        return list(self.iter_items(url, params=params))
+
+    def iter_cursor_items(self, url, params=None):
+        """
+        Like `iter_items`, for resources such as the event log that are
+        paginated with `_cursor` / `cursor_next` instead of `_skip`.
+        """
+        params = dict(params or {})
+
+        cursor = None
+        while True:
+            params['_cursor'] = cursor or ''
+            resp = self.get(url, params=params)
+            yield from resp['data']
+            cursor = resp.get('cursor_next')
+            if not cursor:
+                return
+
+    @staticmethod
+    def event_log_covers(since):
+        """
+        Whether the event log still has every event since `since` (an ISO
+        8601 date), i.e. whether `get_deleted_lead_ids(since)` is complete.
+        """
+        since = datetime.fromisoformat(since)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return since > datetime.now(timezone.utc) - EVENT_LOG_RETENTION
+
+    def get_deleted_lead_ids(self, since):
+        """
+        Ids of the leads deleted since `since`, including leads that were
+        merged into another lead. Only complete if `event_log_covers(since)`.
+        """
+        return {
+            event['lead_id']
+            for event in self.iter_cursor_items(
+                'event',
+                params={
+                    'object_type': 'lead',
+                    'action': 'deleted',
+                    'date_updated__gte': since,
+                },
+            )
+        }
+
+    def iter_lead_pages_by_cursor(
+        self, query='*', fields=None, page_size=DEFAULT_PAGE_SIZE, cursor=None
+    ):
+        """
+        Yield `(leads, cursor)` pages of all leads matching `query` using
+        keyset pagination instead of `_skip` offsets.
+
+        Leads are sorted by `date_created` and each page asks for leads
+        created at or after the last one seen, so every request costs the same
+        no matter how deep into the result set the scan is. Leads sharing the
+        high-water mark timestamp that were already returned are dropped by
+        id rather than stepped over with `_skip`, so the scan stays correct
+        when leads it already returned stop matching `query` (e.g. because
+        the caller updated them). The returned cursor can be passed back in to
+        continue a scan from where it left off.
+
+        Once more leads share one timestamp than fit in `MAX_PAGE_SIZE`
+        alongside a page, e.g. after a bulk import, the leads seen at it are
+        stepped over with `_skip` after all, keeping the last ones in the
+        results. If the first result is then a lead that wasn't seen, leads
+        returned earlier have dropped out of `query` and the skip may have
+        gone past unseen leads, so it's halved until it lands on a seen lead.
+        """
+        fields = list(fields or [])
+        if fields:
+            fields += [f for f in ('id', 'date_created') if f not in fields]
+        page_size = min(page_size, MAX_PAGE_SIZE)
+
+        cursor = dict(cursor or {'date_created': None, 'seen_ids': []})
+        base_query = f'({query}) ' if query and query != '*' else ''
+
+        while True:
+            high_water_mark = cursor['date_created']
+            seen_ids = set(cursor.get('seen_ids', []))
+            page_query = base_query
+            if high_water_mark:
+                page_query += f'created >= "{high_water_mark}" '
+
+            # Ask for enough leads to fill a page even if every lead seen at
+            # the mark is still in the results, as far as the search allows;
+            # the seen leads that don't fit are skipped
+            params = {
+                'query': page_query + 'sort:created',
+                '_limit': min(page_size + len(seen_ids), MAX_PAGE_SIZE),
+            }
+            if fields:
+                params['_fields'] = ','.join(fields)
+
+            def is_seen(lead):
+                # Also guards against the search matching the mark at a
+                # coarser precision than the timestamps we compare against.
+                return lead['id'] in seen_ids or (
+                    high_water_mark and lead['date_created'] < high_water_mark
+                )
+
+            # Skips up to `safe_skip` only step over leads known to be seen
+            skip = page_size + len(seen_ids) - params['_limit']
+            safe_skip = 0
+            while True:
+                if skip:
+                    params['_skip'] = skip
+                else:
+                    params.pop('_skip', None)
+                resp = self.get('lead', params=params)
+                data = resp['data']
+                if skip > safe_skip and not (data and is_seen(data[0])):
+                    skip = max(skip // 2, safe_skip)
+                    continue
+
+                leads = [lead for lead in data if not is_seen(lead)]
+                if leads or not data or not resp['has_more']:
+                    break
+                # Every result was seen already; look further into the tie
+                skip = safe_skip = skip + len(data)
+
+            if leads:
+                last_created = leads[-1]['date_created']
+                at_mark = [
+                    lead['id']
+                    for lead in leads
+                    if lead['date_created'] == last_created
+                ]
+                if last_created == high_water_mark:
+                    at_mark = cursor.get('seen_ids', []) + at_mark
+                cursor = {'date_created': last_created, 'seen_ids': at_mark}
+            elif resp['has_more']:
+                raise RuntimeError(
+                    f'Lead search returned no new leads after '
+                    f'{high_water_mark} despite has_more'
+                )
+
+            yield leads, dict(cursor)
+
+            if not resp['has_more'] or not resp['data']:
+                return
+
+    def iter_leads_by_cursor(
+        self, query='*', fields=None, checkpoint=None, **kwargs
+    ):
+        """
+        Yield leads from `iter_lead_pages_by_cursor`. With a `ScanCheckpoint`
+        the scan starts from its saved cursor, and the cursor is committed
+        once the caller has consumed every lead of a page.
+        """
+        if checkpoint:
+            kwargs['cursor'] = checkpoint.get('cursor')
+
+        pages = self.iter_lead_pages_by_cursor(query, fields, **kwargs)
+        for leads, cursor in pages:
+            yield from leads
+            if checkpoint:
+                checkpoint.commit(cursor=cursor)
+
+        if checkpoint:
+            checkpoint.clear()
+
+    def _lead_slice_query(self, query, lead_slice):
+        slice_number, total_slices = lead_slice
+        query = f'({query}) ' if query and query != '*' else ''
+        return f'{query}slice:{slice_number}/{total_slices}'
+
+    def plan_lead_slices(
+        self,
+        query='*',
+        concurrency=DEFAULT_CONCURRENCY,
+        slice_size=DEFAULT_SLICE_SIZE,
+    ):
+        """
+        Partition the leads matching `query` into `(slice_number,
+        total_slices)` pairs of roughly `slice_size` leads each.
+
+        The slice count is rounded up to a multiple of `concurrency` so every
+        worker gets the same share. Each slice's size is then probed and any
+        slice that comes back more than `SLICE_RESPLIT_FACTOR` times too large
+        is split in two: `slice:k/n` covers exactly the leads of
+        `slice:k/2n` and `slice:k+n/2n`, so the partition stays complete and
+        disjoint while no single slice turns into a long-tail straggler.
+        """
+        total = self.get('lead', params={'_limit': 0, 'query': query})[
+            'total_results'
+        ]
+        if not total:
+            return []
+
+        total_slices = max(concurrency, math.ceil(total / slice_size))
+        total_slices = concurrency * math.ceil(total_slices / concurrency)
+        total_slices = min(total_slices, total)
+        slices = [(i, total_slices) for i in range(1, total_slices + 1)]
+        if total_slices == total:
+            return slices
+
+        def _count(lead_slice):
+            resp = self.get(
+                'lead',
+                params={
+                    '_limit': 0,
+                    'query': self._lead_slice_query(query, lead_slice),
+                },
+            )
+            return lead_slice, resp['total_results']
+
+        max_slice_size = slice_size * SLICE_RESPLIT_FACTOR
+        max_total_slices = total_slices * 2**MAX_SLICE_SPLITS
+        planned = []
+        pool = Pool(concurrency)
+        while slices:
+            to_split = []
+            for lead_slice, count in pool.imap_unordered(_count, slices):
+                can_split = lead_slice[1] < max_total_slices
+                if count > max_slice_size and can_split:
+                    to_split.append(lead_slice)
+                elif count:
+                    planned.append((count, lead_slice))
+
+            slices = []
+            for slice_number, total_slices in to_split:
+                logging.info(
+                    'Splitting oversized lead slice %s/%s',
+                    slice_number,
+                    total_slices,
+                )
+                slices += [
+                    (slice_number, total_slices * 2),
+                    (slice_number + total_slices, total_slices * 2),
+                ]
+
+        # Hand out the largest slices first so they don't finish last
+        planned.sort(key=lambda item: item[0], reverse=True)
+        return [lead_slice for _, lead_slice in planned]
+
+    def iter_lead_slice(self, query, lead_slice, fields=None):
+        return self.iter_leads_by_cursor(
+            self._lead_slice_query(query, lead_slice), fields
+        )
+
+    def iter_leads_with_slices(
+        self,
+        query='*',
+        fields=None,
+        concurrency=DEFAULT_CONCURRENCY,
+        slice_size=DEFAULT_SLICE_SIZE,
+        checkpoint=None,
+    ):
+        """
+        Yield all leads matching `query`, fetching the slices planned by
+        `plan_lead_slices` in parallel. Leads are yielded as each slice
+        completes, so at most `concurrency` slices are held in memory.
+
+        With a `ScanCheckpoint`, the slice plan and every completed slice are
+        journaled. On resume the leads of completed slices are replayed from
+        the spool and only the remaining slices are fetched.
+        """
+        if checkpoint and checkpoint.get('slices') is not None:
+            slices = [tuple(s) for s in checkpoint.get('slices')]
+            done = {tuple(s) for s in checkpoint.get('done_slices', [])}
+            yield from checkpoint.iter_spooled()
+        else:
+            slices = self.plan_lead_slices(
+                query, concurrency=concurrency, slice_size=slice_size
+            )
+            done = set()
+            if checkpoint:
+                checkpoint.commit(slices=slices, done_slices=[])
+
+        def _fetch(lead_slice):
+            return lead_slice, list(
+                self.iter_lead_slice(query, lead_slice, fields)
+            )
+
+        pool = Pool(concurrency)
+        pending = [s for s in slices if s not in done]
+        for lead_slice, leads in pool.imap_unordered(_fetch, pending):
+            if checkpoint:
+                done.add(lead_slice)
+                checkpoint.spool(leads, done_slices=sorted(done))
+            yield from leads
+
+        if checkpoint:
+            checkpoint.clear()
+
+    def get_all_leads_with_slices(self, query='*', fields=None, **kwargs):
+        return list(self.iter_leads_with_slices(query, fields, **kwargs))
+
+    @staticmethod
+    def _date_window_params(window, params=None):
+        window_start, window_end = window
+        return dict(
+            params or {},
+            date_created__gte=window_start.strftime(DATE_WINDOW_FORMAT),
+            date_created__lt=window_end.strftime(DATE_WINDOW_FORMAT),
+        )
+
+    def plan_date_windows(
+        self,
+        url,
+        start,
+        end,
+        params=None,
+        concurrency=DEFAULT_CONCURRENCY,
+        window_size=DEFAULT_WINDOW_SIZE,
+    ):
+        """
+        Partition `start` (inclusive) to `end` (exclusive) into `(start,
+        end)` windows of `url` items by creation date, with at most about
+        `window_size` items in each.
+
+        Planning starts from whole days. Each window is probed for an item
+        past the first `window_size` (which works whether or not `url`
+        reports `total_results`), and windows that have one are halved, so a
+        busy day ends up as hours or minutes while quiet days stay whole.
+        That keeps every window's `_skip` pagination short, and lets the
+        windows of a busy day be fetched in parallel.
+        """
+        windows = []
+        day = start
+        while day < end:
+            windows.append((day, min(day + timedelta(days=1), end)))
+            day += timedelta(days=1)
+
+        def _is_full(window):
+            resp = self.get(
+                url,
+                params=dict(
+                    self._date_window_params(window, params),
+                    _skip=window_size,
+                    _limit=1,
+                    _fields='id',
+                ),
+            )
+            return window, bool(resp['data'])
+
+        planned = []
+        pool = Pool(concurrency)
+        while windows:
+            to_split = []
+            for window, is_full in pool.imap_unordered(_is_full, windows):
+                window_start, window_end = window
+                can_split = window_end - window_start >= 2 * MIN_DATE_WINDOW
+                if is_full and can_split:
+                    to_split.append(window)
+                else:
+                    planned.append(window)
+
+            windows = []
+            for window_start, window_end in to_split:
+                middle = window_start + (window_end - window_start) / 2
+                middle = middle.replace(microsecond=0)
+                windows += [(window_start, middle), (middle, window_end)]
+
+        planned.sort()
+        return planned
+
+    def iter_date_window(self, url, window, params=None):
+        """Yield the `url` items created in a `plan_date_windows` window."""
+        return self.iter_items(url, self._date_window_params(window, params))
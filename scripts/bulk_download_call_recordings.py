@@ -1,15 +1,28 @@
 import gevent.monkey
 from gevent.pool import Pool
+from gevent.queue import Queue
 
 gevent.monkey.patch_all()
 
 import argparse
-from closeio_api import Client as CloseIO_API
-from dateutil.relativedelta import relativedelta
-from datetime import datetime
-import requests
+from datetime import datetime, timezone
+from itertools import count
 from operator import itemgetter
 import csv
+import os
+
+from scripts.CloseApiWrapper import CloseApiWrapper
+from scripts.recording_archive import DEFAULT_MAX_SHARD_SIZE, RecordingArchive
+from scripts.recording_downloads import (
+    DEFAULT_CONCURRENCY,
+    RecordingManifest,
+    download_to_file,
+    make_session,
+)
+
+# Calls listed ahead of the download workers. Listing pauses while this many
+# are waiting, so a long date range isn't held in memory.
+QUEUE_SIZE = 1000
 
 parser = argparse.ArgumentParser(
     description='Bulk Download Close Call Recordings into a specified Folder'
@@ -18,14 +31,12 @@ parser.add_argument('--api-key', '-k', required=True, help='API Key')
 parser.add_argument(
     '--date_start',
     '-s',
-    required=True,
     help='The start of the date range you want to download recordings for in yyyy-mm-dd format.',
 )
 parser.add_argument(
     '--date_end',
     '-e',
-    required=True,
-    help='The end of the date range you want to download recordings for in yyyy-mm-dd format.',
+    help='The end of the date range you want to download recordings for in yyyy-mm-dd format. Defaults to today with --sync.',
 )
 parser.add_argument(
     '--file-path',
@@ -33,78 +44,110 @@ parser.add_argument(
     required=True,
     help='The file path to the folder where the recordings will be stored.',
 )
+parser.add_argument(
+    '--list-concurrency',
+    type=int,
+    default=5,
+    help='Number of date windows listed from the API at the same time.',
+)
+parser.add_argument(
+    '--download-concurrency',
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+    help='Number of recordings downloaded at the same time.',
+)
+parser.add_argument(
+    '--archive',
+    action='store_true',
+    help='Pack recordings into size-capped tar shards per day, each with an index of where every recording is, instead of writing one file per recording.',
+)
+parser.add_argument(
+    '--shard-size',
+    type=int,
+    default=DEFAULT_MAX_SHARD_SIZE // 1024**2,
+    help='Maximum size of an archive shard in MB.',
+)
+parser.add_argument(
+    '--sync',
+    action='store_true',
+    help='Start from the end date of the last completed run into this folder instead of --date_start.',
+)
+parser.add_argument(
+    '--verify',
+    action='store_true',
+    help='Check the checksum of recordings that were downloaded before instead of only their size.',
+)
 args = parser.parse_args()
 
-api = CloseIO_API(args.api_key)
-
-days = []
-calls = []
-downloaded_calls = []
-starting_date = datetime.strptime(args.date_start, '%Y-%m-%d')
-ending_date = (
-    starting_date + relativedelta(days=+1) - relativedelta(seconds=+1)
-)
-ending_date_final = datetime.strptime(args.date_end, '%Y-%m-%d')
+api = CloseApiWrapper(args.api_key)
 
-# Generate a list of days to cycle through in the date range
-while starting_date < ending_date_final:
-    starting_date_string = datetime.strftime(
-        starting_date, "%Y-%m-%dT%H:%M:%S"
+# Recordings already in the folder are skipped, and the last run's end date
+# is where --sync starts from
+manifest = RecordingManifest(args.file_path)
+archive = None
+if args.archive:
+    archive = RecordingArchive(
+        args.file_path, max_shard_size=args.shard_size * 1024**2
     )
-    ending_date_string = datetime.strftime(ending_date, "%Y-%m-%dT%H:%M:%S")
-    days.append(
-        {
-            'day': starting_date.strftime('%Y-%m-%d'),
-            'start_date': starting_date_string,
-            'end_date': ending_date_string,
-        }
+    # Recordings are downloaded here before they're added to a shard
+    incoming_path = os.path.join(args.file_path, '.incoming')
+    os.makedirs(incoming_path, exist_ok=True)
+if args.sync:
+    args.date_start = manifest.synced_until or args.date_start
+    args.date_end = args.date_end or datetime.now(timezone.utc).strftime(
+        '%Y-%m-%d'
     )
-    starting_date = starting_date + relativedelta(days=+1)
-    ending_date = (
-        starting_date + relativedelta(days=+1) - relativedelta(seconds=+1)
+if not args.date_start or not args.date_end:
+    parser.error(
+        '--date_start and --date_end are required unless --sync continues '
+        'a previous run'
     )
 
+calls = Queue(maxsize=QUEUE_SIZE)
+downloaded_calls = []
+failed_calls = []
+
+# Busy days are split into smaller windows so none of them turns into one
+# long _skip scan
+print("Planning date windows...")
+windows = api.plan_date_windows(
+    'activity/call',
+    datetime.strptime(args.date_start, '%Y-%m-%d'),
+    datetime.strptime(args.date_end, '%Y-%m-%d'),
+    concurrency=args.list_concurrency,
+)
+
 
-# Method to get all of the recordings for a specific day.
-def getRecordedCalls(day):
-    print(f"Getting all recorded call activities for {day['day']}...")
-    has_more = True
-    offset = 0
-    while has_more:
-        resp = api.get(
-            'activity/call',
-            params={
-                '_skip': offset,
-                'date_created__gte': day['start_date'],
-                'date_created__lte': day['end_date'],
-                '_fields': 'id,recording_url,voicemail_url,date_created,lead_id,duration,voicemail_duration,date_created',
-            },
-        )
-        for call in resp['data']:
-            if (call['duration'] > 0 or call['voicemail_duration'] > 0) and (
-                call.get('recording_url') or call.get('voicemail_url')
-            ):
-                call['url'] = call.get(
-                    'recording_url', call.get('voicemail_url')
-                )
-                if call['duration'] > 0:
-                    call['Type'] = 'Answered Call'
-                    call['Answered or Voicemail Duration'] = call['duration']
-                else:
-                    call['Type'] = 'Voicemail'
-                    call['Answered or Voicemail Duration'] = call[
-                        'voicemail_duration'
-                    ]
-                calls.append(call)
-        offset += len(resp['data'])
-        has_more = resp['has_more']
-
-
-pool = Pool(5)
-pool.map(getRecordedCalls, days)
-
-# Sort all calls by date_created to be in order because they were pulled in parallel
-calls = sorted(calls, key=itemgetter('date_created'), reverse=True)
+# Method to get all of the recordings for a date window.
+def getRecordedCalls(window):
+    print(
+        f"Getting all recorded call activities from {window[0]} to {window[1]}..."
+    )
+    params = {
+        '_fields': 'id,recording_url,voicemail_url,date_created,lead_id,duration,voicemail_duration',
+    }
+    for call in api.iter_date_window('activity/call', window, params):
+        if (call['duration'] > 0 or call['voicemail_duration'] > 0) and (
+            call.get('recording_url') or call.get('voicemail_url')
+        ):
+            call['url'] = call.get('recording_url') or call.get(
+                'voicemail_url'
+            )
+            if call['duration'] > 0:
+                call['Type'] = 'Answered Call'
+                call['Answered or Voicemail Duration'] = call['duration']
+            else:
+                call['Type'] = 'Voicemail'
+                call['Answered or Voicemail Duration'] = call[
+                    'voicemail_duration'
+                ]
+            calls.put(call)
+
+
+# Recordings are streamed to disk over one pooled session shared by the
+# download workers
+session = make_session(args.api_key, pool_size=args.download_concurrency)
+call_numbers = count(1)
 
 
 # Method to download a call recording or voicemail recording
@@ -112,39 +155,75 @@ def downloadCall(call):
     try:
         call_title = "close-recording-%s.mp3" % call['id']
         url = call['url']
-        doc = requests.get(
-            url,
-            headers={'Content-Type': 'application/json'},
-            auth=(args.api_key, ''),
-        )
-        with open("%s/%s" % (args.file_path, call_title), 'wb') as f:
-            f.write(doc.content)
-        downloaded_calls.append(
-            {
-                'Call Activity ID': call['id'],
-                'Date Created': call['date_created'],
-                'Type': call['Type'],
-                'Duration': call['Answered or Voicemail Duration'],
-                'Lead ID': call['lead_id'],
-                'Filename': call_title,
-                'url': url,
-            }
-        )
-        print(
-            f"{(calls.index(call) + 1)} of {len(calls)}: Downloading {call_title}"
-        )
+        store = archive or manifest
+        if store.is_downloaded(call['id'], verify=args.verify):
+            action = 'Skipping'
+        elif archive:
+            action = 'Archiving'
+            path = os.path.join(incoming_path, call_title)
+            _, checksum = download_to_file(session, url, path)
+            day = call['date_created'][:10]
+            archive.add(day, call['id'], call_title, path, checksum)
+            os.remove(path)
+        else:
+            action = 'Downloading'
+            size, checksum = download_to_file(
+                session, url, os.path.join(args.file_path, call_title)
+            )
+            manifest.record(call['id'], call_title, size, checksum)
+        row = {
+            'Call Activity ID': call['id'],
+            'Date Created': call['date_created'],
+            'Type': call['Type'],
+            'Duration': call['Answered or Voicemail Duration'],
+            'Lead ID': call['lead_id'],
+            'Filename': call_title,
+            'url': url,
+        }
+        if archive:
+            row['Archive'] = os.path.relpath(
+                archive.get(call['id'])['shard'], args.file_path
+            )
+        downloaded_calls.append(row)
+        print(f"{next(call_numbers)}: {action} {call_title}")
     except Exception as e:
+        failed_calls.append(call)
         print(e)
 
 
-pool.map(downloadCall, calls)
+# Download calls until the listing is done
+def downloadCalls():
+    for call in calls:
+        downloadCall(call)
+
+
+# Windows are listed and their recordings downloaded at the same time, each
+# with its own concurrency limit, so downloads start with the first page
+download_pool = Pool(args.download_concurrency)
+for _ in range(args.download_concurrency):
+    download_pool.spawn(downloadCalls)
+list_pool = Pool(args.list_concurrency)
+list_pool.map(getRecordedCalls, windows)
+for _ in range(args.download_concurrency):
+    calls.put(StopIteration)
+download_pool.join()
+
+# Failed recordings are retried by the next sync, which starts from the same
+# date again. Runs over an earlier date range don't move it back.
+if failed_calls:
+    print(f"Failed to download {len(failed_calls)} recordings")
+elif args.date_end > (manifest.synced_until or ''):
+    manifest.mark_synced(args.date_end)
+manifest.close()
+if archive:
+    archive.close()
 
 # Sort all downloaded calls by date_created to be in order because they were pulled in parallel
 downloaded_calls = sorted(
     downloaded_calls, key=itemgetter('Date Created'), reverse=True
 )
 # Write Filename Output to CSV
-org_name = api.get('me')['organizations'][0]['name'].replace('/', '')
+org_name = api.get_me()['organizations'][0]['name'].replace('/', '')
 f = open(
     f'{args.file_path}/{org_name} Downloaded Call Recordings from {args.date_start} to {args.date_end} Reference.csv',
     'w',
@@ -161,6 +240,8 @@ try:
         'Lead ID',
         'url',
     ]
+    if archive:
+        ordered_keys.insert(2, 'Archive')
     writer = csv.DictWriter(f, ordered_keys)
     writer.writeheader()
     writer.writerows(downloaded_calls)
@@ -3,9 +3,10 @@
 import argparse
 import logging
 
-from closeio_api import Client as CloseIO_API
+from scripts.CloseApiWrapper import CloseApiWrapper, ScanCheckpoint
+from scripts.lead_snapshot import LeadSnapshot
 
-LEADS_QUERY = '* sort:created'
+LEADS_QUERY = '*'
 
 ISO_COUNTRIES = {
     'AF': 'Afghanistan',
@@ -278,7 +279,20 @@ parser.add_argument(
     action='store_true',
     help='Without this flag, the script will do a dry run without actually updating any data.',
 )
+parser.add_argument(
+    '--resume',
+    action='store_true',
+    help='Continue an interrupted run from its last checkpoint instead of starting over.',
+)
+parser.add_argument(
+    '--snapshot',
+    help="SQLite file with a local copy of your leads, shared by the lead-scanning scripts. Only leads changed since it was last refreshed are downloaded",
+)
 args = parser.parse_args()
+# A snapshot scan isn't checkpointed; it only downloads the leads changed since
+# the snapshot was last refreshed anyway
+if args.snapshot and args.resume:
+    parser.error('--resume cannot be combined with --snapshot')
 
 log_format = "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
 if not args.confirmed:
@@ -306,34 +320,30 @@ logging.info(
     )
 )
 
-api = CloseIO_API(args.api_key)
-has_more = True
-offset = 0
-
-while has_more:
-    resp = api.get(
-        'lead',
-        params={
-            'query': LEADS_QUERY,
-            '_skip': offset,
-            '_fields': 'id,addresses',
-        },
+api = CloseApiWrapper(args.api_key)
+if args.snapshot:
+    leads = LeadSnapshot(args.snapshot, api).iter_leads(
+        LEADS_QUERY, fields=['addresses']
+    )
+else:
+    # A dry run doesn't update anything, so resuming a --confirmed run from its
+    # checkpoint would skip leads that were never changed
+    checkpoint_mode = '_confirmed' if args.confirmed else ''
+    checkpoint = ScanCheckpoint(
+        f'.bulk_update_address_countries_{args.old_code}_{args.new_code}{checkpoint_mode}.checkpoint',
+        resume=args.resume,
+    )
+    leads = api.iter_leads_by_cursor(
+        LEADS_QUERY, fields=['id', 'addresses'], checkpoint=checkpoint
     )
 
-    leads = resp['data']
-
-    for lead in leads:
-        need_update = False
-        for address in lead['addresses']:
-            if address['country'] == args.old_code:
-                address['country'] = args.new_code
-                need_update = True
-        if need_update:
-            if args.confirmed:
-                api.put(
-                    'lead/' + lead['id'], data={'addresses': lead['addresses']}
-                )
-            logging.info('updated %s' % lead['id'])
-
-    offset += len(leads)
-    has_more = resp['has_more']
+for lead in leads:
+    need_update = False
+    for address in lead['addresses']:
+        if address['country'] == args.old_code:
+            address['country'] = args.new_code
+            need_update = True
+    if need_update:
+        if args.confirmed:
+            api.put('lead/' + lead['id'], data={'addresses': lead['addresses']})
+        logging.info('updated %s' % lead['id'])
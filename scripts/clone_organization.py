@@ -103,8 +103,8 @@ args = arg_parser.parse_args()
 from_api = CloseApiWrapper(args.from_api_key)
 to_api = CloseApiWrapper(args.to_api_key)
 
-from_organization = from_api.get("me")["organizations"][0]
-to_organization = to_api.get("me")["organizations"][0]
+from_organization = from_api.get_me()["organizations"][0]
+to_organization = to_api.get_me()["organizations"][0]
 
 message = f"Cloning `{from_organization['name']}` ({from_organization['id']}) organization to `{to_organization['name']}` ({to_organization['id']})..."
 message += '\nData from source organization will be added to the destination organization. No data will be deleted.\n\nContinue?'
@@ -633,8 +633,8 @@ if args.smart_views or args.all:
         map_from_to_id = {}
 
         # Custom Activity Types
-        from_custom_activities = from_api.get("custom_activity")["data"]
-        to_custom_activities = to_api.get("custom_activity")["data"]
+        from_custom_activities = from_api.get_custom_activity_types()
+        to_custom_activities = to_api.get_custom_activity_types()
         for from_ca in from_custom_activities:
             to_ca = next(
                 (x for x in to_custom_activities if x['name'] == from_ca['name']),
@@ -651,7 +651,7 @@ if args.smart_views or args.all:
                 'opportunity',
             ]
             custom_activity_type_ids = [
-                x['id'] for x in api.get("custom_activity")["data"]
+                x['id'] for x in api.get_custom_activity_types()
             ]
 
             custom_fields = []
@@ -782,19 +782,15 @@ if args.smart_views or args.all:
     reverse = list(reversed(from_smart_views))
 
 
-    def get_memberships(api, organization):
-        resp = api.get(f"organization/{organization['id']}", params={"_fields": "memberships,inactive_memberships"})
-        return resp["memberships"] + resp["inactive_memberships"]
-
-    from_memberships = get_memberships(from_api, from_organization)
-    to_memberships = get_memberships(to_api, to_organization)
+    from_memberships = from_api.get_memberships(include_inactive=True)
+    to_memberships = to_api.get_memberships(include_inactive=True)
     from_to_membership_id = {}
     for from_membership in from_memberships:
         to_membership = next((x for x in to_memberships if x['user_email'] == from_membership['user_email']), None)
         if to_membership:
             from_to_membership_id[from_membership['id']] = to_membership['id']
 
-    to_user_membership_id = to_api.get("me")["memberships"][0]["id"]
+    to_user_membership_id = to_api.get_me()["memberships"][0]["id"]
 
     # Create Smart Views in the destination organization
     for smart_view in reverse:
@@ -0,0 +1,106 @@
+"""
+Canonical forms of contact phone numbers and email addresses, so that
+duplicates are found even when the same value was typed differently:
+
+    +1 650-555-1234, +16505551234, 001 (650) 555 1234  ->  +16505551234
+    Jane.Doe@Example.COM                              ->  jane.doe@example.com
+    Jane.Doe+crm@gmail.com (with fold_gmail)          ->  janedoe@gmail.com
+
+Phone numbers are reduced to their digits, with a leading `+` when they were
+entered with an international prefix (`+` or `00`), i.e. E.164 for numbers
+Close already stores in international format. Extensions are kept as an
+`x<digits>` suffix so different extensions of one switchboard don't collide.
+
+The same raw values show up over and over in an org (shared switchboards,
+info@ addresses), so every raw value is canonicalized once and looked up in a
+dict afterwards. `phones` and `emails` map a whole batch of values at a time:
+
+    keys = ContactKeys(fold_gmail=True)
+    keys.emails(email['email'] for email in contact['emails'])
+"""
+import re
+
+GMAIL_DOMAINS = {'gmail.com', 'googlemail.com'}
+
+EXTENSION_RE = re.compile(r'\s*(?:ext\.?|extension|x|#)\s*(\d+)\s*$', re.I)
+NON_DIGIT_RE = re.compile(r'\D+')
+
+
+def canonical_phone(phone):
+    """`+1 (650) 555-1234 ext. 12` -> `+16505551234x12`"""
+    phone = (phone or '').strip()
+    extension = ''
+    match = EXTENSION_RE.search(phone)
+    if match:
+        extension = f'x{match.group(1)}'
+        phone = phone[: match.start()]
+    digits = NON_DIGIT_RE.sub('', phone)
+    if not digits:
+        return ''
+    if phone.startswith('+'):
+        digits = f'+{digits}'
+    elif digits.startswith('00'):
+        digits = f'+{digits[2:]}'
+    return digits + extension
+
+
+def canonical_email(email, fold_gmail=False):
+    """
+    Lower-case `email`. With `fold_gmail`, also drop the dots and `+tag` from
+    Gmail addresses, which Gmail delivers to the same mailbox.
+    """
+    email = (email or '').strip().lower()
+    local, at, domain = email.rpartition('@')
+    if not at or not local or not domain:
+        return email
+    if fold_gmail and domain in GMAIL_DOMAINS:
+        local = local.split('+', 1)[0].replace('.', '')
+        domain = 'gmail.com'
+    return f'{local}@{domain}'
+
+
+class ContactKeys:
+    """Memoized, batched `canonical_phone` / `canonical_email`."""
+
+    def __init__(self, fold_gmail=False):
+        self.fold_gmail = fold_gmail
+        self._phones = {}
+        self._emails = {}
+
+    def phone(self, phone):
+        key = self._phones.get(phone)
+        if key is None:
+            key = self._phones[phone] = canonical_phone(phone)
+        return key
+
+    def email(self, email):
+        key = self._emails.get(email)
+        if key is None:
+            key = self._emails[email] = canonical_email(
+                email, self.fold_gmail
+            )
+        return key
+
+    def phones(self, phones):
+        """Canonical keys of `phones`, without empty ones."""
+        return [key for key in map(self.phone, phones) if key]
+
+    def emails(self, emails):
+        """Canonical keys of `emails`, without empty ones."""
+        return [key for key in map(self.email, emails) if key]
+
+    def contact_phones(self, contacts):
+        return self.phones(
+            phone['phone']
+            for contact in contacts
+            for phone in contact.get('phones', [])
+            if phone.get('phone')
+        )
+
+    def contact_emails(self, contacts):
+        return self.emails(
+            email['email']
+            for contact in contacts
+            for email in contact.get('emails', [])
+            if email.get('email')
+        )
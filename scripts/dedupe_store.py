@@ -0,0 +1,180 @@
+"""
+On-disk copy of the duplicate keys of every lead in an org, so that repeated
+duplicate reports only have to download the leads that changed since the
+previous run instead of the whole org.
+
+The store is a SQLite file holding a summary of each lead (the fields the
+reports show) and its `(field, key)` pairs. A run refreshes the leads updated
+since `synced_at`, drops the leads deleted (or merged away) since then,
+records the new sync time and loads the result into a `DuplicateIndex`:
+
+    store = DedupeStore(path, settings)
+    since = store.synced_at
+    leads = api.iter_leads_with_slices(f'updated >= "{since}"')
+    store.update((lead, index.lead_keys(lead)) for lead in leads)
+    store.delete(deleted_lead_ids)
+    store.mark_synced(started_at)
+    store.load(index)
+
+The fields and key settings the keys were extracted with are saved alongside
+them. A store built with different settings is emptied and rebuilt from a
+full scan, since its keys can't be compared with the new ones. The same goes
+for a store last synced longer ago than the event log reaches back, since
+the leads deleted in the meantime can't be found out anymore.
+"""
+import json
+import logging
+import sqlite3
+from itertools import groupby
+
+from scripts.duplicate_index import lead_summary
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS leads (
+    id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lead_keys (
+    lead_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lead_keys_lead_id ON lead_keys (lead_id);
+'''
+
+# Leads written per transaction while updating the store.
+BATCH_SIZE = 1000
+
+
+def _chunks(items, size=BATCH_SIZE):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class DedupeStore:
+    def __init__(self, path, settings):
+        """
+        Open (or create) the store at `path`. `settings` is a JSON-able
+        description of how keys are extracted, e.g. the indexed fields; the
+        store is emptied if it was built with different settings.
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+        settings = json.dumps(settings, sort_keys=True)
+        if self._get_meta('settings') != settings:
+            if self._get_meta('settings') is not None:
+                logging.info(
+                    'Key settings changed, rebuilding dedupe store %s', path
+                )
+            self.clear()
+            with self.db:
+                self._set_meta('settings', settings)
+
+    def _get_meta(self, name):
+        row = self.db.execute(
+            'SELECT value FROM meta WHERE name = ?', (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self.db.execute(
+            'INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)',
+            (name, value),
+        )
+
+    @property
+    def synced_at(self):
+        """When the last completed sync started, or None for a new store."""
+        return self._get_meta('synced_at')
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM leads').fetchone()[0]
+
+    def load(self, index):
+        """Add every stored lead and its keys to the `DuplicateIndex`."""
+        rows = self.db.execute(
+            'SELECT leads.id, leads.summary, lead_keys.field, lead_keys.key '
+            'FROM leads LEFT JOIN lead_keys ON lead_keys.lead_id = leads.id '
+            'ORDER BY leads.rowid'
+        )
+        for _lead_id, lead_rows in groupby(rows, key=lambda row: row[0]):
+            lead_rows = list(lead_rows)
+            lead_keys = {}
+            for _, _, field, key in lead_rows:
+                if field is not None and field in index.keys:
+                    lead_keys.setdefault(field, []).append(key)
+            index.add_keys(json.loads(lead_rows[0][1]), lead_keys)
+        return index
+
+    def update(self, leads_keys):
+        """
+        Replace whatever the store had for the leads of `(lead, {field:
+        [keys]})` pairs, e.g. from `DuplicateIndex.lead_keys` or
+        `KeyBatch.items`. Returns the number of leads.
+        """
+        count = 0
+        for chunk in _chunks(leads_keys):
+            with self.db:
+                self.db.executemany(
+                    'DELETE FROM lead_keys WHERE lead_id = ?',
+                    ((lead['id'],) for lead, _ in chunk),
+                )
+                for lead, lead_keys in chunk:
+                    summary = lead_summary(lead)
+                    self.db.execute(
+                        'INSERT OR REPLACE INTO leads (id, summary) '
+                        'VALUES (?, ?)',
+                        (lead['id'], json.dumps(summary)),
+                    )
+                    self.db.executemany(
+                        'INSERT INTO lead_keys (lead_id, field, key) '
+                        'VALUES (?, ?, ?)',
+                        (
+                            (lead['id'], field, key)
+                            for field, keys in lead_keys.items()
+                            for key in keys
+                        ),
+                    )
+            count += len(chunk)
+        return count
+
+    def delete(self, lead_ids):
+        """Forget `lead_ids`. Returns how many of them were stored."""
+        deleted = 0
+        for chunk in _chunks(lead_ids):
+            with self.db:
+                self.db.executemany(
+                    'DELETE FROM lead_keys WHERE lead_id = ?',
+                    ((lead_id,) for lead_id in chunk),
+                )
+                deleted += self.db.executemany(
+                    'DELETE FROM leads WHERE id = ?',
+                    ((lead_id,) for lead_id in chunk),
+                ).rowcount
+        return deleted
+
+    def clear(self):
+        """Forget every lead and when they were synced."""
+        with self.db:
+            self.db.execute('DELETE FROM leads')
+            self.db.execute('DELETE FROM lead_keys')
+            self.db.execute("DELETE FROM meta WHERE name != 'settings'")
+
+    def mark_synced(self, synced_at):
+        with self.db:
+            self._set_meta('synced_at', synced_at)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,236 @@
+"""
+In-memory index used to find leads that share a lead name, contact name,
+email, phone, URL hostname or custom field value. Emails and phones are
+compared in their canonical form (see `scripts.contact_keys`).
+
+Every lead is visited once: the keys for all requested fields are extracted
+in the same pass and added to `key -> set of lead positions` hash maps, so
+building the index and listing its duplicate groups is linear in the number
+of leads and keys. Leads are referred to by their integer position in the
+index rather than by their dicts, which keeps the key sets small and lets
+`clusters` merge duplicates across fields with a flat union-find.
+
+    index = DuplicateIndex(['email', 'phone'])
+    for lead in leads:
+        index.add(lead)
+    for email, dupes in index.duplicate_groups('email'):
+        ...
+    for cluster_id, dupes in index.clusters():
+        ...
+"""
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from scripts.contact_keys import ContactKeys
+
+FIELDS = ['lead_name', 'contact_name', 'email', 'phone', 'url', 'custom']
+
+# Fields that link leads into clusters by default. Contact names are left out
+# since common names would chain unrelated leads together.
+CLUSTER_FIELDS = ['lead_name', 'email', 'phone', 'url', 'custom']
+
+# Lead fields kept for every indexed lead, for reporting (and merging)
+# duplicates. `num_contacts` is derived from the lead's contacts.
+LEAD_SUMMARY_FIELDS = [
+    'id',
+    'display_name',
+    'status_label',
+    'date_created',
+    'num_contacts',
+]
+
+
+def lead_summary(lead):
+    """The `LEAD_SUMMARY_FIELDS` of a lead, or of an existing summary."""
+    summary = {field: lead.get(field) for field in LEAD_SUMMARY_FIELDS}
+    if 'contacts' in lead:
+        summary['num_contacts'] = len(lead['contacts'] or [])
+    return summary
+
+
+def lead_name_keys(lead):
+    name = (lead.get('display_name') or '').strip().lower()
+    return [name] if name else []
+
+
+def contact_name_keys(lead):
+    return [
+        contact['name'].strip().lower()
+        for contact in lead.get('contacts', [])
+        if contact.get('name') and contact['name'].strip()
+    ]
+
+
+def url_keys(lead):
+    if not lead.get('url'):
+        return []
+    host_name = urlparse(lead['url']).hostname
+    return [host_name.lower()] if host_name else []
+
+
+def custom_field_keys(custom_field_name):
+    def keys(lead):
+        value = (lead.get('custom') or {}).get(custom_field_name)
+        if isinstance(value, list):
+            value = ','.join(value)
+        return [value] if value else []
+
+    return keys
+
+
+def key_extractors(fields, custom_field_name=None, contact_keys=None):
+    """
+    Map each of `fields` to a function returning a lead's keys for it. Emails
+    and phones are canonicalized with `contact_keys` (a `ContactKeys`).
+    """
+    contact_keys = contact_keys or ContactKeys()
+    extractors = {
+        'lead_name': lead_name_keys,
+        'contact_name': contact_name_keys,
+        'email': lambda lead: contact_keys.contact_emails(
+            lead.get('contacts', [])
+        ),
+        'phone': lambda lead: contact_keys.contact_phones(
+            lead.get('contacts', [])
+        ),
+        'url': url_keys,
+    }
+    if 'custom' in fields:
+        if not custom_field_name:
+            raise ValueError('`custom` requires a custom field name')
+        extractors['custom'] = custom_field_keys(custom_field_name)
+    return {field: extractors[field] for field in fields}
+
+
+class DisjointSet:
+    """Union-find over `0..n-1` with path halving and union by size."""
+
+    def __init__(self, n=0):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+
+class DuplicateIndex:
+    def __init__(self, fields, custom_field_name=None, contact_keys=None):
+        self.fields = list(fields)
+        self.custom_field_name = custom_field_name
+        self.contact_keys = contact_keys or ContactKeys()
+        self.extractors = key_extractors(
+            self.fields, custom_field_name, self.contact_keys
+        )
+        self.keys = {field: defaultdict(set) for field in self.fields}
+        self.leads = []
+        self.positions = {}
+
+    def lead_keys(self, lead):
+        """`{field: [keys]}` of `lead` for every indexed field."""
+        return {
+            field: extract(lead) for field, extract in self.extractors.items()
+        }
+
+    def add(self, lead):
+        """Index all of a lead's keys. Adding the same lead twice is a no-op."""
+        self.add_keys(lead, self.lead_keys(lead))
+
+    def add_keys(self, lead, lead_keys):
+        """
+        Index `lead` under already extracted `{field: [keys]}`, e.g. keys
+        loaded back from a `DedupeStore`.
+        """
+        position = self._position(lead)
+        for field, keys in lead_keys.items():
+            field_keys = self.keys[field]
+            for key in keys:
+                field_keys[key].add(position)
+
+    def add_batch(self, batch):
+        """Index a `KeyBatch` extracted elsewhere, e.g. in a worker process."""
+        positions = [self._position(lead) for lead in batch.iter_leads()]
+        for field, (keys, lead_indexes) in batch.keys.items():
+            field_keys = self.keys[field]
+            for key, i in zip(keys, lead_indexes):
+                field_keys[key].add(positions[i])
+
+    def _position(self, lead):
+        """Position of `lead`, after storing (or refreshing) its summary."""
+        lead_id = lead['id']
+        position = self.positions.get(lead_id)
+        if position is None:
+            position = self.positions[lead_id] = len(self.leads)
+            self.leads.append(None)
+        self.leads[position] = lead_summary(lead)
+        return position
+
+    def add_many(self, leads):
+        for lead in leads:
+            self.add(lead)
+        return self
+
+    def leads_by_date_created(self, positions):
+        """Summaries of the leads at `positions`, oldest first."""
+        return sorted(
+            (self.leads[position] for position in positions),
+            key=lambda lead: (lead['date_created'] or '', lead['id']),
+        )
+
+    def duplicate_keys(self, field):
+        """Keys shared by more than one lead, in sorted order."""
+        return sorted(
+            key
+            for key, positions in self.keys[field].items()
+            if len(positions) > 1
+        )
+
+    def duplicate_groups(self, field):
+        """
+        Yield `(key, leads)` for every key shared by more than one lead. Keys
+        are sorted and each group's leads are ordered by creation date.
+        """
+        for key in self.duplicate_keys(field):
+            yield key, self.leads_by_date_created(self.keys[field][key])
+
+    def clusters(self, fields=CLUSTER_FIELDS):
+        """
+        Yield `(cluster_id, leads)` for every set of leads connected through
+        a key shared in any of `fields`, e.g. A and B sharing an email and B
+        and C sharing a phone end up in one cluster. Cluster ids are numbered
+        from 1 in the order of each cluster's oldest lead, whose leads come
+        first.
+        """
+        disjoint_set = DisjointSet(len(self.leads))
+        for field in fields:
+            for positions in self.keys.get(field, {}).values():
+                if len(positions) > 1:
+                    first, *rest = positions
+                    for position in rest:
+                        disjoint_set.union(first, position)
+
+        members = defaultdict(list)
+        for position in range(len(self.leads)):
+            root = disjoint_set.find(position)
+            if disjoint_set.size[root] > 1:
+                members[root].append(position)
+
+        clusters = sorted(
+            map(self.leads_by_date_created, members.values()),
+            key=lambda leads: (leads[0]['date_created'] or '', leads[0]['id']),
+        )
+        for cluster_id, leads in enumerate(clusters, 1):
+            yield cluster_id, leads
@@ -4,10 +4,10 @@ from datetime import datetime
 from operator import itemgetter
 
 import gevent.monkey
-from closeio_api import Client as CloseIO_API
-from dateutil.relativedelta import relativedelta
 from gevent.pool import Pool
 
+from scripts.CloseApiWrapper import CloseApiWrapper
+
 gevent.monkey.patch_all()
 
 parser = argparse.ArgumentParser(
@@ -44,9 +44,8 @@ parser.add_argument(
 )
 args = parser.parse_args()
 
-api = CloseIO_API(args.api_key)
+api = CloseApiWrapper(args.api_key)
 
-days = []
 activities = []
 
 endpoint = args.activity_type
@@ -55,58 +54,32 @@ if endpoint == 'opportunity_status_change':
 elif endpoint == 'lead_status_change':
     endpoint = 'status_change/lead'
 
-starting_date = datetime.strptime(args.date_start, '%Y-%m-%d')
-ending_date = (
-    starting_date + relativedelta(days=+1) - relativedelta(seconds=+1)
+# Busy days are split into smaller windows so none of them turns into one
+# long _skip scan
+pool = Pool(5)
+print("Planning date windows...")
+windows = api.plan_date_windows(
+    'activity/' + endpoint,
+    datetime.strptime(args.date_start, '%Y-%m-%d'),
+    datetime.strptime(args.date_end, '%Y-%m-%d'),
+    concurrency=pool.size,
 )
-ending_date_final = datetime.strptime(args.date_end, '%Y-%m-%d')
-
-# Generate a list of days to cycle through in the date range
-while starting_date < ending_date_final:
-    starting_date_string = datetime.strftime(
-        starting_date, "%Y-%m-%dT%H:%M:%S"
-    )
-    ending_date_string = datetime.strftime(ending_date, "%Y-%m-%dT%H:%M:%S")
-    days.append(
-        {
-            'day': starting_date.strftime('%Y-%m-%d'),
-            'start_date': starting_date_string,
-            'end_date': ending_date_string,
-        }
-    )
-    starting_date = starting_date + relativedelta(days=+1)
-    ending_date = (
-        starting_date + relativedelta(days=+1) - relativedelta(seconds=+1)
-    )
 
 
-# Method to get all of the specified activities for a specific day.
-def getActivities(day):
-    print(f"Getting all {args.activity_type} activites for {day['day']}...")
-    has_more = True
-    offset = 0
-    while has_more:
-        resp = api.get(
-            'activity/' + endpoint,
-            params={
-                '_skip': offset,
-                'date_created__gte': day['start_date'],
-                'date_created__lte': day['end_date'],
-            },
-        )
-        for activity in resp['data']:
-            activities.append(activity)
-        offset += len(resp['data'])
-        has_more = resp['has_more']
+# Method to get all of the specified activities for a date window.
+def getActivities(window):
+    print(
+        f"Getting all {args.activity_type} activites from {window[0]} to {window[1]}..."
+    )
+    activities.extend(api.iter_date_window('activity/' + endpoint, window))
 
 
-pool = Pool(5)
-pool.map(getActivities, days)
+pool.map(getActivities, windows)
 
 # Sort all activities by date_created to be in order because they were pulled in parallel
 activities = sorted(activities, key=itemgetter('date_created'), reverse=True)
 
-org_name = api.get('me')['organizations'][0]['name'].replace('/', '')
+org_name = api.get_me()['organizations'][0]['name'].replace('/', '')
 with open(
     '%s - %s activity export between %s and %s.json'
     % (org_name, args.activity_type, args.date_start, args.date_end),
@@ -1,14 +1,14 @@
 import argparse
 import csv
-import math
 
 import gevent.monkey
 
 gevent.monkey.patch_all()
 
-from closeio_api import Client as CloseApi
 from gevent.pool import Pool
 
+from scripts.CloseApiWrapper import CloseApiWrapper
+
 pool = Pool(10)
 
 arg_parser = argparse.ArgumentParser(description="Download a CSV of email sequence subscriptions")
@@ -16,7 +16,7 @@ arg_parser.add_argument("--api-key", "-k", required=True, help="API Key")
 arg_parser.add_argument("--sequence-id", help="Fetch only subscriptions from this Sequence ID")
 args = arg_parser.parse_args()
 
-api = CloseApi(args.api_key)
+api = CloseApiWrapper(args.api_key)
 
 csv_data = []
 
@@ -39,33 +39,7 @@ sequences = get_sequences()
 
 query = "contact(sequence_subscription(sequence:*)) "
 
-# Get the total number of slices
-total_leads = api.get('lead', params={'_limit': 0, 'query': query})['total_results']
-total_slices = int(math.ceil(float(total_leads) / 1000))
-slices = range(1, total_slices + 1)
-
-
-def get_leads_slice(slice_index):
-    print(f"Getting lead slice {slice_index} of {total_slices}...")
-    has_more = True
-    offset = 0
-    while has_more:
-        resp = api.get(
-            'lead',
-            params={
-                '_skip': offset,
-                'query': f'sort:created slice:{slice_index}/{total_slices}',
-                '_fields': 'id'
-            },
-        )
-        leads.extend(resp['data'])
-
-        offset += len(resp['data'])
-        has_more = resp['has_more']
-
-
-leads = []
-pool.map(get_leads_slice, slices)
+leads = api.get_all_leads_with_slices(query, fields=['id'], concurrency=10)
 
 
 def fetch_sequence_subscriptions(lead):
@@ -123,7 +97,7 @@ keys = [
     "pause_reason",
 ]
 
-org_name = api.get("me")["organizations"][0]['name']
+org_name = api.get_me()["organizations"][0]['name']
 with open(f"{org_name} - Sequence subscriptions.csv", "wt") as f:
     writer = csv.DictWriter(f, keys)
     writer.writeheader()
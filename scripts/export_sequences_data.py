@@ -4,9 +4,10 @@ import csv
 import gevent.monkey
 
 gevent.monkey.patch_all()
-from closeio_api import Client as CloseIO_API
 from gevent.pool import Pool
 
+from scripts.CloseApiWrapper import CloseApiWrapper
+
 parser = argparse.ArgumentParser(
     description='Download a CSV of email sequences and their subscription counts (number of active/paused/finished subscriptions)'
 )
@@ -14,8 +15,8 @@ parser = argparse.ArgumentParser(
 parser.add_argument('--api-key', '-k', required=True, help='API Key')
 args = parser.parse_args()
 
-api = CloseIO_API(args.api_key)
-org_name = api.get('me')['organizations'][0]['name']
+api = CloseApiWrapper(args.api_key)
+org_name = api.get_me()['organizations'][0]['name']
 
 print('Getting email sequences...')
 
@@ -1,6 +1,5 @@
 import argparse
-import csv
-import math
+from operator import itemgetter
 
 import gevent.monkey
 
@@ -9,7 +8,8 @@ from gevent.pool import Pool
 
 pool = Pool(7)
 
-from closeio_api import Client as CloseApi
+from scripts.CloseApiWrapper import CloseApiWrapper
+from scripts.report_writer import ExternalSort, write_csv
 
 arg_parser = argparse.ArgumentParser(description="Download a CSV of SMS messages over a specified time range")
 arg_parser.add_argument("--api-key", "-k", required=True, help="API Key")
@@ -44,9 +44,9 @@ arg_parser.add_argument(
 arg_parser.add_argument("--smart-view", help="Export SMS messages only for leads in a specific Smart View")
 args = arg_parser.parse_args()
 
-api = CloseApi(args.api_key)
+api = CloseApiWrapper(args.api_key)
 
-organization = api.get("me")["organizations"][0]
+organization = api.get_me()["organizations"][0]
 
 sms_messages_fields = ['id', 'direction', 'local_phone', 'remote_phone', 'lead_id', 'contact_id', 'user_id',
                        'user_name', 'date_created', 'text', 'status', 'cost', 'source']
@@ -56,8 +56,7 @@ sms_messages_params = {
 
 if args.user:
     def get_membership(user_identifier):
-        resp = api.get(f"organization/{organization['id']}", params={"_fields": "memberships,inactive_memberships"})
-        memberships = resp["memberships"] + resp["inactive_memberships"]
+        memberships = api.get_memberships(include_inactive=True)
 
         if user_identifier.startswith("user_"):
             return next(iter(x for x in memberships if x["user_id"] == user_identifier), None)
@@ -107,52 +106,15 @@ if args.smart_view:
 print("Getting Leads...")
 print(f'\t{query}')
 
-def get_all(url, params=None):
-    if params is None:
-        params = {}
-
-    items = []
-    has_more = True
-    offset = 0
-    while has_more:
-        params["_skip"] = offset
-        resp = api.get(url, params=params)
-        items.extend(resp['data'])
-        offset += len(resp["data"])
-        has_more = resp["has_more"]
-    return items
-
-
-def get_all_leads_with_slices(params, slice_size=500):
-    leads = []
-
-    total_leads = api.get("lead", params={"_limit": 0, "query": params["query"], "_fields": "id"})[
-        "total_results"]
-    total_slices = int(math.ceil(float(total_leads) / slice_size))
-
-    slices = []
-    for slice_number in range(1, total_slices + 1):
-        slices.append({"total_slices": total_slices, "slice": slice_number, "params": params})
-
-    def _get_all_leads_slice(slice_obj):
-        params = slice_obj["params"]
-
-        new_params = params.copy()
-        new_params["query"] = f'({params["query"]}) slice:{slice_obj["slice"]}/{slice_obj["total_slices"]}'
-
-        leads.extend(get_all("lead", params=new_params))
-
-    pool.map(_get_all_leads_slice, slices)
-
-    return leads
-
-
-leads = get_all_leads_with_slices(params={"query": query, "_fields": "id,display_name"})
+leads = api.get_all_leads_with_slices(query, fields=["id", "display_name"], concurrency=7, slice_size=500)
 
 lead_id_to_name = {}
 for lead in leads:
     lead_id_to_name[lead["id"]] = lead["display_name"]
 
+# Write to CSV
+file_name = f"{organization['name']} SMS messages.csv"
+
 print("Getting SMS messages...")
 
 
@@ -165,33 +127,25 @@ def get_sms_messages_for_lead(lead):
     if args.end_date:
         sms_params["date_created__lt"] = args.end_date
 
-    sms_messages.extend(get_all("activity/sms", params=sms_params))
+    for sms_message in api.iter_items("activity/sms", params=sms_params):
+        if args.direction and sms_message["direction"] != args.direction:
+            continue
 
+        if args.status and sms_message["status"] != args.status:
+            continue
 
-sms_messages = []
-pool.map(get_sms_messages_for_lead, leads)
+        sms_message["lead_name"] = lead_id_to_name.get(sms_message.get("lead_id"), "")
 
-# Sort by newest first
-sms_messages.sort(key=lambda x: x["date_created"], reverse=True)
+        if sms_message.get("cost"):
+            sms_message["formatted_cost"] = f"${(float(sms_message['cost']) / 100)}"
 
-if args.direction:
-    sms_messages = [i for i in sms_messages if i["direction"] == args.direction]
+        sms_messages.add(sms_message)
 
-if args.status:
-    sms_messages = [i for i in sms_messages if i["status"] == args.status]
 
-for sms_message in sms_messages:
-    sms_message["lead_name"] = lead_id_to_name.get(sms_message.get("lead_id"), "")
-
-    if sms_message.get("cost"):
-        sms_message["formatted_cost"] = f"${(float(sms_message['cost']) / 100)}"
-
-# Write to CSV
-file_name = f"{organization['name']} SMS messages.csv"
+# Sort by newest first, on disk once there are too many messages to keep in memory
+sms_messages = ExternalSort(key=itemgetter("date_created"), reverse=True)
+pool.map(get_sms_messages_for_lead, leads)
 
-with open(file_name, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.DictWriter(f, sms_messages_fields + ['lead_name', 'formatted_cost'])
-    writer.writeheader()
-    writer.writerows(sms_messages)
+write_csv(file_name, sms_messages_fields + ['lead_name', 'formatted_cost'], sms_messages)
 
 print(f'Done! Report is saved to `{file_name}`')
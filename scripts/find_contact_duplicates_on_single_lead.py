@@ -1,15 +1,17 @@
 import argparse
-import csv
-import math
 from operator import itemgetter
 
 import gevent.monkey
-from closeio_api import Client as CloseIO_API
-from gevent.pool import Pool
+
+from scripts.CloseApiWrapper import CloseApiWrapper, ScanCheckpoint
+from scripts.contact_keys import ContactKeys
+from scripts.lead_snapshot import LeadSnapshot
+from scripts.report_writer import ExternalSort, write_csv
 
 gevent.monkey.patch_all()
 
-pool = Pool(7)
+# Leads between progress messages.
+PROGRESS_INTERVAL = 1000
 
 parser = argparse.ArgumentParser(
     description='Find duplicate contacts on a lead in your Close org via contact_name, email address, or phone number'
@@ -23,200 +25,134 @@ parser.add_argument(
     required=False,
     help="Specify a field to compare uniqueness",
 )
+parser.add_argument(
+    '--fold-gmail',
+    action='store_true',
+    help="Treat Gmail addresses that only differ in dots or a `+tag` (jane.doe+crm@gmail.com, janedoe@gmail.com) as the same email",
+)
+parser.add_argument(
+    '--resume',
+    action='store_true',
+    help="Continue an interrupted lead download from its last checkpoint instead of starting over",
+)
+parser.add_argument(
+    '--snapshot',
+    help="SQLite file with a local copy of your leads, shared by the lead-scanning scripts. Only leads changed since it was last refreshed are downloaded",
+)
 args = parser.parse_args()
+# A snapshot scan isn't checkpointed; it only downloads the leads changed since
+# the snapshot was last refreshed anyway
+if args.snapshot and args.resume:
+    parser.error('--resume cannot be combined with --snapshot')
+contact_keys = ContactKeys(fold_gmail=args.fold_gmail)
 
 # Initialize Close API Wrapper
-api = CloseIO_API(args.api_key)
-org_name = api.get('me')['organizations'][0]['name'].replace('/', '')
-
-# Calculate number of slices necessary to get all leads
-total_leads = api.get(
-    'lead', params={'_limit': 0, 'query': 'sort:created contacts > 1'}
-)['total_results']
-total_slices = int(math.ceil(float(total_leads) / 1000))
-slices = range(1, total_slices + 1)
-leads = []
-
+api = CloseApiWrapper(args.api_key)
+organization = api.get_me()['organizations'][0]
+org_name = organization['name'].replace('/', '')
 
 # Write data to a CSV
 def writeCSV(type_name, items, ordered_keys):
     print(f"Writing {type_name} data to CSV...")
-    f = open(
+    write_csv(
         f'{org_name} {type_name} Duplicates on a Single Lead.csv',
-        'w',
-        newline='',
-        encoding='utf-8',
+        ordered_keys,
+        items,
     )
-    try:
-        writer = csv.DictWriter(f, ordered_keys)
-        writer.writeheader()
-        writer.writerows(items)
-    finally:
-        f.close()
-
-    # Get leads for each slice
-
-
-def getLeadsSlice(slice_num):
-    print(f"Getting lead slice {slice_num} of {total_slices}...")
-    has_more = True
-    offset = 0
-    while has_more:
-        resp = api.get(
-            'lead',
-            params={
-                '_skip': offset,
-                'query': 'sort:created slice:%s/%s contacts > 1'
-                % (slice_num, total_slices),
-                '_fields': 'id,display_name,contacts,date_created',
-            },
-        )
-        for lead in resp['data']:
-            leads.append(lead)
-        offset += len(resp['data'])
-        has_more = resp['has_more']
-
-
-# Add to a list of duplicates for contact names
-def getDuplicatesForContactName(contact_name):
-    for dupe in contact_names[contact_name]:
-        contact_name_duplicates.append(
-            {
-                'Contact Name': dupe['display_name'],
-                'Lead Name': dupe['lead_name'],
-                'Contact ID': dupe['id'],
-                'Lead ID': dupe['lead_id'],
-                'Close URL': 'https://app.close.com/lead/%s/'
-                % dupe['lead_id'],
-            }
-        )
-
-
-# Add to a list of duplicates for contact emails
-def getDuplicatesForEmail(email):
-    for dupe in emails[email]:
-        email_duplicates.append(
-            {
-                'Email Address': email,
-                'Contact Name': dupe['display_name'],
-                'Lead Name': dupe['lead_name'],
-                'Contact ID': dupe['id'],
-                'Lead ID': dupe['lead_id'],
-                'Close URL': 'https://app.close.com/lead/%s/'
-                % dupe['lead_id'],
-            }
-        )
-
-
-# Add to a list of duplicates for contact phones
-def getDuplicatesForPhone(phone):
-    for dupe in phones[phone]:
-        phone_duplicates.append(
-            {
-                'Phone Number': phone,
-                'Contact Name': dupe['display_name'],
-                'Lead Name': dupe['lead_name'],
-                'Contact ID': dupe['id'],
-                'Lead ID': dupe['lead_id'],
-                'Close URL': 'https://app.close.com/lead/%s/'
-                % dupe['lead_id'],
-            }
-        )
 
 
-print("Getting Leads...")
-pool.map(getLeadsSlice, slices)
-leads = sorted(leads, key=itemgetter('date_created'))
-
-# Process duplicates
-contact_name_duplicates = []
-email_duplicates = []
-phone_duplicates = []
-print("Processing contacts on each lead...")
-
-for lead in leads:
-    contact_names = {}
-    emails = {}
-    phones = {}
-    keys_with_dupes_contact_name = []
-    keys_with_dupes_email = []
-    keys_with_dupes_phone = []
-    for contact in lead['contacts']:
-        contact['lead_name'] = lead['display_name']
-        # Pouplate a dictionary of duplicate contact names, and keep track of those that appear more than once
-        if args.field in ['all', 'contact_name']:
-            lower_name = contact['display_name'].strip().lower()
-            if (
-                contact_names.get(lower_name)
-                and contact not in contact_names[lower_name]
-            ):
-                contact_names[lower_name].append(contact)
-                keys_with_dupes_contact_name.append(lower_name)
-            elif not contact_names.get(lower_name):
-                contact_names[lower_name] = [contact]
-
-        # Populate a dictionary of emails, and keep track of those that appear more than once
-        if args.field in ['all', 'email']:
-            for email in contact['emails']:
-                if (
-                    emails.get(email['email'])
-                    and contact not in emails[email['email']]
-                ):
-                    emails[email['email']].append(contact)
-                    keys_with_dupes_email.append(email['email'])
-                elif not emails.get(email['email']):
-                    emails[email['email']] = [contact]
-
-        # Populate a dictionary of phones, and keep track of those that appear more than once
-        if args.field in ['all', 'phone']:
-            for phone in contact['phones']:
-                if (
-                    phones.get(phone['phone'])
-                    and contact not in phones[phone['phone']]
-                ):
-                    phones[phone['phone']].append(contact)
-                    keys_with_dupes_phone.append(phone['phone'])
-                elif not phones.get(phone['phone']):
-                    phones[phone['phone']] = [contact]
-
-    # Write data to appropriate arrays
-    if args.field in ['all', 'contact_name']:
-        if len(keys_with_dupes_contact_name) > 0:
-            keys_with_dupes_contact_name = list(
-                set(keys_with_dupes_contact_name)
+def contact_name_keys(contact):
+    return [contact['display_name'].strip().lower()]
+
+
+# Field -> (CSV column holding the key, or None, and a function returning the
+# keys of a contact)
+DUPLICATE_KEYS = {
+    'contact_name': (None, contact_name_keys),
+    'email': ('Email Address', lambda c: contact_keys.contact_emails([c])),
+    'phone': ('Phone Number', lambda c: contact_keys.contact_phones([c])),
+}
+
+
+def group_contacts(contacts, get_keys):
+    """Map each key shared by more than one of `contacts` to those contacts."""
+    groups = {}
+    for contact in contacts:
+        for key in get_keys(contact):
+            group = groups.setdefault(key, {})
+            group.setdefault(contact['id'], contact)
+    return {
+        key: list(group.values())
+        for key, group in groups.items()
+        if len(group) > 1
+    }
+
+
+def duplicate_rows(lead, field):
+    """Yield a CSV row for every contact of `lead` sharing a `field` key."""
+    key_column, get_keys = DUPLICATE_KEYS[field]
+    for key, contacts in group_contacts(lead['contacts'], get_keys).items():
+        for contact in contacts:
+            row = {key_column: key} if key_column else {}
+            row.update(
+                {
+                    'Contact Name': contact['display_name'],
+                    'Lead Name': lead['display_name'],
+                    'Contact ID': contact['id'],
+                    'Lead ID': lead['id'],
+                    'Close URL': 'https://app.close.com/lead/%s/'
+                    % lead['id'],
+                }
             )
-            pool.map(getDuplicatesForContactName, keys_with_dupes_contact_name)
+            yield row
 
-    if args.field in ['all', 'email']:
-        if len(keys_with_dupes_email) > 0:
-            keys_with_dupes_email = list(set(keys_with_dupes_email))
-            pool.map(getDuplicatesForEmail, keys_with_dupes_email)
 
-    if args.field in ['all', 'phone']:
-        if len(keys_with_dupes_phone) > 0:
-            keys_with_dupes_phone = list(set(keys_with_dupes_phone))
-            pool.map(getDuplicatesForPhone, keys_with_dupes_phone)
+print("Getting Leads...")
+lead_fields = ['id', 'display_name', 'contacts']
+if args.snapshot:
+    leads = LeadSnapshot(args.snapshot, api).iter_leads(
+        'contacts > 1', fields=lead_fields
+    )
+else:
+    checkpoint = ScanCheckpoint(
+        f'.find_contact_duplicates_on_single_lead_{organization["id"]}.checkpoint',
+        resume=args.resume,
+    )
+    leads = api.iter_leads_with_slices(
+        'contacts > 1', fields=lead_fields, checkpoint=checkpoint
+    )
 
-    print(f"{(leads.index(lead) + 1)} of {len(leads)}: {lead['id']}")
+# Rows are sorted on disk once there are too many to keep in memory
+duplicates = {
+    'contact_name': ExternalSort(key=itemgetter('Lead ID', 'Contact Name')),
+    'email': ExternalSort(key=itemgetter('Lead ID', 'Email Address')),
+    'phone': ExternalSort(key=itemgetter('Lead ID', 'Phone Number')),
+}
+fields = list(DUPLICATE_KEYS) if args.field == 'all' else [args.field]
 
+# Leads are processed as their slices arrive, so the report only has to be
+# written out once the last slice is in
+print("Processing contacts on each lead...")
+num_leads = 0
+for num_leads, lead in enumerate(leads, start=1):
+    for field in fields:
+        duplicates[field].extend(duplicate_rows(lead, field))
+    if num_leads % PROGRESS_INTERVAL == 0:
+        print(f"Processed {num_leads} leads")
+print(f"Processed {num_leads} leads")
+
+# Duplicates are written sorted by lead and then contact name, email or phone
 if args.field in ['all', 'contact_name']:
-    # Sort the duplicates alphabetically by lead name and then contact name and write them to a CSV
-    contact_name_duplicates = sorted(
-        contact_name_duplicates, key=itemgetter('Lead ID', 'Contact Name')
-    )
     writeCSV(
         "Contact Name",
-        contact_name_duplicates,
+        duplicates['contact_name'],
         ['Contact Name', 'Lead Name', 'Contact ID', 'Lead ID', 'Close URL'],
     )
 
 if args.field in ['all', 'email']:
-    email_duplicates = sorted(
-        email_duplicates, key=itemgetter('Lead ID', 'Email Address')
-    )
     writeCSV(
         "Email",
-        email_duplicates,
+        duplicates['email'],
         [
             'Email Address',
             'Contact Name',
@@ -228,12 +164,9 @@ if args.field in ['all', 'email']:
     )
 
 if args.field in ['all', 'phone']:
-    phone_duplicates = sorted(
-        phone_duplicates, key=itemgetter('Lead ID', 'Phone Number')
-    )
     writeCSV(
         "Phone",
-        phone_duplicates,
+        duplicates['phone'],
         [
             'Phone Number',
             'Contact Name',
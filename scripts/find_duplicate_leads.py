@@ -1,16 +1,35 @@
 import argparse
-import csv
-import math
-from operator import itemgetter
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
 
 import gevent.monkey
 
 gevent.monkey.patch_all()
-from urllib.parse import urlparse
-from closeio_api import Client as CloseIO_API
-from gevent.pool import Pool
 
-pool = Pool(7)
+from scripts.CloseApiWrapper import CloseApiWrapper, ScanCheckpoint
+from scripts.contact_keys import ContactKeys
+from scripts.dedupe_store import DedupeStore
+from scripts.duplicate_index import CLUSTER_FIELDS, DuplicateIndex
+from scripts.fuzzy_match import DEFAULT_THRESHOLD, fuzzy_groups
+from scripts.key_extraction import iter_key_batches_with_slices
+from scripts.lead_snapshot import LeadSnapshot
+from scripts.lead_merger import (
+    DEFAULT_CONCURRENCY as MERGE_CONCURRENCY,
+    DEFAULT_MAX_CLUSTER_SIZE,
+    DEFAULT_MERGE_FIELDS,
+    SURVIVOR_RULES,
+    TOO_LARGE,
+    MergeJournal,
+    is_too_large,
+    merge_clusters,
+    plan_merges,
+)
+from scripts.report_writer import write_csv
+from scripts.request_metrics import (
+    add_metrics_arguments,
+    setup_request_metrics,
+)
 
 parser = argparse.ArgumentParser(
     description='Find duplicate leads in your Close org via lead name, email address, phone number, or lead url hostname'
@@ -28,46 +47,110 @@ parser.add_argument(
         'url',
         'all',
         'custom',
+        'fuzzy_lead_name',
     ],
-    help="Specify a field to compare uniqueness",
+    help="Specify a field to compare uniqueness. `fuzzy_lead_name` matches lead names that are similar once case, punctuation and suffixes like `Inc.` are ignored",
 )
 parser.add_argument(
     '--custom-field-name',
     '-c',
-    help="Specify the custom field name if you're deduplicating by `custom` field",
+    help="Specify the custom field name if you're deduplicating by `custom` field. With `all`, the custom field is compared too",
+)
+parser.add_argument(
+    '--similarity-threshold',
+    type=float,
+    default=DEFAULT_THRESHOLD,
+    help="How similar (0-1, Jaccard similarity of character trigrams) lead names must be to be reported by `fuzzy_lead_name`",
+)
+parser.add_argument(
+    '--fold-gmail',
+    action='store_true',
+    help="Treat Gmail addresses that only differ in dots or a `+tag` (jane.doe+crm@gmail.com, janedoe@gmail.com) as the same email",
+)
+parser.add_argument(
+    '--resume',
+    action='store_true',
+    help="Continue an interrupted lead download from its last checkpoint instead of starting over",
 )
+parser.add_argument(
+    '--clusters',
+    action='store_true',
+    help="Also write a CSV grouping leads connected through a shared lead name, email, phone, URL or custom field value (e.g. A shares an email with B, and B a phone with C) into clusters",
+)
+parser.add_argument(
+    '--index-db',
+    help="SQLite file to keep the duplicate keys of every lead in between runs. Only leads updated or deleted since the previous run with the same file are downloaded",
+)
+parser.add_argument(
+    '--processes',
+    type=int,
+    default=1,
+    help="Download lead slices and extract their keys in this many worker processes, to use more than one CPU core on very large orgs. Requests made by workers aren't included in the request metrics",
+)
+parser.add_argument(
+    '--merge',
+    action='store_true',
+    help="Merge every cluster of leads sharing a --merge-fields key into one surviving lead, and write what was merged to a Merge Duplicates CSV",
+)
+parser.add_argument(
+    '--merge-fields',
+    nargs='+',
+    choices=CLUSTER_FIELDS,
+    default=DEFAULT_MERGE_FIELDS,
+    help="Fields whose shared keys link leads into the clusters merged with --merge. Defaults to email only, since lead names, URL hostnames and phone numbers like a switchboard's are often shared by unrelated leads",
+)
+parser.add_argument(
+    '--max-cluster-size',
+    type=int,
+    default=DEFAULT_MAX_CLUSTER_SIZE,
+    help="Clusters with more leads than this aren't merged by --merge, only listed in the Merge Duplicates CSV",
+)
+parser.add_argument(
+    '--survivor',
+    choices=sorted(SURVIVOR_RULES),
+    default='oldest',
+    help="Which lead of a cluster the others are merged into with --merge: the oldest one, or the one with the most contacts (the oldest of those on a tie)",
+)
+parser.add_argument(
+    '--merge-concurrency',
+    type=int,
+    default=MERGE_CONCURRENCY,
+    help="Number of clusters merged in parallel with --merge",
+)
+parser.add_argument(
+    '--confirmed',
+    action='store_true',
+    help="Without this flag, --merge does a dry run and only reports what would be merged",
+)
+parser.add_argument(
+    '--snapshot',
+    help="SQLite file with a local copy of your leads, shared by the lead-scanning scripts. Only leads changed since it was last refreshed are downloaded",
+)
+add_metrics_arguments(parser)
 args = parser.parse_args()
+# A snapshot scan isn't checkpointed; it only downloads the leads changed since
+# the snapshot was last refreshed anyway
+if args.snapshot and args.resume:
+    parser.error('--resume cannot be combined with --snapshot')
+
+# Minutes before a run's start that the next incremental run fetches from
+SYNC_OVERLAP_MINUTES = 5
 
 # Initialize Close API Wrapper
-api = CloseIO_API(args.api_key)
-organization = api.get('me')['organizations'][0]
+api = CloseApiWrapper(args.api_key)
+setup_request_metrics(api, args)
+organization = api.get_me()['organizations'][0]
 org_id = organization['id']
 org_name = organization['name']
 
-# Calculate number of slices necessary to get all leads
-total_leads = api.get('lead', params={'_limit': 0, 'query': 'sort:created'})[
-    'total_results'
-]
-total_slices = int(math.ceil(float(total_leads) / 1000))
-slices = range(1, total_slices + 1)
-leads = []
-
-
-# Write data to a CSV
+# Write data to a CSV as the rows are produced
 def write_to_csv_file(type_name, items, ordered_keys):
     print("Writing data to CSV...")
-    f = open(
+    write_csv(
         f'{org_name.replace("/", " ")} {type_name} Duplicates.csv',
-        'w',
-        newline='',
-        encoding='utf-8',
+        ordered_keys,
+        items,
     )
-    try:
-        writer = csv.DictWriter(f, ordered_keys)
-        writer.writeheader()
-        writer.writerows(items)
-    finally:
-        f.close()
 
 
 # Get leads for each slice
@@ -79,7 +162,7 @@ lead_params_fields = [
     'date_created',
     'url',
 ]
-if args.field == 'custom':
+if args.field == 'custom' or args.custom_field_name:
     lead_params_fields += ['custom']
 
     if not args.custom_field_name:
@@ -89,266 +172,190 @@ if args.field == 'custom':
         exit(1)
 
 
-def get_leads_slice(slice_num):
-    print(f"Getting lead slice {slice_num} of {total_slices}...")
-    has_more = True
-    offset = 0
-    while has_more:
-        resp = api.get(
-            'lead',
-            params={
-                '_skip': offset,
-                'query': 'sort:created slice:%s/%s'
-                % (slice_num, total_slices),
-                '_fields': ','.join(lead_params_fields),
-            },
-        )
-        leads.extend(resp['data'])
-
-        offset += len(resp['data'])
-        has_more = resp['has_more']
-
+# Report name and key column written for each field's duplicates
+REPORTS = {
+    'lead_name': ('Lead Name', None),
+    'custom': (
+        f'Custom - {args.custom_field_name}',
+        f'custom.{args.custom_field_name}',
+    ),
+    'email': ('Email', 'Email Address'),
+    'contact_name': ('Contact Name', 'Contact Name'),
+    'phone': ('Phone', 'Phone Number'),
+    'url': ('URL', 'URL Hostname'),
+}
+
+
+def write_duplicates(field):
+    type_name, key_column = REPORTS[field]
+    print(f"Getting {type_name.lower()} duplicate data...")
+
+    # Groups come out sorted by key, so rows are written as they're built
+    def duplicates():
+        keys_with_dupes = index.duplicate_keys(field)
+        for n, (key, dupes) in enumerate(index.duplicate_groups(field), 1):
+            for dupe in dupes:
+                row = {key_column: key} if key_column else {}
+                row.update(
+                    {
+                        'Lead Name': dupe['display_name'],
+                        'Status Label': dupe['status_label'],
+                        'Lead ID': dupe['id'],
+                        'Lead Date Created': dupe['date_created'],
+                        'Close URL': 'https://app.close.com/lead/%s/'
+                        % dupe['id'],
+                    }
+                )
+                yield row
+            print(f"{n} of {len(keys_with_dupes)}: {key}")
 
-# Add to a list of duplicates for lead names
-def get_duplicates_for_lead_name(lead_name):
-    for dupe in lead_names[lead_name]:
-        lead_name_duplicates.append(
-            {
-                'Lead Name': dupe['display_name'],
-                'Status Label': dupe['status_label'],
-                'Lead ID': dupe['id'],
-                'Lead Date Created': dupe['date_created'],
-                'Close URL': 'https://app.close.com/lead/%s/' % dupe['id'],
-            }
-        )
-    print(
-        f"{(keys_with_dupes_lead_name.index(lead_name) + 1)} of {len(keys_with_dupes_lead_name)}: {lead_name}"
+    write_to_csv_file(
+        type_name,
+        duplicates(),
+        ([key_column] if key_column else [])
+        + [
+            'Lead Name',
+            'Status Label',
+            'Lead Date Created',
+            'Lead ID',
+            'Close URL',
+        ],
     )
 
 
-def get_duplicates_for_custom_field(custom_field_value):
-    custom_field_name = args.custom_field_name
-
-    for dupe in custom_fields[custom_field_value]:
-        custom_field_duplicates.append(
-            {
-                f'custom.{custom_field_name}': custom_field_value,
-                'Lead Name': dupe['display_name'],
-                'Status Label': dupe['status_label'],
-                'Lead ID': dupe['id'],
-                'Lead Date Created': dupe['date_created'],
-                'Close URL': 'https://app.close.com/lead/%s/' % dupe['id'],
-            }
-        )
-    print(
-        f"{(keys_with_dupes_custom_field.index(custom_field_value) + 1)} of {len(keys_with_dupes_custom_field)}: {custom_field_value}"
+if args.field == 'all':
+    fields = ['lead_name', 'email', 'contact_name', 'phone', 'url']
+    if args.custom_field_name:
+        fields.append('custom')
+elif args.field == 'fuzzy_lead_name':
+    fields = []
+else:
+    fields = [args.field]
+if args.merge and not set(args.merge_fields) <= set(fields):
+    parser.error(
+        f'--merge-fields {" ".join(args.merge_fields)} must be compared by '
+        f'--field {args.field}'
     )
+index = DuplicateIndex(
+    fields,
+    custom_field_name=args.custom_field_name,
+    contact_keys=ContactKeys(fold_gmail=args.fold_gmail),
+)
 
-
-# Add to a list of duplicates for contact emails
-def get_duplicates_for_email(email):
-    for dupe in emails[email]:
-        email_duplicates.append(
-            {
-                'Email Address': email,
-                'Lead Name': dupe['display_name'],
-                'Status Label': dupe['status_label'],
-                'Lead ID': dupe['id'],
-                'Lead Date Created': dupe['date_created'],
-                'Close URL': 'https://app.close.com/lead/%s/' % dupe['id'],
-            }
-        )
-    print(
-        f"{(keys_with_dupes_email.index(email) + 1)} of {len(keys_with_dupes_email)}: {email}"
+store = None
+query = '*'
+if args.index_db:
+    store = DedupeStore(
+        args.index_db,
+        {
+            'org_id': org_id,
+            'fields': fields,
+            'custom_field_name': args.custom_field_name,
+            'fold_gmail': args.fold_gmail,
+        },
     )
-
-
-# Add to a list of duplicates for contact emails
-def get_duplicates_for_contact_name(contact_name):
-    for dupe in contact_names[contact_name]:
-        contact_name_duplicates.append(
-            {
-                'Contact Name': contact_name,
-                'Lead Name': dupe['display_name'],
-                'Status Label': dupe['status_label'],
-                'Lead ID': dupe['id'],
-                'Lead Date Created': dupe['date_created'],
-                'Close URL': 'https://app.close.com/lead/%s/' % dupe['id'],
-            }
+    # Leads updated while this run is downloading are fetched again next
+    # time; the overlap covers clock skew between us and the API
+    sync_started_at = (
+        datetime.now(timezone.utc) - timedelta(minutes=SYNC_OVERLAP_MINUTES)
+    ).isoformat()
+    # Deletions are only known from the event log, so a store synced before
+    # the oldest event it keeps is rebuilt from a full scan
+    if store.synced_at and not api.event_log_covers(store.synced_at):
+        print(
+            f"{args.index_db} was last synced before the event log's "
+            "retention, rescanning every lead"
         )
-    print(
-        f"{(keys_with_dupes_contact_name.index(contact_name) + 1)} of {len(keys_with_dupes_contact_name)}: {contact_name}"
-    )
-
+        store.clear()
+    if store.synced_at:
+        query = f'updated >= "{store.synced_at}"'
 
-# Add to a list of duplicates for contact phones
-def get_duplicates_for_phone(phone):
-    for dupe in phones[phone]:
-        phone_duplicates.append(
-            {
-                'Phone Number': phone,
-                'Lead Name': dupe['display_name'],
-                'Status Label': dupe['status_label'],
-                'Lead ID': dupe['id'],
-                'Lead Date Created': dupe['date_created'],
-                'Close URL': 'https://app.close.com/lead/%s/' % dupe['id'],
-            }
-        )
-    print(
-        f"{(keys_with_dupes_phone.index(phone) + 1)} of {len(keys_with_dupes_phone)}: {phone}"
+print("Getting Leads...")
+# Worker processes spool key batches rather than leads, so they resume from a
+# checkpoint of their own
+checkpoint_mode = '_processes' if args.processes > 1 else ''
+# A scan with another query (a full scan rather than an incremental one) or
+# other lead fields and keys can't continue this one
+scan_id = hashlib.sha1(
+    json.dumps(
+        [query, args.custom_field_name, args.fold_gmail, fields]
+    ).encode('utf-8')
+).hexdigest()[:12]
+checkpoint = ScanCheckpoint(
+    f'.find_duplicate_leads_{org_id}_{args.field}_{scan_id}'
+    f'{checkpoint_mode}.checkpoint',
+    resume=args.resume,
+)
+# A snapshot has the leads locally already, so there's nothing to spread over
+# worker processes
+use_processes = args.processes > 1 and not args.snapshot
+if args.snapshot:
+    leads = LeadSnapshot(args.snapshot, api).iter_leads(
+        query, fields=lead_params_fields
     )
-
-
-# Add to a list of duplicates for lead URLs
-def get_duplicates_for_url(url):
-    for dupe in urls[url]:
-        url_duplicates.append(
-            {
-                'URL Hostname': url,
-                'Lead Name': dupe['display_name'],
-                'Status Label': dupe['status_label'],
-                'Lead ID': dupe['id'],
-                'Lead Date Created': dupe['date_created'],
-                'Close URL': 'https://app.close.com/lead/%s/' % dupe['id'],
-            }
-        )
-    print(
-        f"{(keys_with_dupes_url.index(url) + 1)} of {len(keys_with_dupes_url)}: {url}"
+    leads_keys = ((lead, index.lead_keys(lead)) for lead in leads)
+elif use_processes:
+    batches = iter_key_batches_with_slices(
+        api,
+        args.api_key,
+        index,
+        query,
+        fields=lead_params_fields,
+        processes=args.processes,
+        checkpoint=checkpoint,
     )
-
-
-print("Getting Leads...")
-pool.map(get_leads_slice, slices)
-leads = sorted(leads, key=itemgetter('date_created'))
-
-# Process duplicates
-lead_names = {}
-custom_fields = {}
-contact_names = {}
-emails = {}
-phones = {}
-urls = {}
-keys_with_dupes_lead_name = []
-keys_with_dupes_custom_field = []
-keys_with_dupes_contact_name = []
-keys_with_dupes_email = []
-keys_with_dupes_phone = []
-keys_with_dupes_url = []
-
-for lead in leads:
-    if args.field in ['all', 'lead_name']:
-        # Pouplate a dictionary of duplicate lead names, and keep track of those that appear more than once
-        lower_name = lead['display_name'].strip().lower()
-        if lead_names.get(lower_name) and lead not in lead_names[lower_name]:
-            lead_names[lower_name].append(lead)
-            keys_with_dupes_lead_name.append(lower_name)
-        elif not lead_names.get(lower_name):
-            lead_names[lower_name] = [lead]
-
-    if args.field == 'custom':
-        custom_field_value = lead['custom'].get(args.custom_field_name)
-        if isinstance(custom_field_value, list):
-            custom_field_value = ','.join(custom_field_value)
-
-        if custom_field_value:
-            if (
-                custom_fields.get(custom_field_value)
-                and lead not in custom_fields[custom_field_value]
-            ):
-                custom_fields[custom_field_value].append(lead)
-                keys_with_dupes_custom_field.append(custom_field_value)
-            elif not custom_fields.get(custom_field_value):
-                custom_fields[custom_field_value] = [lead]
-
-    if args.field in ['all', 'url']:
-        # Pouplate a dictionary of duplicate lead urls, and keep track of those that appear more than once
-        if lead.get('url'):
-            host_name = urlparse(lead['url']).hostname.lower()
-            if urls.get(host_name) and lead not in urls[host_name]:
-                urls[host_name].append(lead)
-                keys_with_dupes_url.append(host_name)
-            elif not urls.get(host_name):
-                urls[host_name] = [lead]
-
-    if args.field in ['all', 'email', 'phone', 'contact_name']:
-        for contact in lead['contacts']:
-            if args.field in ['all', 'contact_name']:
-                if not contact['name']:
-                    continue
-
-                contact_name = contact['name'].strip().lower()
-                if (
-                    contact_names.get(contact_name)
-                    and lead not in contact_names[contact_name]
-                ):
-                    contact_names[contact_name].append(lead)
-                    keys_with_dupes_contact_name.append(contact_name)
-                elif not contact_names.get(contact_name):
-                    contact_names[contact_name] = [lead]
-
-            # Populate a dictionary of emails, and keep track of those that appear more than once
-            if args.field in ['all', 'email']:
-                for email in contact['emails']:
-                    if (
-                        emails.get(email['email'])
-                        and lead not in emails[email['email']]
-                    ):
-                        emails[email['email']].append(lead)
-                        keys_with_dupes_email.append(email['email'])
-                    elif not emails.get(email['email']):
-                        emails[email['email']] = [lead]
-
-            # Populate a dictionary of phones, and keep track of those that appear more than once
-            if args.field in ['all', 'phone']:
-                for phone in contact['phones']:
-                    if (
-                        phones.get(phone['phone'])
-                        and lead not in phones[phone['phone']]
-                    ):
-                        phones[phone['phone']].append(lead)
-                        keys_with_dupes_phone.append(phone['phone'])
-                    elif not phones.get(phone['phone']):
-                        phones[phone['phone']] = [lead]
-
-if args.field in ['all', 'lead_name']:
-    lead_name_duplicates = []
-    print("Getting lead name duplicate data...")
-    keys_with_dupes_lead_name = list(set(keys_with_dupes_lead_name))
-    pool.map(get_duplicates_for_lead_name, keys_with_dupes_lead_name)
-
-    # Sort the duplicates alphabetically and write them to a CSV
-    lead_name_duplicates = sorted(
-        lead_name_duplicates, key=itemgetter('Lead Name')
+    leads_keys = (item for batch in batches for item in batch.items())
+else:
+    leads = api.iter_leads_with_slices(
+        query, fields=lead_params_fields, checkpoint=checkpoint
     )
-    write_to_csv_file(
-        "Lead Name",
-        lead_name_duplicates,
-        [
-            'Lead Name',
-            'Status Label',
-            'Lead Date Created',
-            'Lead ID',
-            'Close URL',
-        ],
+    leads_keys = ((lead, index.lead_keys(lead)) for lead in leads)
+
+# Index every lead by all the requested fields in a single pass
+if store is not None:
+    print(f"Updated {store.update(leads_keys)} leads in {args.index_db}")
+    if store.synced_at:
+        deleted_lead_ids = api.get_deleted_lead_ids(store.synced_at)
+        print(f"Removed {store.delete(deleted_lead_ids)} deleted leads")
+    store.mark_synced(sync_started_at)
+    store.load(index)
+    store.close()
+elif use_processes:
+    for batch in batches:
+        index.add_batch(batch)
+else:
+    index.add_many(leads)
+
+for field in fields:
+    write_duplicates(field)
+
+if args.field == 'fuzzy_lead_name':
+    print("Getting fuzzy lead name duplicate data...")
+    groups = fuzzy_groups(
+        [lead['display_name'] for lead in index.leads],
+        threshold=args.similarity_threshold,
     )
-
-if args.field == 'custom':
-    custom_field_name = args.custom_field_name
-
-    custom_field_duplicates = []
-    print(f"Getting custom field `{custom_field_name}` duplicate data...")
-    keys_with_dupes_lead_name = list(set(keys_with_dupes_custom_field))
-    pool.map(get_duplicates_for_custom_field, keys_with_dupes_custom_field)
-
-    # Sort the duplicates alphabetically and write them to a CSV
-    custom_field_duplicates = sorted(
-        custom_field_duplicates, key=itemgetter(f'custom.{custom_field_name}')
+    groups = sorted(
+        map(index.leads_by_date_created, groups),
+        key=lambda leads: leads[0]['display_name'].lower(),
+    )
+    fuzzy_duplicates = (
+        {
+            'Group ID': group_id,
+            'Lead Name': dupe['display_name'],
+            'Status Label': dupe['status_label'],
+            'Lead ID': dupe['id'],
+            'Lead Date Created': dupe['date_created'],
+            'Close URL': 'https://app.close.com/lead/%s/' % dupe['id'],
+        }
+        for group_id, dupes in enumerate(groups, 1)
+        for dupe in dupes
     )
     write_to_csv_file(
-        f'Custom - {custom_field_name}',
-        custom_field_duplicates,
+        "Fuzzy Lead Name",
+        fuzzy_duplicates,
         [
-            f'custom.{custom_field_name}',
+            'Group ID',
             'Lead Name',
             'Status Label',
             'Lead Date Created',
@@ -357,21 +364,25 @@ if args.field == 'custom':
         ],
     )
 
-if args.field in ['all', 'email']:
-    email_duplicates = []
-    print("Getting email duplicate data...")
-    keys_with_dupes_email = list(set(keys_with_dupes_email))
-    pool.map(get_duplicates_for_email, keys_with_dupes_email)
-
-    # Sort the duplicates alphabetically and write them to a CSV
-    email_duplicates = sorted(
-        email_duplicates, key=itemgetter('Email Address')
+if args.clusters:
+    print("Getting duplicate clusters...")
+    cluster_duplicates = (
+        {
+            'Cluster ID': cluster_id,
+            'Lead Name': dupe['display_name'],
+            'Status Label': dupe['status_label'],
+            'Lead ID': dupe['id'],
+            'Lead Date Created': dupe['date_created'],
+            'Close URL': 'https://app.close.com/lead/%s/' % dupe['id'],
+        }
+        for cluster_id, dupes in index.clusters()
+        for dupe in dupes
     )
     write_to_csv_file(
-        "Email",
-        email_duplicates,
+        "Cluster",
+        cluster_duplicates,
         [
-            'Email Address',
+            'Cluster ID',
             'Lead Name',
             'Status Label',
             'Lead Date Created',
@@ -380,67 +391,64 @@ if args.field in ['all', 'email']:
         ],
     )
 
-if args.field in ['all', 'contact_name']:
-    contact_name_duplicates = []
-    print("Getting contact duplicate data...")
-    keys_with_dupes_contact_name = list(set(keys_with_dupes_contact_name))
-    pool.map(get_duplicates_for_contact_name, keys_with_dupes_contact_name)
-
-    # Sort the duplicates alphabetically and write them to a CSV
-    contact_name_duplicates = sorted(
-        contact_name_duplicates, key=itemgetter('Contact Name')
+if args.merge:
+    plans = list(
+        plan_merges(
+            index.clusters(args.merge_fields), SURVIVOR_RULES[args.survivor]
+        )
     )
-    write_to_csv_file(
-        "Contact Name",
-        contact_name_duplicates,
-        [
-            'Contact Name',
-            'Lead Name',
-            'Status Label',
-            'Lead Date Created',
-            'Lead ID',
-            'Close URL',
-        ],
+    too_large = sum(
+        is_too_large(plan, args.max_cluster_size) for plan in plans
     )
-
-if args.field in ['all', 'phone']:
-    phone_duplicates = []
-    print("Getting phone duplicate data...")
-    keys_with_dupes_phone = list(set(keys_with_dupes_phone))
-    pool.map(get_duplicates_for_phone, keys_with_dupes_phone)
-
-    # Sort the duplicates alphabetically and write them to a CSV
-    phone_duplicates = sorted(phone_duplicates, key=itemgetter('Phone Number'))
-    write_to_csv_file(
-        "Phone",
-        phone_duplicates,
-        [
-            'Phone Number',
-            'Lead Name',
-            'Status Label',
-            'Lead Date Created',
-            'Lead ID',
-            'Close URL',
-        ],
+    if too_large:
+        print(
+            f"Not merging {too_large} clusters of more than "
+            f"{args.max_cluster_size} leads, they're listed as '{TOO_LARGE}'"
+        )
+    if args.confirmed:
+        print("Merging duplicate clusters...")
+        journal = MergeJournal(f'.find_duplicate_leads_{org_id}.merges.jsonl')
+        merged = merge_clusters(
+            api,
+            plans,
+            journal,
+            concurrency=args.merge_concurrency,
+            max_cluster_size=args.max_cluster_size,
+        )
+    else:
+        print("DRY RUN: Planning duplicate cluster merges...")
+
+        def dry_run(plan):
+            cluster_id, destination, sources = plan
+            outcome = (
+                TOO_LARGE
+                if is_too_large(plan, args.max_cluster_size)
+                else 'dry run'
+            )
+            return cluster_id, destination, [(s, outcome) for s in sources]
+
+        merged = map(dry_run, plans)
+    merge_results = (
+        {
+            'Cluster ID': cluster_id,
+            'Destination Lead ID': destination['id'],
+            'Destination Lead Name': destination['display_name'],
+            'Source Lead ID': source['id'],
+            'Source Lead Name': source['display_name'],
+            'Outcome': outcome,
+        }
+        for cluster_id, destination, outcomes in merged
+        for source, outcome in outcomes
     )
-
-if args.field in ['all', 'url']:
-    url_duplicates = []
-    print("Getting URL duplicate data...")
-    keys_with_dupes_url = list(set(keys_with_dupes_url))
-    pool.map(get_duplicates_for_url, keys_with_dupes_url)
-
-    # Sort the duplicates alphabetically and write them to a CSV
-    url_duplicates = sorted(url_duplicates, key=itemgetter('URL Hostname'))
     write_to_csv_file(
-        "URL",
-        url_duplicates,
+        "Merge",
+        merge_results,
         [
-            'URL Hostname',
-            'Lead Name',
-            'Status Label',
-            'Lead Date Created',
-            'Lead ID',
-            'Close URL',
+            'Cluster ID',
+            'Destination Lead ID',
+            'Destination Lead Name',
+            'Source Lead ID',
+            'Source Lead Name',
+            'Outcome',
         ],
     )
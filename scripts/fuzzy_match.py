@@ -0,0 +1,159 @@
+"""
+Fuzzy matching of company names without comparing every pair of leads.
+
+Names are normalized (case, accents, punctuation and legal suffixes such as
+"Inc." or "LLC" are dropped), cut into character shingles and summarized by a
+MinHash signature. Locality sensitive hashing over bands of the signature
+only puts names that are likely to be similar into the same bucket, and only
+pairs sharing a bucket get their actual Jaccard similarity computed. Work is
+roughly linear in the number of distinct names instead of quadratic.
+
+    groups = fuzzy_groups(['Acme Inc.', 'ACME, Inc', 'Globex'], threshold=0.8)
+    # [[0, 1]]
+"""
+import hashlib
+import re
+from array import array
+from collections import defaultdict
+
+from unidecode import unidecode
+
+from scripts.duplicate_index import DisjointSet
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 64
+SHINGLE_SIZE = 3
+
+# Dropped from the end of company names before comparing them.
+LEGAL_SUFFIXES = {
+    'co', 'company', 'corp', 'corporation', 'inc', 'incorporated', 'llc',
+    'llp', 'lp', 'ltd', 'limited', 'plc', 'gmbh', 'ag', 'sa', 'sarl', 'srl',
+    'bv', 'nv', 'oy', 'ab', 'as', 'pty', 'pte', 'kg', 'spa',
+}
+
+NON_ALPHANUMERIC_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_company_name(name):
+    """`ACME, Inc.` -> `acme`"""
+    words = NON_ALPHANUMERIC_RE.sub(' ', unidecode(name or '').lower()).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return ' '.join(words)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Character shingles of `text`, padded so short names still get some."""
+    text = f' {text} '
+    if len(text) <= size:
+        return {text}
+    return {text[i : i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def lsh_bands(threshold, num_perm):
+    """
+    Pick `(bands, rows)` with `bands * rows <= num_perm` so the probability
+    curve of two names sharing a bucket, `1 - (1 - s**rows)**bands`, rises
+    around `threshold`.
+    """
+    return min(
+        ((num_perm // rows, rows) for rows in range(1, num_perm + 1)),
+        key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold),
+    )
+
+
+class MinHasher:
+    """
+    MinHash signatures whose `num_perm` hash functions are the 32-bit words
+    of a SHAKE-128 digest of each shingle. Company names share a small
+    vocabulary of trigrams, so the digests are cached and a signature is an
+    element-wise minimum over cached arrays.
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM):
+        self.num_perm = num_perm
+        self._hashes = {}
+
+    def _shingle_hashes(self, shingle):
+        hashes = self._hashes.get(shingle)
+        if hashes is None:
+            digest = hashlib.shake_128(shingle.encode('utf-8'))
+            hashes = self._hashes[shingle] = array(
+                'I', digest.digest(4 * self.num_perm)
+            )
+        return hashes
+
+    def signature(self, shingle_set):
+        return tuple(map(min, zip(*map(self._shingle_hashes, shingle_set))))
+
+
+class MinHashLSH:
+    """Buckets MinHash signatures by band to find candidate pairs."""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM):
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self.buckets = [defaultdict(list) for _ in range(self.bands)]
+
+    def add(self, item, signature):
+        for band, buckets in enumerate(self.buckets):
+            start = band * self.rows
+            buckets[signature[start : start + self.rows]].append(item)
+
+    def candidate_pairs(self):
+        pairs = set()
+        for buckets in self.buckets:
+            for items in buckets.values():
+                for i, a in enumerate(items):
+                    for b in items[i + 1 :]:
+                        pairs.add((a, b) if a < b else (b, a))
+        return pairs
+
+
+def fuzzy_groups(
+    names, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, stats=None
+):
+    """
+    Return lists of positions in `names` whose normalized names are equal or
+    have a shingle Jaccard similarity of at least `threshold`, transitively.
+    Only groups of two or more names are returned. If `stats` is a dict, the
+    number of distinct names and scored candidate pairs are stored in it.
+    """
+    # Names that normalize to the same string are matched exactly, so LSH
+    # only has to deal with each distinct name once
+    positions_by_name = defaultdict(list)
+    for position, name in enumerate(names):
+        normalized = normalize_company_name(name)
+        if normalized:
+            positions_by_name[normalized].append(position)
+    distinct = list(positions_by_name)
+
+    hasher = MinHasher(num_perm)
+    lsh = MinHashLSH(threshold, num_perm)
+    shingle_sets = []
+    for n, name in enumerate(distinct):
+        shingle_sets.append(shingles(name))
+        lsh.add(n, hasher.signature(shingle_sets[n]))
+
+    disjoint_set = DisjointSet(len(distinct))
+    candidates = lsh.candidate_pairs()
+    for a, b in candidates:
+        if jaccard(shingle_sets[a], shingle_sets[b]) >= threshold:
+            disjoint_set.union(a, b)
+
+    if stats is not None:
+        stats.update(
+            distinct_names=len(distinct), candidate_pairs=len(candidates)
+        )
+
+    groups = defaultdict(list)
+    for n, name in enumerate(distinct):
+        groups[disjoint_set.find(n)].extend(positions_by_name[name])
+    return [
+        sorted(positions) for positions in groups.values() if len(positions) > 1
+    ]
@@ -5,9 +5,11 @@ import json
 import gevent.monkey
 gevent.monkey.patch_all()
 
-from closeio_api import APIError, Client as CloseIO_API
+from closeio_api import APIError
 from gevent.pool import Pool
 
+from scripts.CloseApiWrapper import CloseApiWrapper
+
 
 
 parser = argparse.ArgumentParser(
@@ -16,14 +18,11 @@ parser = argparse.ArgumentParser(
 parser.add_argument('--api-key', '-k', required=True, help='API Key')
 parser.add_argument('--jsonfile', '-j', required=True, help='JSON File Path')
 args = parser.parse_args()
-api = CloseIO_API(args.api_key)
+api = CloseApiWrapper(args.api_key)
 
 # Create a list of active users for the sake of posting opps and activities.
-me = api.get('me')
-org = api.get(
-    'organization/' + me['organizations'][0]['id'],
-    params={'_fields': 'memberships,inactive_memberships,name'},
-)
+me = api.get_me()
+org = api.get_organization()
 org_name = org['name']
 active_users = [i['user_id'] for i in org['memberships']]
 all_users = active_users + [i['user_id'] for i in org['inactive_memberships']]
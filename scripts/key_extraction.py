@@ -0,0 +1,277 @@
+"""
+Duplicate key extraction spread over worker processes.
+
+Decoding lead JSON and extracting keys from it is CPU bound, so on orgs with
+millions of leads a single gevent process is limited to one core. Here each
+worker process fetches whole lead slices itself and only sends back a
+`KeyBatch`: the lead summaries plus, for every field, a list of keys and a
+parallel array of the lead (within the batch) each key belongs to. The parent
+merges batches into its `DuplicateIndex` with `add_batch`.
+
+Workers are plain subprocesses (`python -m scripts.key_extraction`) driven
+through gevent pipes, since `multiprocessing` doesn't mix with gevent's
+monkey patching. Slices are handed out one at a time, so a worker that got a
+large slice doesn't hold up the others. The API key is passed to workers in
+the environment rather than on their command line. Each worker paces its
+requests to an equal share of the rate limit, since every one of them sees
+the same org-wide `RateLimit` headers.
+
+    batches = iter_key_batches_with_slices(
+        api, api_key, index, fields=['id', 'contacts'], processes=4
+    )
+    for batch in batches:
+        index.add_batch(batch)
+"""
+import json
+import os
+import pickle
+import struct
+import sys
+from array import array
+from collections import deque
+
+import gevent
+from gevent import subprocess
+from gevent.queue import Queue
+
+from scripts.CloseApiWrapper import (
+    BASE_URL_ENV_VAR,
+    RATE_LIMIT_SAFETY_FACTOR,
+    CloseApiWrapper,
+    RateLimitScheduler,
+)
+from scripts.contact_keys import ContactKeys
+from scripts.duplicate_index import (
+    LEAD_SUMMARY_FIELDS,
+    DuplicateIndex,
+    lead_summary,
+)
+
+# Environment variable the API key is handed to workers in.
+API_KEY_ENV_VAR = 'CLOSE_API_KEY'
+
+DEFAULT_PROCESSES = os.cpu_count() or 1
+
+# Batches are sent back pickled, each prefixed with its length.
+FRAME_HEADER = struct.Struct('>Q')
+
+
+class KeyBatch:
+    """
+    Keys of a batch of leads. `leads` holds one tuple of
+    `LEAD_SUMMARY_FIELDS` per lead, and `keys` maps each field to a list of
+    keys and an `array('I')` of the index in `leads` each key belongs to.
+    """
+
+    def __init__(self, leads=None, keys=None):
+        self.leads = leads if leads is not None else []
+        self.keys = keys if keys is not None else {}
+
+    @classmethod
+    def from_leads(cls, index, leads):
+        """Extract the keys of `leads` with a `DuplicateIndex`."""
+        batch = cls(keys={field: ([], array('I')) for field in index.fields})
+        for i, lead in enumerate(leads):
+            batch.leads.append(tuple(lead_summary(lead).values()))
+            for field, keys in index.lead_keys(lead).items():
+                field_keys, lead_indexes = batch.keys[field]
+                field_keys.extend(keys)
+                lead_indexes.extend([i] * len(keys))
+        return batch
+
+    def __len__(self):
+        return len(self.leads)
+
+    def iter_leads(self):
+        """Summaries of the batch's leads, as dicts."""
+        for lead in self.leads:
+            yield dict(zip(LEAD_SUMMARY_FIELDS, lead))
+
+    def items(self):
+        """Yield `(summary, {field: [keys]})` for every lead."""
+        lead_keys = [{} for _ in self.leads]
+        for field, (keys, lead_indexes) in self.keys.items():
+            for key, i in zip(keys, lead_indexes):
+                lead_keys[i].setdefault(field, []).append(key)
+        return zip(self.iter_leads(), lead_keys)
+
+    def to_json(self):
+        return {
+            'leads': self.leads,
+            'keys': {
+                field: [keys, list(lead_indexes)]
+                for field, (keys, lead_indexes) in self.keys.items()
+            },
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            leads=[tuple(lead) for lead in data['leads']],
+            keys={
+                field: (keys, array('I', lead_indexes))
+                for field, (keys, lead_indexes) in data['keys'].items()
+            },
+        )
+
+
+def _write_frame(f, data):
+    f.write(FRAME_HEADER.pack(len(data)) + data)
+    f.flush()
+
+
+def _read_frame(f):
+    """Read one frame written by `_write_frame`, or None at end of file."""
+    header = f.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    data = f.read(size)
+    return data if len(data) == size else None
+
+
+def iter_key_batches(
+    api_key,
+    index,
+    query,
+    slices,
+    fields=None,
+    processes=DEFAULT_PROCESSES,
+    base_url=None,
+):
+    """
+    Yield `(lead_slice, KeyBatch)` for each of `slices` of the leads matching
+    `query`, in the order workers finish them. Keys are extracted the same
+    way `index` extracts them.
+    """
+    pending = deque(slices)
+    results = Queue()
+    num_workers = min(processes, len(pending))
+
+    job = {
+        'query': query,
+        'fields': fields,
+        'index_fields': index.fields,
+        'custom_field_name': index.custom_field_name,
+        'fold_gmail': index.contact_keys.fold_gmail,
+        'rate_limit_share': 1 / max(num_workers, 1),
+    }
+    env = dict(os.environ, **{API_KEY_ENV_VAR: api_key})
+    if base_url:
+        env[BASE_URL_ENV_VAR] = base_url
+
+    def _run_worker():
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'scripts.key_extraction'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+        finished = False
+        try:
+            proc.stdin.write(json.dumps(job).encode('utf-8') + b'\n')
+            while pending:
+                lead_slice = pending.popleft()
+                line = json.dumps(lead_slice) + '\n'
+                proc.stdin.write(line.encode('utf-8'))
+                proc.stdin.flush()
+                frame = _read_frame(proc.stdout)
+                if frame is None:
+                    raise RuntimeError(
+                        f'Key extraction worker exited with {proc.wait()} '
+                        f'on lead slice {lead_slice}'
+                    )
+                lead_slice, leads, keys = pickle.loads(frame)
+                results.put((lead_slice, KeyBatch(leads, keys)))
+            finished = True
+        except Exception as e:
+            results.put(e)
+        finally:
+            proc.stdin.close()
+            if not finished:
+                proc.kill()
+            proc.wait()
+
+    workers = [gevent.spawn(_run_worker) for _ in range(num_workers)]
+    try:
+        for _ in range(len(pending)):
+            result = results.get()
+            if isinstance(result, Exception):
+                raise result
+            yield result
+    finally:
+        pending.clear()
+        gevent.killall(workers)
+
+
+def iter_key_batches_with_slices(
+    api,
+    api_key,
+    index,
+    query='*',
+    fields=None,
+    processes=DEFAULT_PROCESSES,
+    checkpoint=None,
+    **kwargs,
+):
+    """
+    `iter_key_batches` over the slices planned by `plan_lead_slices`. Like
+    `CloseApiWrapper.iter_leads_with_slices`, a `ScanCheckpoint` journals the
+    slice plan and spools every finished batch, so a resumed scan only
+    fetches the remaining slices.
+    """
+    if checkpoint and checkpoint.get('slices') is not None:
+        slices = [tuple(s) for s in checkpoint.get('slices')]
+        done = {tuple(s) for s in checkpoint.get('done_slices', [])}
+        for data in checkpoint.iter_spooled():
+            yield KeyBatch.from_json(data)
+    else:
+        slices = api.plan_lead_slices(query, **kwargs)
+        done = set()
+        if checkpoint:
+            checkpoint.commit(slices=slices, done_slices=[])
+
+    batches = iter_key_batches(
+        api_key,
+        index,
+        query,
+        [s for s in slices if s not in done],
+        fields=fields,
+        processes=processes,
+        base_url=api.base_url,
+    )
+    for lead_slice, batch in batches:
+        if checkpoint:
+            done.add(tuple(lead_slice))
+            checkpoint.spool([batch.to_json()], done_slices=sorted(done))
+        yield batch
+
+    if checkpoint:
+        checkpoint.clear()
+
+
+def worker_main():
+    """Read a job and then lead slices from stdin, pickle batches to stdout."""
+    job = json.loads(sys.stdin.readline())
+    api = CloseApiWrapper(os.environ[API_KEY_ENV_VAR])
+    # The other workers draw from the same org-wide limit
+    api.scheduler = RateLimitScheduler(
+        RATE_LIMIT_SAFETY_FACTOR * job['rate_limit_share']
+    )
+    index = DuplicateIndex(
+        job['index_fields'],
+        custom_field_name=job['custom_field_name'],
+        contact_keys=ContactKeys(fold_gmail=job['fold_gmail']),
+    )
+    for line in sys.stdin:
+        lead_slice = tuple(json.loads(line))
+        leads = api.iter_lead_slice(job['query'], lead_slice, job['fields'])
+        batch = KeyBatch.from_leads(index, leads)
+        # Plain data only: this module runs as __main__ in workers, so
+        # pickled KeyBatch instances wouldn't load in the parent
+        frame = pickle.dumps((lead_slice, batch.leads, batch.keys))
+        _write_frame(sys.stdout.buffer, frame)
+
+
+if __name__ == '__main__':
+    worker_main()
@@ -0,0 +1,176 @@
+"""
+Merge clusters of duplicate leads into one surviving lead each.
+
+For every cluster a survivor is picked by one of `SURVIVOR_RULES` and all
+other leads are merged into it. Clusters are merged in parallel (every API
+call still goes through the wrapper's rate limit scheduler), while the merges
+within a cluster run one after the other since they share a destination.
+
+Every merge that went through is appended to a journal, so re-running after
+an interruption (or on the same report again) skips what's already done. A
+merge whose source turns out to be gone already, e.g. because it went through
+just before the journal write was interrupted, is journaled as done too.
+
+Merges can't be undone, so clusters are only built from keys that identify a
+lead well (emails by default) and clusters of more than `max_cluster_size`
+leads aren't merged at all: one generic key, e.g. a switchboard phone number,
+is enough to chain unrelated leads into one large cluster.
+
+    journal = MergeJournal('merges.jsonl')
+    plans = plan_merges(
+        index.clusters(DEFAULT_MERGE_FIELDS), SURVIVOR_RULES['oldest']
+    )
+    for cluster_id, destination, outcomes in merge_clusters(
+        api, plans, journal
+    ):
+        ...
+"""
+import json
+import logging
+import os
+
+from closeio_api import APIError
+from gevent.pool import Pool
+
+# Clusters merged in parallel.
+DEFAULT_CONCURRENCY = 4
+
+# Fields whose shared keys link leads into the clusters that are merged. Lead
+# names and URL hostnames are left out since placeholder names and hosts like
+# linkedin.com are shared by unrelated companies.
+DEFAULT_MERGE_FIELDS = ['email']
+
+# Clusters with more leads than this are reported instead of merged.
+DEFAULT_MAX_CLUSTER_SIZE = 10
+
+# Outcome of the leads of a cluster that's too large to merge.
+TOO_LARGE = 'cluster too large'
+
+
+def _oldest(lead):
+    return (lead['date_created'] or '', lead['id'])
+
+
+def _most_contacts(lead):
+    return (-(lead['num_contacts'] or 0),) + _oldest(lead)
+
+
+# Sort keys of lead summaries; the lead that sorts first survives.
+SURVIVOR_RULES = {
+    'oldest': _oldest,
+    'most_contacts': _most_contacts,
+}
+
+
+def plan_merges(clusters, survivor_key=_oldest):
+    """
+    Yield `(cluster_id, destination, sources)` for `(cluster_id, leads)`
+    clusters, e.g. from `DuplicateIndex.clusters`.
+    """
+    for cluster_id, leads in clusters:
+        destination, *sources = sorted(leads, key=survivor_key)
+        yield cluster_id, destination, sources
+
+
+class MergeJournal:
+    """JSON lines file of `{source, destination}` merges that went through."""
+
+    def __init__(self, path):
+        self.path = path
+        self.merged = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    # A line cut short by a crash is redone
+                    if line.endswith('\n'):
+                        merge = json.loads(line)
+                        self.merged[merge['source']] = merge['destination']
+
+    def is_merged(self, source_id):
+        return source_id in self.merged
+
+    def record(self, source_id, destination_id):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(
+                json.dumps(
+                    {'source': source_id, 'destination': destination_id}
+                )
+                + '\n'
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        self.merged[source_id] = destination_id
+
+
+def _lead_exists(api, lead_id):
+    """Whether `lead_id` still exists, or None if that can't be told."""
+    try:
+        api.get(f'lead/{lead_id}', params={'_fields': 'id'})
+    except APIError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return False
+        logging.error('Failed to look up lead %s: %s', lead_id, e)
+        return None
+    return True
+
+
+def merge_lead(api, journal, source_id, destination_id):
+    """
+    Merge `source_id` into `destination_id` unless the journal has it
+    already. Returns 'merged', 'skipped' or 'failed'.
+    """
+    if journal.is_merged(source_id):
+        return 'skipped'
+    try:
+        api.post(
+            'lead/merge',
+            data={'source': source_id, 'destination': destination_id},
+        )
+    except APIError as e:
+        if _lead_exists(api, source_id) is False:
+            journal.record(source_id, destination_id)
+            return 'skipped'
+        logging.error(
+            'Failed to merge %s into %s: %s', source_id, destination_id, e
+        )
+        return 'failed'
+    journal.record(source_id, destination_id)
+    return 'merged'
+
+
+def is_too_large(plan, max_cluster_size=DEFAULT_MAX_CLUSTER_SIZE):
+    _, _, sources = plan
+    return len(sources) + 1 > max_cluster_size
+
+
+def merge_clusters(
+    api,
+    plans,
+    journal,
+    concurrency=DEFAULT_CONCURRENCY,
+    max_cluster_size=DEFAULT_MAX_CLUSTER_SIZE,
+):
+    """
+    Carry out `plan_merges` output, yielding `(cluster_id, destination,
+    [(source, outcome)])` as each cluster is done. The sources of clusters
+    of more than `max_cluster_size` leads are left alone as `TOO_LARGE`.
+    """
+
+    def _merge_cluster(plan):
+        cluster_id, destination, sources = plan
+        if is_too_large(plan, max_cluster_size):
+            return cluster_id, destination, [(s, TOO_LARGE) for s in sources]
+        outcomes = []
+        for source in sources:
+            outcome = merge_lead(api, journal, source['id'], destination['id'])
+            outcomes.append((source, outcome))
+            # Leave the rest of the cluster alone if the survivor is gone, or
+            # if it can't be looked up either
+            if outcome == 'failed' and not _lead_exists(
+                api, destination['id']
+            ):
+                break
+        return cluster_id, destination, outcomes
+
+    pool = Pool(concurrency)
+    yield from pool.imap_unordered(_merge_cluster, plans)
@@ -0,0 +1,224 @@
+"""
+Local snapshot of an org's leads that lead-scanning scripts can read instead
+of crawling the API on every run.
+
+The snapshot is a SQLite file with one table per lead field (`id` to JSON
+value), so a script reading `id` and `addresses` never touches the pages
+holding everyone's contacts. Each refresh only downloads the leads updated
+since the previous one and drops the leads deleted (or merged away) since
+then. Asking for a field the snapshot doesn't have yet re-crawls every lead
+once with the old and new fields together, and so does refreshing a snapshot
+last refreshed longer ago than the event log reaches back.
+
+Search queries can't be evaluated locally, so for anything but `*` only the
+ids of the matching leads are fetched from the API (a small fraction of the
+full payload) and their fields are read from the snapshot:
+
+    snapshot = LeadSnapshot('leads.sqlite', api)
+    for lead in snapshot.iter_leads('contacts > 1', fields=['contacts']):
+        ...
+"""
+import json
+import logging
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+# Minutes before a refresh started that the next refresh fetches from, to
+# cover clock skew between us and the API.
+SYNC_OVERLAP_MINUTES = 5
+
+# Leads written per transaction while refreshing.
+BATCH_SIZE = 1000
+
+FIELD_NAME_RE = re.compile(r'^[A-Za-z0-9_]+$')
+
+
+def _table(field):
+    if not FIELD_NAME_RE.match(field):
+        raise ValueError(f'Unsupported lead field for a snapshot: {field!r}')
+    return f'"field_{field}"'
+
+
+class LeadSnapshot:
+    def __init__(self, path, api, **slice_kwargs):
+        """
+        Open (or create) the snapshot at `path`. `slice_kwargs` are passed
+        on to `CloseApiWrapper.iter_leads_with_slices` when refreshing.
+        """
+        self.path = path
+        self.api = api
+        self.slice_kwargs = slice_kwargs
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS meta ('
+            'name TEXT PRIMARY KEY, value TEXT)'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS leads ('
+            'id TEXT PRIMARY KEY, date_updated TEXT) WITHOUT ROWID'
+        )
+
+    def _get_meta(self, name, default=None):
+        row = self.db.execute(
+            'SELECT value FROM meta WHERE name = ?', (name,)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, name, value):
+        self.db.execute(
+            'INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)',
+            (name, json.dumps(value)),
+        )
+
+    @property
+    def fields(self):
+        """Lead fields kept in the snapshot."""
+        return self._get_meta('fields', [])
+
+    @property
+    def synced_at(self):
+        return self._get_meta('synced_at')
+
+    def _write(self, leads, fields):
+        count = 0
+        chunk = []
+        for lead in leads:
+            chunk.append(lead)
+            if len(chunk) == BATCH_SIZE:
+                count += self._write_chunk(chunk, fields)
+                chunk = []
+        if chunk:
+            count += self._write_chunk(chunk, fields)
+        return count
+
+    def _write_chunk(self, leads, fields):
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO leads (id, date_updated) '
+                'VALUES (?, ?)',
+                ((lead['id'], lead.get('date_updated')) for lead in leads),
+            )
+            for field in fields:
+                self.db.executemany(
+                    f'INSERT OR REPLACE INTO {_table(field)} (id, value) '
+                    'VALUES (?, ?)',
+                    (
+                        (lead['id'], json.dumps(lead.get(field)))
+                        for lead in leads
+                    ),
+                )
+        return len(leads)
+
+    def _delete(self, lead_ids):
+        lead_ids = [(lead_id,) for lead_id in lead_ids]
+        with self.db:
+            for field in self.fields:
+                self.db.executemany(
+                    f'DELETE FROM {_table(field)} WHERE id = ?', lead_ids
+                )
+            return self.db.executemany(
+                'DELETE FROM leads WHERE id = ?', lead_ids
+            ).rowcount
+
+    def refresh(self, fields=()):
+        """
+        Bring the snapshot up to date, adding `fields` to the ones it keeps.
+        Returns the number of leads downloaded.
+        """
+        fields = [f for f in fields if f not in ('id', 'date_updated')]
+        missing = [f for f in fields if f not in self.fields]
+        all_fields = self.fields + missing
+        for field in missing:
+            self.db.execute(
+                f'CREATE TABLE IF NOT EXISTS {_table(field)} ('
+                'id TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID'
+            )
+
+        since = None if missing else self.synced_at
+        if since and not self.api.event_log_covers(since):
+            # Leads deleted since then can't all be found in the event log
+            # anymore, so the snapshot is rebuilt from scratch
+            logging.info(
+                'Lead snapshot %s was last refreshed before the event log '
+                'retention, downloading every lead',
+                self.path,
+            )
+            since = None
+        started_at = datetime.now(timezone.utc) - timedelta(
+            minutes=SYNC_OVERLAP_MINUTES
+        )
+        query = f'updated >= "{since}"' if since else '*'
+        if missing and self.synced_at:
+            logging.info(
+                'Adding %s to lead snapshot %s, downloading every lead',
+                ', '.join(missing),
+                self.path,
+            )
+
+        leads = self.api.iter_leads_with_slices(
+            query,
+            fields=['id', 'date_updated'] + all_fields,
+            **self.slice_kwargs,
+        )
+        if since:
+            count = self._write(leads, all_fields)
+            self._delete(self.api.get_deleted_lead_ids(since))
+        else:
+            # A full crawl replaces everything, which also drops any lead
+            # deleted since the last refresh
+            with self.db:
+                self.db.execute('DELETE FROM leads')
+                for field in all_fields:
+                    self.db.execute(f'DELETE FROM {_table(field)}')
+            count = self._write(leads, all_fields)
+
+        with self.db:
+            self._set_meta('fields', all_fields)
+            self._set_meta('synced_at', started_at.isoformat())
+        return count
+
+    def iter_leads(self, query='*', fields=None, refresh=True):
+        """
+        Yield the leads matching `query` with `fields` (and `id`) from the
+        snapshot, refreshing it first unless `refresh` is False.
+        """
+        fields = [f for f in (fields or []) if f != 'id']
+        stored = [f for f in fields if f != 'date_updated']
+        if refresh or any(f not in self.fields for f in stored):
+            self.refresh(stored)
+
+        joins = ''.join(
+            f' JOIN {_table(f)} ON {_table(f)}.id = leads.id' for f in stored
+        )
+        if query and query != '*':
+            self.db.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS matching_leads '
+                '(id TEXT PRIMARY KEY) WITHOUT ROWID'
+            )
+            with self.db:
+                self.db.execute('DELETE FROM matching_leads')
+                self.db.executemany(
+                    'INSERT OR IGNORE INTO matching_leads (id) VALUES (?)',
+                    (
+                        (lead['id'],)
+                        for lead in self.api.iter_leads_with_slices(
+                            query, fields=['id'], **self.slice_kwargs
+                        )
+                    ),
+                )
+            joins += ' JOIN matching_leads ON matching_leads.id = leads.id'
+
+        columns = ''.join(f', {_table(f)}.value' for f in stored)
+        rows = self.db.execute(
+            f'SELECT leads.id, leads.date_updated{columns} FROM leads{joins}'
+        )
+        for lead_id, date_updated, *values in rows:
+            lead = {'id': lead_id}
+            if 'date_updated' in fields:
+                lead['date_updated'] = date_updated
+            lead.update(zip(stored, map(json.loads, values)))
+            yield lead
+
+    def close(self):
+        self.db.close()
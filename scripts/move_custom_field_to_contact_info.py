@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 import click
-from closeio_api import APIError, Client as CloseIO_API
+from closeio_api import APIError
+
+from scripts.CloseApiWrapper import CloseApiWrapper, ScanCheckpoint
 
 
 @click.command()
@@ -35,6 +37,11 @@ from closeio_api import APIError, Client as CloseIO_API
     default='contact title',
     help='Name of the custom field containing a contact\'s title.',
 )
+@click.option(
+    '--resume',
+    is_flag=True,
+    help='Continue an interrupted run from its last checkpoint instead of starting over.',
+)
 def run(
     api_key,
     confirmed,
@@ -43,6 +50,7 @@ def run(
     phones_custom_field='all phones',
     emails_custom_field='all emails',
     title_custom_field='contact title',
+    resume=False,
 ):
     """
     After an import from a different CRM, for all leads, move emails and phones that were put in
@@ -56,109 +64,102 @@ def run(
     print(f'title_custom_field: {title_custom_field}')
     print(f'use_existing_contact: {use_existing_contact}')
 
-    api = CloseIO_API(api_key)
-    has_more = True
-    offset = 0
-
-    while has_more:
+    api = CloseApiWrapper(api_key)
+    # A dry run doesn't migrate anything, so resuming a --confirmed run from
+    # its checkpoint would skip leads that were never migrated
+    checkpoint_mode = '_confirmed' if confirmed else ''
+    checkpoint = ScanCheckpoint(
+        f'.move_custom_field_to_contact_info_{api.get_organization_id()}'
+        f'{checkpoint_mode}.checkpoint',
+        resume=resume,
+    )
+
+    # The cursor moves forward by date_created and drops leads it already
+    # returned by id instead of skipping over them, so leads that drop out of
+    # the query once they're marked as migrated don't make it miss others.
+    for lead in api.iter_leads_by_cursor(
+        '"custom.Source CRM":* not "custom.Migration completed":*',
+        fields=['id', 'display_name', 'name', 'contacts', 'custom'],
+        checkpoint=checkpoint,
+    ):
+        contacts = lead['contacts']
+        custom = lead['custom']
+
+        company_emails = custom.get(emails_custom_field, '')
+        company_phones = custom.get(phones_custom_field, '')
+        contact_title = custom.get(title_custom_field, '')
+
+        if not company_phones and not company_emails and not contact_title:
+            continue
+
+        if company_emails:
+            if company_emails.startswith('["'):
+                company_emails = company_emails[2:-2].split('", "')
+            else:
+                company_emails = [company_emails]
 
-        # Get a page of leads
-        resp = api.get(
-            'lead',
-            params={
-                'query': '"custom.Source CRM":* not "custom.Migration completed":* sort:created',
-                '_skip': offset,
-                '_fields': 'id,display_name,name,contacts,custom',
-            },
+        if company_phones:
+            if company_phones.startswith('["'):
+                company_phones = company_phones[2:-2].split('", "')
+            else:
+                company_phones = [company_phones]
+
+        if contacts and use_existing_contact:
+            contact = contacts[0]
+        else:
+            contact = {'lead_id': lead['id'], 'phones': [], 'emails': []}
+            if new_contact_name:
+                contact['name'] = new_contact_name
+
+        for pn in company_phones:
+            contact['phones'].append({'type': 'office', 'phone': pn})
+        for e in company_emails:
+            contact['emails'].append({'type': 'office', 'email': e})
+        if contact_title:
+            contact['title'] = contact_title
+
+        print('Lead:', lead['id'], lead['name'].encode('utf8'))
+        print(
+            f'Emails: {custom.get(emails_custom_field)} => {company_emails}'
+        )
+        print(
+            f'Phones: {custom.get(phones_custom_field)} => {company_phones}'
+        )
+        print(
+            f'Title: {custom.get(title_custom_field)} => {contact_title}'
         )
-        leads = resp['data']
-
-        for lead in leads:
-            contacts = lead['contacts']
-            custom = lead['custom']
-
-            company_emails = custom.get(emails_custom_field, '')
-            company_phones = custom.get(phones_custom_field, '')
-            contact_title = custom.get(title_custom_field, '')
-
-            if not company_phones and not company_emails and not contact_title:
-                continue
-
-            if company_emails:
-                if company_emails.startswith('["'):
-                    company_emails = company_emails[2:-2].split('", "')
-                else:
-                    company_emails = [company_emails]
-
-            if company_phones:
-                if company_phones.startswith('["'):
-                    company_phones = company_phones[2:-2].split('", "')
-                else:
-                    company_phones = [company_phones]
 
-            if contacts and use_existing_contact:
-                contact = contacts[0]
-            else:
-                contact = {'lead_id': lead['id'], 'phones': [], 'emails': []}
-                if new_contact_name:
-                    contact['name'] = new_contact_name
-
-            for pn in company_phones:
-                contact['phones'].append({'type': 'office', 'phone': pn})
-            for e in company_emails:
-                contact['emails'].append({'type': 'office', 'email': e})
-            if contact_title:
-                contact['title'] = contact_title
-
-            print('Lead:', lead['id'], lead['name'].encode('utf8'))
-            print(
-                f'Emails: {custom.get(emails_custom_field)} => {company_emails}'
-            )
-            print(
-                f'Phones: {custom.get(phones_custom_field)} => {company_phones}'
-            )
-            print(
-                f'Title: {custom.get(title_custom_field)} => {contact_title}'
-            )
-
-            try:
-                if contact.get('id'):
-                    print('Updating an existing contact', contact['id'])
-                    if confirmed:
-                        api.put(
-                            'contact/%s' % contact['id'],
-                            data={
-                                'phones': contact['phones'],
-                                'emails': contact['emails'],
-                            },
-                        )
-                else:
-                    print('Creating a new contact')
-                    if confirmed:
-                        api.post('contact', data=contact)
-                print('Payload:', contact)
+        try:
+            if contact.get('id'):
+                print('Updating an existing contact', contact['id'])
                 if confirmed:
                     api.put(
-                        'lead/%s' % lead['id'],
-                        data={'custom.Migration completed': 'Yes'},
+                        'contact/%s' % contact['id'],
+                        data={
+                            'phones': contact['phones'],
+                            'emails': contact['emails'],
+                        },
                     )
-            except APIError as e:
-                print(str(e))
-                print('Payload:', contact)
+            else:
+                print('Creating a new contact')
                 if confirmed:
-                    api.put(
-                        'lead/%s' % lead['id'],
-                        data={'custom.Migration completed': 'skipped'},
-                    )
-
-            print()
-
-        if not confirmed:
-            # If we don't actually update the "Migration completed" custom field,
-            # we need to paginate
-            offset += len(leads)
-
-        has_more = resp['has_more']
+                    api.post('contact', data=contact)
+            print('Payload:', contact)
+            if confirmed:
+                api.put(
+                    'lead/%s' % lead['id'],
+                    data={'custom.Migration completed': 'Yes'},
+                )
+        except APIError as e:
+            print(str(e))
+            print('Payload:', contact)
+            if confirmed:
+                api.put(
+                    'lead/%s' % lead['id'],
+                    data={'custom.Migration completed': 'skipped'},
+                )
+
+        print()
 
     print('Done')
 
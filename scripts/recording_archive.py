@@ -0,0 +1,176 @@
+"""
+Call recordings packed into size-capped tar shards per day instead of one
+file each, which keeps folders with millions of recordings quick to list and
+back up.
+
+Shards live in a folder per day (`2024-01-05/recordings-2024-01-05-0000.tar`)
+and a new one is started once a shard would grow past `max_shard_size`.
+Every shard has an index next to it (`...-0000.index.jsonl`) with a line per
+recording: call id, member name, size, SHA-256 and the offset of its data in
+the shard. Recordings are stored uncompressed since MP3s don't compress any
+further, so a recording can be read straight from that offset without
+unpacking anything:
+
+    archive = RecordingArchive('recordings/')
+    archive.add('2024-01-05', call_id, 'close-recording-acti_1.mp3', path)
+    for chunk in archive.read_recording(call_id):
+        ...
+
+Each run starts new shards rather than appending to existing ones, so a
+shard cut short by a crash is never written to again; its index only lists
+recordings that were written completely.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import tarfile
+import threading
+
+from scripts.recording_downloads import file_checksum
+
+# Shards are closed once adding another recording would exceed this size.
+DEFAULT_MAX_SHARD_SIZE = 1024**3
+
+# Bytes read from a shard at a time.
+CHUNK_SIZE = 64 * 1024
+
+SHARD_NAME_RE = re.compile(r'^recordings-(.+)-(\d{4})\.tar$')
+
+
+def _index_path(shard_path):
+    return shard_path[: -len('.tar')] + '.index.jsonl'
+
+
+class RecordingArchive:
+    def __init__(self, directory, max_shard_size=DEFAULT_MAX_SHARD_SIZE):
+        self.directory = directory
+        self.max_shard_size = max_shard_size
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.next_shard_numbers = {}
+        # day -> (tar file, shard path, index file)
+        self.open_shards = {}
+
+        for index_path in glob.glob(
+            os.path.join(directory, '*', '*.index.jsonl')
+        ):
+            shard_path = index_path[: -len('.index.jsonl')] + '.tar'
+            with open(index_path, encoding='utf-8') as f:
+                for line in f:
+                    # A line cut short by a crash is downloaded again
+                    if line.endswith('\n'):
+                        entry = json.loads(line)
+                        entry['shard'] = shard_path
+                        self.entries[entry['call_id']] = entry
+
+        for shard_path in glob.glob(os.path.join(directory, '*', '*.tar')):
+            match = SHARD_NAME_RE.match(os.path.basename(shard_path))
+            if match:
+                day, number = match[1], int(match[2])
+                self.next_shard_numbers[day] = max(
+                    self.next_shard_numbers.get(day, 0), number + 1
+                )
+
+    def get(self, call_id):
+        """Index entry of `call_id` with the path of its `shard`, or None."""
+        return self.entries.get(call_id)
+
+    def is_downloaded(self, call_id, verify=False):
+        """
+        Whether the recording of `call_id` is in a shard, checking its
+        checksum too if `verify` is set.
+        """
+        entry = self.get(call_id)
+        if not entry:
+            return False
+        try:
+            shard_size = os.path.getsize(entry['shard'])
+        except OSError:
+            return False
+        if shard_size < entry['offset'] + entry['size']:
+            return False
+        if verify:
+            checksum = hashlib.sha256()
+            for chunk in self.read_recording(call_id):
+                checksum.update(chunk)
+            return checksum.hexdigest() == entry['sha256']
+        return True
+
+    def read_recording(self, call_id, chunk_size=CHUNK_SIZE):
+        """Yield the recording of `call_id` in chunks, read from its shard."""
+        entry = self.entries[call_id]
+        remaining = entry['size']
+        with open(entry['shard'], 'rb') as f:
+            f.seek(entry['offset'])
+            while remaining:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise EOFError(f'Shard {entry["shard"]} is truncated')
+                remaining -= len(chunk)
+                yield chunk
+
+    def _new_shard(self, day):
+        number = self.next_shard_numbers.get(day, 0)
+        self.next_shard_numbers[day] = number + 1
+        day_directory = os.path.join(self.directory, day)
+        os.makedirs(day_directory, exist_ok=True)
+        shard_path = os.path.join(
+            day_directory, f'recordings-{day}-{number:04d}.tar'
+        )
+        tar = tarfile.open(shard_path, 'w', format=tarfile.PAX_FORMAT)
+        index = open(_index_path(shard_path), 'a', encoding='utf-8')
+        self.open_shards[day] = (tar, shard_path, index)
+        return self.open_shards[day]
+
+    def _close_shard(self, day):
+        tar, _, index = self.open_shards.pop(day)
+        tar.close()
+        index.close()
+
+    def add(self, day, call_id, name, path, checksum=None):
+        """
+        Copy the file at `path` into the current shard of `day` as `name`,
+        given its SHA-256 `checksum` if it's known already. Returns its index
+        entry.
+        """
+        size = os.path.getsize(path)
+        checksum = checksum or file_checksum(path)
+        with self.lock:
+            if day in self.open_shards:
+                tar = self.open_shards[day][0]
+                if tar.members and tar.offset + size > self.max_shard_size:
+                    self._close_shard(day)
+            if day not in self.open_shards:
+                self._new_shard(day)
+            tar, shard_path, index = self.open_shards[day]
+
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.size = size
+            tarinfo.mtime = int(os.path.getmtime(path))
+            header_size = len(
+                tarinfo.tobuf(tar.format, tar.encoding, tar.errors)
+            )
+            offset = tar.offset + header_size
+            with open(path, 'rb') as f:
+                tar.addfile(tarinfo, f)
+            tar.fileobj.flush()
+            os.fsync(tar.fileobj.fileno())
+
+            entry = {
+                'call_id': call_id,
+                'name': name,
+                'offset': offset,
+                'size': size,
+                'sha256': checksum,
+            }
+            index.write(json.dumps(entry) + '\n')
+            index.flush()
+            os.fsync(index.fileno())
+            self.entries[call_id] = dict(entry, shard=shard_path)
+            return self.entries[call_id]
+
+    def close(self):
+        for day in list(self.open_shards):
+            self._close_shard(day)
@@ -0,0 +1,178 @@
+"""
+Streaming, resumable downloads of call recordings.
+
+Recordings are written to disk in `CHUNK_SIZE` pieces as they arrive, so a
+download only ever holds one chunk in memory however long the recording is.
+Each one goes to a `.part` file next to its destination that's renamed into
+place once it's complete, so an interrupted download never leaves a
+truncated recording under the final name. The next attempt picks the
+`.part` file up where it stopped with an HTTP Range request.
+
+All downloads share one `requests.Session` whose connection pool is sized to
+the number of concurrent downloads, so connections are reused instead of
+being set up again for every file.
+
+A `RecordingManifest` in the download folder remembers the size and SHA-256
+of every recording that was downloaded, so later runs over an overlapping
+date range skip the ones that are still there:
+
+    manifest = RecordingManifest(folder)
+    session = make_session(api_key, pool_size=5)
+    if not manifest.is_downloaded(call['id']):
+        size, checksum = download_to_file(session, call['url'], path)
+        manifest.record(call['id'], filename, size, checksum)
+"""
+import hashlib
+import os
+import sqlite3
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Bytes read from the response and written to disk at a time.
+CHUNK_SIZE = 64 * 1024
+
+# Recordings downloaded in parallel.
+DEFAULT_CONCURRENCY = 5
+
+# Seconds to wait for the connection and then for each chunk.
+TIMEOUT = (10, 60)
+
+# Suffix of the file a recording is downloaded to before it's complete.
+PART_SUFFIX = '.part'
+
+# Name of the manifest kept in the download folder.
+MANIFEST_NAME = '.recordings_manifest.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS recordings (
+    call_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+'''
+
+
+def make_session(api_key, pool_size=DEFAULT_CONCURRENCY):
+    """Session authenticated with `api_key` pooling `pool_size` connections."""
+    session = requests.Session()
+    session.auth = (api_key, '')
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _hash_file(path, checksum, chunk_size=CHUNK_SIZE):
+    """Feed the file at `path` to `checksum`. Returns its size."""
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checksum.update(chunk)
+            size += len(chunk)
+    return size
+
+
+def file_checksum(path):
+    checksum = hashlib.sha256()
+    _hash_file(path, checksum)
+    return checksum.hexdigest()
+
+
+def download_to_file(session, url, path, chunk_size=CHUNK_SIZE):
+    """
+    Stream `url` to `path`, replacing it atomically once the download is
+    complete and resuming a partial download left by an earlier attempt.
+    Returns the size and SHA-256 of the file.
+    """
+    part_path = path + PART_SUFFIX
+    checksum = hashlib.sha256()
+    size = _hash_file(part_path, checksum) if os.path.exists(part_path) else 0
+    headers = {'Range': f'bytes={size}-'} if size else {}
+    with session.get(
+        url, headers=headers, stream=True, timeout=TIMEOUT
+    ) as response:
+        if size and response.status_code == 416:
+            # The partial file doesn't fit the recording (anymore)
+            os.remove(part_path)
+            return download_to_file(session, url, path, chunk_size)
+        response.raise_for_status()
+        if response.status_code != 206:
+            # The server ignored the range and sent the whole recording
+            checksum = hashlib.sha256()
+            size = 0
+        with open(part_path, 'ab' if size else 'wb') as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                checksum.update(chunk)
+                size += len(chunk)
+    os.replace(part_path, path)
+    return size, checksum.hexdigest()
+
+
+class RecordingManifest:
+    """The recordings downloaded into `directory`, kept in a SQLite file."""
+
+    def __init__(self, directory, path=None):
+        self.directory = directory
+        self.path = path or os.path.join(directory, MANIFEST_NAME)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+
+    def _get_meta(self, name):
+        row = self.db.execute(
+            'SELECT value FROM meta WHERE name = ?', (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    @property
+    def synced_until(self):
+        """The end date of the last completed sync, or None."""
+        return self._get_meta('synced_until')
+
+    def mark_synced(self, synced_until):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)',
+                ('synced_until', synced_until),
+            )
+
+    def get(self, call_id):
+        row = self.db.execute(
+            'SELECT filename, size, sha256 FROM recordings '
+            'WHERE call_id = ?',
+            (call_id,),
+        ).fetchone()
+        return dict(zip(('filename', 'size', 'sha256'), row)) if row else None
+
+    def is_downloaded(self, call_id, verify=False):
+        """
+        Whether the recording of `call_id` is in the folder with the size it
+        was downloaded with, and with its checksum too if `verify` is set.
+        """
+        entry = self.get(call_id)
+        if not entry:
+            return False
+        path = os.path.join(self.directory, entry['filename'])
+        try:
+            if os.path.getsize(path) != entry['size']:
+                return False
+        except OSError:
+            return False
+        return not verify or file_checksum(path) == entry['sha256']
+
+    def record(self, call_id, filename, size, checksum):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO recordings '
+                '(call_id, filename, size, sha256) VALUES (?, ?, ?, ?)',
+                (call_id, filename, size, checksum),
+            )
+
+    def close(self):
+        self.db.close()
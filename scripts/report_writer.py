@@ -0,0 +1,83 @@
+"""
+Helpers for writing large CSV reports without holding every row in memory.
+
+`write_csv` writes rows as they're produced. Rows that have to be sorted
+before they're written go through an `ExternalSort`, which keeps at most
+`max_rows` rows in memory: once that many have been added they're sorted and
+spilled to a temporary file as a run, and iterating merges all the runs back
+in order.
+
+    rows = ExternalSort(key=itemgetter('Lead ID', 'Email Address'))
+    for row in produce_rows():
+        rows.add(row)
+    write_csv('Email Duplicates.csv', ['Email Address', 'Lead ID'], rows)
+"""
+import csv
+import heapq
+import pickle
+import tempfile
+
+# Rows an ExternalSort keeps in memory before spilling a sorted run to disk.
+DEFAULT_MAX_ROWS = 100000
+
+
+def write_csv(path, fieldnames, rows):
+    """Write `rows` (dicts) to a CSV at `path` as they're iterated over."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+class ExternalSort:
+    """Sorts any number of rows by `key` with bounded memory."""
+
+    def __init__(self, key, max_rows=DEFAULT_MAX_ROWS, reverse=False):
+        self.key = key
+        self.max_rows = max_rows
+        self.reverse = reverse
+        self.rows = []
+        self.runs = []
+
+    def __len__(self):
+        return len(self.rows) + sum(size for _, size in self.runs)
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.max_rows:
+            self._spill()
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def _spill(self):
+        self.rows.sort(key=self.key, reverse=self.reverse)
+        run = tempfile.TemporaryFile()
+        for row in self.rows:
+            pickle.dump(row, run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self.runs.append((run, len(self.rows)))
+        self.rows = []
+
+    @staticmethod
+    def _read_run(run, size):
+        for _ in range(size):
+            yield pickle.load(run)
+        run.close()
+
+    def __iter__(self):
+        """
+        Yield every added row in sorted order, keeping the order rows were
+        added in among equal keys. Rows are consumed, so a sort can only be
+        iterated over once.
+        """
+        self.rows.sort(key=self.key, reverse=self.reverse)
+        runs = [self._read_run(run, size) for run, size in self.runs]
+        rows, self.rows, self.runs = self.rows, [], []
+        if not runs:
+            return iter(rows)
+        return heapq.merge(
+            *runs, iter(rows), key=self.key, reverse=self.reverse
+        )
+
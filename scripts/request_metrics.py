@@ -0,0 +1,234 @@
+"""
+Sinks for the per-request hooks of CloseApiWrapper.
+
+Every call made through the wrapper is reported to its hooks as a
+`RequestInfo`. The sinks here turn that stream into a JSON lines log, a
+Prometheus text file (for node_exporter's textfile collector) or an
+end-of-run summary of the slowest endpoints.
+
+Scripts opt in with:
+
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    api = CloseApiWrapper(args.api_key)
+    setup_request_metrics(api, args)
+"""
+import atexit
+import json
+import os
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+RequestInfo = namedtuple(
+    'RequestInfo',
+    [
+        'method',
+        'endpoint',
+        'params',
+        'status',  # None if the request never got a response
+        'latency',  # seconds, including time spent on retries
+        'bytes',  # size of the final response body
+        'retries',
+    ],
+)
+
+# Object ids (`lead_abc123...`) are collapsed so metrics aggregate per route.
+OBJECT_ID_RE = re.compile(r'^[a-z]{2,5}_(?=[A-Za-z0-9]*[A-Z0-9])[A-Za-z0-9]{10,}$')
+
+
+def endpoint_route(endpoint):
+    """`lead/lead_4XQ...` -> `lead/{id}`"""
+    return '/'.join(
+        '{id}' if OBJECT_ID_RE.match(part) else part
+        for part in endpoint.strip('/').split('/')
+    )
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.bytes = 0
+        self.statuses = defaultdict(int)
+
+    def add(self, info):
+        self.count += 1
+        self.errors += info.status is None or info.status >= 400
+        self.retries += info.retries
+        self.total_latency += info.latency
+        self.max_latency = max(self.max_latency, info.latency)
+        self.bytes += info.bytes
+        self.statuses[info.status] += 1
+
+
+class _AggregatingSink:
+    def __init__(self):
+        self.stats = defaultdict(_EndpointStats)
+        self._lock = threading.Lock()
+
+    def __call__(self, info):
+        with self._lock:
+            self.stats[(info.method.upper(), endpoint_route(info.endpoint))].add(
+                info
+            )
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    """Append one JSON object per request to `path`."""
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, info):
+        line = json.dumps(dict(info._asdict(), route=endpoint_route(info.endpoint)))
+        with self._lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class PrometheusTextFileSink(_AggregatingSink):
+    """
+    Aggregate requests per route and write them in the Prometheus text
+    exposition format. The file is rewritten atomically every
+    `write_every` requests and when the sink is closed.
+    """
+
+    def __init__(self, path, write_every=100):
+        super().__init__()
+        self.path = path
+        self.write_every = write_every
+        self._seen = 0
+
+    def __call__(self, info):
+        super().__call__(info)
+        self._seen += 1
+        if self._seen % self.write_every == 0:
+            self.write()
+
+    def write(self):
+        lines = [
+            '# HELP close_api_requests_total Requests sent to the Close API.',
+            '# TYPE close_api_requests_total counter',
+        ]
+        with self._lock:
+            stats = sorted(self.stats.items())
+            for (method, route), s in stats:
+                for status, count in sorted(
+                    s.statuses.items(), key=lambda item: str(item[0])
+                ):
+                    lines.append(
+                        f'close_api_requests_total{{method="{method}",route="{route}",status="{status or "error"}"}} {count}'
+                    )
+            # (name, type, help, [(sample suffix, stats attribute)])
+            for name, metric_type, help_text, samples in (
+                (
+                    'request_seconds',
+                    'summary',
+                    'Request latency.',
+                    [('_sum', 'total_latency'), ('_count', 'count')],
+                ),
+                (
+                    'request_seconds_max',
+                    'gauge',
+                    'Slowest request.',
+                    [('', 'max_latency')],
+                ),
+                (
+                    'response_bytes_total',
+                    'counter',
+                    'Response body bytes received.',
+                    [('', 'bytes')],
+                ),
+                (
+                    'retries_total',
+                    'counter',
+                    'Retried attempts.',
+                    [('', 'retries')],
+                ),
+            ):
+                lines.append(f'# HELP close_api_{name} {help_text}')
+                lines.append(f'# TYPE close_api_{name} {metric_type}')
+                for (method, route), s in stats:
+                    for suffix, value in samples:
+                        lines.append(
+                            f'close_api_{name}{suffix}{{method="{method}",route="{route}"}} {getattr(s, value)}'
+                        )
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self.write()
+
+
+class SummarySink(_AggregatingSink):
+    """Print the routes that took the most total time once the run ends."""
+
+    def __init__(self, top=10):
+        super().__init__()
+        self.top = top
+
+    def close(self):
+        with self._lock:
+            stats = sorted(
+                self.stats.items(),
+                key=lambda item: item[1].total_latency,
+                reverse=True,
+            )
+        if not stats:
+            return
+
+        print(f'\nSlowest Close API endpoints (top {self.top} by total time):')
+        print(
+            f'{"route":<40} {"calls":>7} {"total s":>9} {"avg ms":>8} {"max ms":>8} {"retries":>7} {"errors":>6}'
+        )
+        for (method, route), s in stats[: self.top]:
+            print(
+                f'{method + " " + route:<40} {s.count:>7} {s.total_latency:>9.1f} '
+                f'{s.total_latency / s.count * 1000:>8.0f} {s.max_latency * 1000:>8.0f} '
+                f'{s.retries:>7} {s.errors:>6}'
+            )
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument(
+        '--metrics-jsonl',
+        help='Append a JSON line per API request to this file',
+    )
+    parser.add_argument(
+        '--metrics-prom',
+        help='Write Prometheus text format request metrics to this file',
+    )
+    parser.add_argument(
+        '--metrics-summary',
+        action='store_true',
+        help='Print the slowest API endpoints when the script finishes',
+    )
+
+
+def setup_request_metrics(api, args):
+    """Attach the sinks requested on the command line and close them at exit."""
+    sinks = []
+    if args.metrics_jsonl:
+        sinks.append(JsonLinesSink(args.metrics_jsonl))
+    if args.metrics_prom:
+        sinks.append(PrometheusTextFileSink(args.metrics_prom))
+    if args.metrics_summary:
+        sinks.append(SummarySink())
+
+    for sink in sinks:
+        api.add_request_hook(sink)
+        atexit.register(sink.close)
+    return sinks
@@ -3,9 +3,11 @@ import argparse
 import gevent.monkey
 
 gevent.monkey.patch_all()
-from closeio_api import APIError, Client as CloseIO_API
+from closeio_api import APIError
 from gevent.pool import Pool
 
+from scripts.CloseApiWrapper import CloseApiWrapper
+
 parser = argparse.ArgumentParser(
     description='Restore an array of deleted leads by ID. This CANNOT restore status changes or call recordings.'
 )
@@ -19,7 +21,7 @@ group.add_argument(
     help='List of lead IDs in a form of a textual file with single column of lead IDs',
 )
 args = parser.parse_args()
-api = CloseIO_API(args.api_key)
+api = CloseApiWrapper(args.api_key)
 
 # Array of Lead IDs. Add the IDs you want to restore here.
 if args.leads:
@@ -31,11 +33,7 @@ elif args.leads_file:
     lead_ids = list(filter(None, lead_ids))  # Strip empty lines
 
 # Create a list of active users for the sake of posting opps.
-org_id = api.get('me')['organizations'][0]['id']
-memberships = api.get(
-    'organization/' + org_id, params={'_fields': 'memberships'}
-)['memberships']
-active_users = [i['user_id'] for i in memberships]
+active_users = [i['user_id'] for i in api.get_memberships()]
 
 # Array to keep track of number of leads restored. Because we use gevent, we can't have a standard counter variable.
 total_leads_restored = []
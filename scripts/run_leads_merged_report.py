@@ -2,9 +2,11 @@ import argparse
 import csv
 
 import gevent.monkey
-from closeio_api import APIError, Client as CloseIO_API
+from closeio_api import APIError
 from gevent.pool import Pool
 
+from scripts.CloseApiWrapper import CloseApiWrapper
+
 gevent.monkey.patch_all()
 
 parser = argparse.ArgumentParser(
@@ -14,9 +16,9 @@ parser.add_argument('--api-key', '-k', required=True, help='API Key')
 args = parser.parse_args()
 
 # Initialize the Close API and get all users in the org
-api = CloseIO_API(args.api_key)
+api = CloseApiWrapper(args.api_key)
 
-org_id = api.get('me')['organizations'][0]['id']
+org_id = api.get_me()['organizations'][0]['id']
 org = api.get(
     f'organization/{org_id}',
     params={'_fields': 'inactive_memberships,memberships,name'},
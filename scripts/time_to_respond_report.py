@@ -3,9 +3,14 @@ import csv
 import time
 from datetime import datetime, timedelta
 
-from closeio_api import Client as CloseIO_API
 from dateutil import tz
 
+from scripts.CloseApiWrapper import CloseApiWrapper
+from scripts.request_metrics import (
+    add_metrics_arguments,
+    setup_request_metrics,
+)
+
 parser = argparse.ArgumentParser(
     description='Get Time To Respond Metrics From Org'
 )
@@ -29,14 +34,16 @@ parser.add_argument(
     action='store_true',
     help='Get stats per individual user',
 )
+add_metrics_arguments(parser)
 
 args = parser.parse_args()
 
-api = CloseIO_API(args.api_key)
+api = CloseApiWrapper(args.api_key)
+setup_request_metrics(api, args)
 
-org_id = api.get('me')['organizations'][0]['id']
-org_name = api.get('organization/' + org_id)['name']
-org_memberships = api.get('organization/' + org_id)['memberships']
+organization = api.get_organization()
+org_name = organization['name']
+org_memberships = organization['memberships']
 
 assert (
     args.org_count or args.user_counts
@@ -128,7 +135,6 @@ def getTTR(user):
                     activity['date_created'].split('+')[0].split('.')[0]
                 )
                 activities.append(activity)
-        print(offset)
         offset += len(resp['data'])
         has_more = resp['has_more']
     if user == None:
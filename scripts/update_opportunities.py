@@ -1,7 +1,8 @@
 import argparse
 import sys
 
-from closeio_api import Client as CloseIO_API
+from scripts.CloseApiWrapper import CloseApiWrapper
+from scripts.lead_snapshot import LeadSnapshot
 
 parser = argparse.ArgumentParser(
     description="Change all the opportunities for a given leads' search query to a given status."
@@ -11,10 +12,14 @@ parser.add_argument('--query', type=str, required=True, help='Search query.')
 parser.add_argument(
     '--status', type=str, required=True, help='Label of the new status'
 )
+parser.add_argument(
+    '--snapshot',
+    help="SQLite file with a local copy of your leads, shared by the lead-scanning scripts. Only leads changed since it was last refreshed are downloaded",
+)
 args = parser.parse_args()
 
 # Should tell you how many leads are going to be affected
-api = CloseIO_API(args.api_key)
+api = CloseApiWrapper(args.api_key)
 
 # Get the status_id
 org_id = api.get('api_key')['data'][0]['organization_id']
@@ -30,20 +35,19 @@ new_status_id = new_status_id[0]
 
 print(f'Gathering opportunities for {args.query}')
 
-has_more = True
-offset = 0
-limit = 50
 opp_ids = []
 
-while has_more:
-    resp = api.get(
-        'lead', params={'_skip': offset, '_limit': limit, 'query': args.query}
+if args.snapshot:
+    leads = LeadSnapshot(args.snapshot, api).iter_leads(
+        args.query, fields=['opportunities']
     )
-    opp_ids.extend(
-        [opp['id'] for lead in resp['data'] for opp in lead['opportunities']]
+else:
+    leads = api.iter_leads_by_cursor(
+        args.query, fields=['id', 'opportunities'], page_size=50
     )
-    has_more = resp['has_more']
-    offset += limit
+
+for lead in leads:
+    opp_ids.extend([opp['id'] for opp in lead['opportunities']])
 
 ans = input(
     '{0} opportunities found. Do you want to update all of them to {1}? (y/n): '.format(
@@ -0,0 +1,86 @@
+import pytest
+
+from benchmarks.fake_close_api import (
+    MAX_LIMIT,
+    FakeCloseApi,
+    FakeCloseApiServer,
+    SyntheticOrg,
+)
+from scripts import CloseApiWrapper as close_api_wrapper
+from scripts.CloseApiWrapper import BASE_URL_ENV_VAR, CloseApiWrapper
+
+NUM_LEADS = 300
+
+# More leads share each timestamp than fit on a page
+LEADS_PER_TIMESTAMP = 50
+PAGE_SIZE = 20
+
+# Too small for a page plus the leads seen at a timestamp, so the cursor has to
+# skip over some of them
+SMALL_MAX_LIMIT = 30
+
+MIGRATION_QUERY = '"custom.Source CRM":* not "custom.Migration completed":*'
+
+
+@pytest.fixture(params=[MAX_LIMIT, SMALL_MAX_LIMIT])
+def api(request, monkeypatch):
+    monkeypatch.setattr(close_api_wrapper, 'MAX_PAGE_SIZE', request.param)
+    org = SyntheticOrg(
+        num_leads=NUM_LEADS, leads_per_timestamp=LEADS_PER_TIMESTAMP
+    )
+    fake = FakeCloseApi(org, max_limit=request.param)
+    with FakeCloseApiServer(fake) as server:
+        monkeypatch.setenv(BASE_URL_ENV_VAR, server.base_url)
+        yield CloseApiWrapper('fake')
+
+
+def test_cursor_returns_every_lead_once(api):
+    lead_ids = [
+        lead['id']
+        for lead in api.iter_leads_by_cursor(
+            fields=['id'], page_size=PAGE_SIZE
+        )
+    ]
+    assert len(lead_ids) == NUM_LEADS
+    assert len(set(lead_ids)) == NUM_LEADS
+
+
+def test_cursor_survives_leads_dropping_out_of_the_query(api):
+    lead_ids = []
+    for lead in api.iter_leads_by_cursor(
+        MIGRATION_QUERY, fields=['id'], page_size=PAGE_SIZE
+    ):
+        lead_ids.append(lead['id'])
+        api.put(
+            f'lead/{lead["id"]}',
+            data={'custom.Migration completed': 'Yes'},
+        )
+    assert sorted(lead_ids) == [f'lead_{i:010d}' for i in range(NUM_LEADS)]
+
+
+def test_cursor_survives_some_leads_dropping_out_of_the_query(api):
+    lead_ids = []
+    for lead in api.iter_leads_by_cursor(
+        MIGRATION_QUERY, fields=['id'], page_size=PAGE_SIZE
+    ):
+        lead_ids.append(lead['id'])
+        if len(lead_ids) % 2:
+            api.put(
+                f'lead/{lead["id"]}',
+                data={'custom.Migration completed': 'Yes'},
+            )
+    assert sorted(lead_ids) == [f'lead_{i:010d}' for i in range(NUM_LEADS)]
+
+
+def test_cursor_resumes_mid_timestamp(api):
+    pages = api.iter_lead_pages_by_cursor(fields=['id'], page_size=PAGE_SIZE)
+    first_leads, cursor = next(pages)
+    pages.close()
+
+    rest = api.iter_lead_pages_by_cursor(
+        fields=['id'], page_size=PAGE_SIZE, cursor=cursor
+    )
+    lead_ids = [lead['id'] for lead in first_leads] + [
+        lead['id'] for leads, _ in rest for lead in leads
+    ]
+    assert sorted(lead_ids) == [f'lead_{i:010d}' for i in range(NUM_LEADS)]